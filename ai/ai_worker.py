@@ -2,15 +2,21 @@
 import os
 import json
 import asyncio
+import random
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from logging.config import dictConfig
 
 from dotenv import load_dotenv
 load_dotenv()
 
 import redis.asyncio as redis
-from talk_to_db import talk_to_db
+from talk_to_db import talk_to_db, answer_heavy, DeadlineExceeded, StageFailed, CircuitOpen, HeavyQuery
+from talk_to_db.deadline import check_deadline
+from scheduler import FairScheduler, Job
+import metrics
+import result_cache
 
 # =========================
 # Logging configuration
@@ -82,96 +88,504 @@ logger = logging.getLogger("ai_worker")
 REDIS_URL = os.getenv("REDIS_URL")
 CHAT_STREAM_KEY = os.getenv("CHAT_STREAM_KEY")
 RESPONSE_STREAM_KEY = os.getenv("RESPONSE_STREAM_KEY")
-# Consume only new messages by default
+# Where the first ever start begins (only new messages by default); after that
+# the worker resumes from the cursor saved under CURSOR_KEY
 DEFAULT_LAST_ID = os.getenv("STREAM_LAST_ID", "$")
+CURSOR_KEY = os.getenv("AI_CURSOR_KEY", "ai_worker:cursor")
+# Entries older than this when read mean the worker is behind: serve newest deadlines first
+CATCH_UP_LAG_SEC = float(os.getenv("AI_CATCH_UP_LAG_SEC", "30"))
+
+# Questions processed at the same time (talk_to_db runs in a thread each)
+MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "4"))
+# Entries fetched per XREAD, and how many may wait in the scheduler before reading pauses
+READ_BATCH = int(os.getenv("AI_READ_BATCH", "50"))
+MAX_PENDING = int(os.getenv("AI_MAX_PENDING", "500"))
+
+# Failed questions are retried with exponential backoff, then moved to the dead-letter stream
+MAX_ATTEMPTS = int(os.getenv("AI_MAX_ATTEMPTS", "3"))
+RETRY_BASE_SEC = float(os.getenv("AI_RETRY_BASE_SEC", "2"))
+RETRY_MAX_SEC = float(os.getenv("AI_RETRY_MAX_SEC", "30"))
+ATTEMPTS_KEY = os.getenv("AI_ATTEMPTS_KEY", "ai_worker:attempts")
+DEAD_LETTER_STREAM_KEY = os.getenv("DEAD_LETTER_STREAM_KEY", "dead_letter_stream")
+DEAD_LETTER_MAXLEN = int(os.getenv("DEAD_LETTER_MAXLEN", "10000"))
+
+# Questions whose SQL EXPLAIN prices above AI_HEAVY_QUERY_COST move to their own stream
+# and lane (own threads, HEAVY_MAX_CONCURRENCY at a time) so they neither hold up
+# interactive questions nor time out the waiting consumer. Progress and the answer are
+# published on JOB_EVENTS_STREAM_KEY, which the backend relays to the chat
+HEAVY_STREAM_KEY = os.getenv("AI_HEAVY_STREAM_KEY", "ai_heavy_jobs")
+HEAVY_CURSOR_KEY = os.getenv("AI_HEAVY_CURSOR_KEY", "ai_worker:heavy_cursor")
+HEAVY_MAX_CONCURRENCY = int(os.getenv("AI_HEAVY_MAX_CONCURRENCY", "1"))
+JOB_EVENTS_STREAM_KEY = os.getenv("JOB_EVENTS_STREAM_KEY", "ai_job_events")
+JOB_EVENTS_MAXLEN = int(os.getenv("JOB_EVENTS_MAXLEN", "10000"))
 
 # Optional: heartbeat for idle loops (seconds). "0" disables.
 HEARTBEAT_SEC = int(os.getenv("LOG_HEARTBEAT_SEC", "60"))
 _last_heartbeat = 0.0
 
 
+def _entry_before(entry_id: str) -> str:
+    """The largest stream ID smaller than entry_id (XREAD is exclusive of the ID it gets)."""
+    ms, seq = (int(part) for part in entry_id.split("-"))
+    if seq:
+        return f"{ms}-{seq - 1}"
+    return f"{ms - 1}-18446744073709551615"
+
+
+def _entry_time(entry_id: str) -> float:
+    """When the entry was added, in epoch seconds."""
+    return int(entry_id.split("-")[0]) / 1000
+
+
+def _entry_age(entry_id: str) -> float:
+    return time.time() - _entry_time(entry_id)
+
+
+class StreamCursor:
+    """
+    Position in a stream (CHAT_STREAM_KEY, or HEAVY_STREAM_KEY) below which every
+    entry is finished. Jobs finish out of order, so it trails the oldest
+    unfinished entry; a restart resumes there and only repeats work that had
+    not completed.
+    """
+
+    def __init__(self, last_id: str, key: str = CURSOR_KEY):
+        self.last_read = last_id
+        self.key = key
+        self._open = {}  # entry_id -> None, in stream order
+
+    def opened(self, entry_id: str):
+        self._open[entry_id] = None
+        self.last_read = entry_id
+
+    def closed(self, entry_id: str):
+        self._open.pop(entry_id, None)
+
+    def position(self) -> str:
+        if self._open:
+            return _entry_before(next(iter(self._open)))
+        return self.last_read
+
+    async def save(self, r):
+        position = self.position()
+        if position == "$":
+            return
+        try:
+            await r.set(self.key, position)
+        except Exception as e:
+            logger.warning(f"Cursor save failed: {e}")
+
+
+async def handle_job(r, job: Job):
+    fields = job.fields
+
+    # Extract fields (keep logs safe/minimal)
+    user_id = fields.get("user_id")
+    user_role = fields.get("user_role", "public")
+    message_role = fields.get("message_role")  # usually 'user'
+    chat_id = fields.get("chat_id")
+    content = fields.get("content", "")
+    is_first = fields.get("is_first_message", "0") in ("1", "true", "True")
+    message_id = fields.get("message_id")
+    replayed = is_replayed(fields)
+
+    logger.info("Received message")
+
+    # Validate minimal inputs
+    if not content or not chat_id or not user_id or not message_id:
+        logger.warning("Skipping invalid message: missing required fields")
+        return
+
+    # Nothing expensive has happened yet; don't start if nobody is waiting anymore
+    check_deadline(job.deadline, "dispatch")
+
+    # Process
+    t0 = time.perf_counter()
+    content_preview = content[:80].replace("\n", " ")
+    logger.debug(f"Processing question (preview='{content_preview}', len={len(content)})")
+
+    # talk_to_db is blocking (LLM + SQL); run it off the event loop so other users' jobs proceed
+    final_text = await asyncio.to_thread(
+        talk_to_db,
+        question=content,
+        user_id=str(user_id),
+        user_role=str(user_role),
+        chat_id=str(chat_id),
+        is_first_message=is_first,
+        deadline=job.deadline,
+        # A replayed question is already in the history from its first run
+        record_history=job.attempts == 0 and not replayed,
+        defer_heavy=True
+    )
+    dt = time.perf_counter() - t0
+    metadata = await build_metadata(r, final_text, dt, message_id, user_id, chat_id)
+
+    answer = {
+        "content": final_text,
+        "ai_response_metadata": json.dumps(metadata, ensure_ascii=False),
+        "ai_references": json.dumps([], ensure_ascii=False),
+        "tokens_used": "0",
+        "response_time": f"{dt:.3f}",
+    }
+    if replayed:
+        await emit_event(r, "done", fields, **answer)
+    else:
+        # Publish response
+        await r.xadd(RESPONSE_STREAM_KEY, {
+            "chat_id": str(chat_id),
+            "user_id": str(user_id),
+            "message_id": str(message_id),  # to match on the consumer side
+            **answer,
+        })
+
+    await metrics.incr(r, "published")
+    logger.info("Published response")
+
+
+async def build_metadata(r, final_text, dt: float, message_id, user_id, chat_id) -> dict:
+    """ai_response_metadata for an answer; also caches its rows for paging."""
+    metadata = {
+        "model": "gpt-5-mini",
+        "processing_time": f"{dt:.3f}s",
+        "suggested_title": (final_text or "")[:40],
+    }
+    if getattr(final_text, "stale", False):
+        # Served from the answer cache while OpenAI or the database is down
+        metadata["stale"] = True
+        metadata["cached_at"] = final_text.cached_at
+
+    if getattr(final_text, "sql", None):
+        # The backend re-runs it for exports of the full data
+        metadata["sql"] = final_text.sql
+
+    rows = getattr(final_text, "rows", None)
+    if rows:
+        # Kept for paging ("show more"); the narration only covers a sample
+        chunks = await asyncio.to_thread(result_cache.encode_chunks, rows[:result_cache.RESULT_MAX_ROWS])
+        await result_cache.store(r, message_id, user_id, chat_id, final_text.columns, chunks, len(rows))
+        metadata["result"] = {
+            "total": min(len(rows), result_cache.RESULT_MAX_ROWS),
+            "truncated": len(rows) > result_cache.RESULT_MAX_ROWS,
+            "columns": list(final_text.columns),
+        }
+    return metadata
+
+
+def is_replayed(fields) -> bool:
+    """
+    Put back from the dead-letter stream by an admin. The consumer that asked
+    stopped waiting when it was dead-lettered, so the outcome goes out as a job
+    event, which the backend saves and relays to the chat like a heavy job's.
+    """
+    return fields.get("replayed") == "1"
+
+
+async def emit_event(r, event: str, fields, **extra):
+    """Publish a heavy job's progress or outcome for the backend to relay to the chat."""
+    await r.xadd(JOB_EVENTS_STREAM_KEY, {
+        "event": event,
+        "message_id": str(fields.get("message_id", "")),
+        "chat_id": str(fields.get("chat_id", "")),
+        "user_id": str(fields.get("user_id", "")),
+        **extra,
+    }, maxlen=JOB_EVENTS_MAXLEN, approximate=True)
+
+
+async def defer(r, job: Job, heavy: HeavyQuery):
+    """Hand an expensive query to the heavy lane and release the waiting consumer."""
+    fields = job.fields
+    await r.xadd(HEAVY_STREAM_KEY, {
+        **fields,
+        "sql": heavy.query,
+        "question": heavy.question,
+        "cost": f"{heavy.cost:.0f}",
+    })
+    if is_replayed(fields):
+        await emit_event(r, "running", fields, stage="queued")
+    else:
+        await r.xadd(RESPONSE_STREAM_KEY, {
+            "type": "deferred",
+            "chat_id": str(fields.get("chat_id", "")),
+            "user_id": str(fields.get("user_id", "")),
+            "message_id": str(fields.get("message_id", "")),
+        })
+    await metrics.incr(r, "deferred")
+    logger.info(f"Deferred heavy query to {HEAVY_STREAM_KEY} (cost={heavy.cost:.0f})")
+
+
+async def handle_heavy(r, entry_id: str, fields, pool: ThreadPoolExecutor):
+    user_id = fields.get("user_id")
+    chat_id = fields.get("chat_id")
+    message_id = fields.get("message_id")
+    loop = asyncio.get_running_loop()
+
+    def progress(stage: str):
+        # Called from the job's thread
+        asyncio.run_coroutine_threadsafe(emit_event(r, "progress", fields, stage=stage), loop)
+
+    t0 = time.perf_counter()
+    final_text = await loop.run_in_executor(pool, lambda: answer_heavy(
+        fields.get("question") or fields.get("content", ""),
+        fields["sql"],
+        str(user_id),
+        str(chat_id),
+        progress,
+        fields.get("user_role", "public"),
+        _entry_time(entry_id),
+    ))
+    dt = time.perf_counter() - t0
+    metadata = await build_metadata(r, final_text, dt, message_id, user_id, chat_id)
+
+    await emit_event(
+        r, "done", fields,
+        content=final_text,
+        ai_response_metadata=json.dumps(metadata, ensure_ascii=False),
+        ai_references=json.dumps([], ensure_ascii=False),
+        tokens_used="0",
+        response_time=f"{dt:.3f}",
+    )
+    await metrics.incr(r, "heavy:published")
+    logger.info(f"Published heavy job result ({dt:.1f}s)")
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with full jitter: up to RETRY_BASE_SEC * 2^(attempts-1), capped."""
+    return random.uniform(0, min(RETRY_MAX_SEC, RETRY_BASE_SEC * 2 ** (attempts - 1)))
+
+
+async def count_attempt(r, job: Job) -> int:
+    """Record one more failed run; the count lives in Redis so it survives worker restarts."""
+    job.attempts = await r.hincrby(ATTEMPTS_KEY, job.entry_id, 1)
+    return job.attempts
+
+
+async def forget_attempts(r, job: Job):
+    if job.attempts:
+        await r.hdel(ATTEMPTS_KEY, job.entry_id)
+
+
+async def dead_letter(r, job: Job, stage: str, error: str, code: str = "ai_failed", notify: bool = True):
+    """Park the question with its error for admins, and tell the waiting consumer right away."""
+    fields = job.fields
+    await r.xadd(DEAD_LETTER_STREAM_KEY, {
+        **fields,
+        "dlq_entry_id": job.entry_id,
+        "dlq_stage": stage,
+        "dlq_error": error[:2000],
+        "dlq_attempts": str(job.attempts),
+        "dlq_failed_at": f"{time.time():.3f}",
+    }, maxlen=DEAD_LETTER_MAXLEN, approximate=True)
+
+    if notify and fields.get("message_id") and is_replayed(fields):
+        await emit_event(r, "failed", fields, code=code, stage=stage)
+    elif notify and fields.get("message_id"):
+        await r.xadd(RESPONSE_STREAM_KEY, {
+            "type": "error",
+            "code": code,
+            "stage": stage,
+            "chat_id": str(fields.get("chat_id", "")),
+            "user_id": str(fields.get("user_id", "")),
+            "message_id": str(fields["message_id"]),
+        })
+    await metrics.incr(r, "dead_lettered", f"dead_lettered:{stage}")
+
+
+async def read_stream(r, scheduler: FairScheduler, cursor: StreamCursor, wakeup: asyncio.Event):
+    """Move stream entries into the scheduler; pauses while MAX_PENDING jobs are waiting."""
+    global _last_heartbeat
+    last_id = cursor.last_read
+
+    while True:
+        if len(scheduler) >= MAX_PENDING:
+            await asyncio.sleep(0.1)
+            continue
+        try:
+            resp = await r.xread({CHAT_STREAM_KEY: last_id}, count=READ_BATCH, block=15000)
+        except Exception:
+            logger.exception("Stream read error")
+            await asyncio.sleep(1)
+            continue
+
+        # Heartbeat when idle
+        now = time.time()
+        if not resp:
+            if HEARTBEAT_SEC > 0 and (now - _last_heartbeat) >= HEARTBEAT_SEC:
+                logger.info(f"Idle heartbeat: no messages (pending={len(scheduler)})")
+                _last_heartbeat = now
+            continue
+
+        _, messages = resp[0]
+        for entry_id, fields in messages:
+            last_id = entry_id  # advance cursor
+            cursor.opened(entry_id)
+            scheduler.push(Job(entry_id, fields))
+        await metrics.incr(r, "received", amount=len(messages))
+
+        catching_up = _entry_age(last_id) > CATCH_UP_LAG_SEC
+        if catching_up != scheduler.newest_first:
+            scheduler.newest_first = catching_up
+            logger.info(f"Catch-up mode {'on' if catching_up else 'off'} (pending={len(scheduler)})")
+        wakeup.set()
+
+
+async def run_heavy_lane(r):
+    """
+    Work through HEAVY_STREAM_KEY, HEAVY_MAX_CONCURRENCY jobs at a time on
+    threads of its own. Heavy jobs are not retried: a failure is dead-lettered
+    and reported on the job events stream.
+    """
+    while True:
+        try:
+            cursor = StreamCursor(await r.get(HEAVY_CURSOR_KEY) or "0-0", HEAVY_CURSOR_KEY)
+            break
+        except Exception:
+            logger.exception("Heavy cursor read error")
+            await asyncio.sleep(1)
+    pool = ThreadPoolExecutor(max_workers=HEAVY_MAX_CONCURRENCY, thread_name_prefix="heavy")
+    slots = asyncio.Semaphore(HEAVY_MAX_CONCURRENCY)
+    running = set()
+    last_id = cursor.last_read
+
+    async def run(entry_id: str, fields):
+        try:
+            await handle_heavy(r, entry_id, fields, pool)
+        except Exception as e:
+            error = e.error if isinstance(e, StageFailed) else e
+            stage = e.stage if isinstance(e, StageFailed) else "worker"
+            code = "ai_unavailable" if isinstance(error, CircuitOpen) else "ai_failed"
+            logger.error(f"Heavy job failed at {stage}, dead-lettered: {type(error).__name__}: {error}")
+            try:
+                await dead_letter(r, Job(entry_id, fields), stage, f"{type(error).__name__}: {error}", code, notify=False)
+                await emit_event(r, "failed", fields, stage=stage, code=code)
+            except Exception:
+                logger.exception("Heavy job failure report error")
+        finally:
+            slots.release()
+            cursor.closed(entry_id)
+            await cursor.save(r)
+            try:
+                # The cursor is past it; nothing reads a finished heavy job again
+                await r.xdel(HEAVY_STREAM_KEY, entry_id)
+            except Exception as e:
+                logger.warning(f"Heavy entry delete failed: {e}")
+
+    while True:
+        await slots.acquire()
+        try:
+            resp = await r.xread({HEAVY_STREAM_KEY: last_id}, count=1, block=15000)
+        except Exception:
+            slots.release()
+            logger.exception("Heavy stream read error")
+            await asyncio.sleep(1)
+            continue
+        if not resp:
+            slots.release()
+            continue
+
+        entry_id, fields = resp[0][1][0]
+        try:
+            await emit_event(r, "running", fields)
+        except Exception:
+            # Not taken yet: read again once Redis is back
+            slots.release()
+            logger.exception("Heavy job event error")
+            await asyncio.sleep(1)
+            continue
+        last_id = entry_id
+        cursor.opened(entry_id)
+        task = asyncio.create_task(run(entry_id, fields))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+
 async def main():
     # Connect to Redis (avoid logging secrets)
     r = redis.from_url(REDIS_URL, decode_responses=True)
 
-    last_id = DEFAULT_LAST_ID
+    scheduler = FairScheduler()
+    wakeup = asyncio.Event()
+    running = set()
+    cursor = StreamCursor(await r.get(CURSOR_KEY) or DEFAULT_LAST_ID)
+
     logger.info("Starting AI worker")
-    logger.info(f"Listening streams: {CHAT_STREAM_KEY} -> {RESPONSE_STREAM_KEY}; last_id={last_id}")
+    logger.info(f"Listening streams: {CHAT_STREAM_KEY} -> {RESPONSE_STREAM_KEY}; last_id={cursor.last_read}")
+    logger.info(f"Concurrency={MAX_CONCURRENCY}, per-user in-flight={scheduler.per_user_inflight}, "
+                f"role weights={scheduler.role_weights}")
+    logger.info(f"Heavy lane: {HEAVY_STREAM_KEY} -> {JOB_EVENTS_STREAM_KEY}; concurrency={HEAVY_MAX_CONCURRENCY}")
 
     global _last_heartbeat
     _last_heartbeat = time.time()
 
-    while True:
-        try:
-            resp = await r.xread({CHAT_STREAM_KEY: last_id}, count=1, block=15000)
-
-            # Heartbeat when idle
-            now = time.time()
-            if not resp:
-                if HEARTBEAT_SEC > 0 and (now - _last_heartbeat) >= HEARTBEAT_SEC:
-                    logger.info("Idle heartbeat: no messages")
-                    _last_heartbeat = now
-                continue
-
-            # Unpack message
-            stream_name, messages = resp[0]
-            entry_id, fields = messages[0]
-            last_id = entry_id  # advance cursor
+    def requeue(job: Job):
+        scheduler.push(job)
+        wakeup.set()
 
-            # Extract fields (keep logs safe/minimal)
-            user_id = fields.get("user_id")
-            user_role = fields.get("user_role", "public")
-            message_role = fields.get("message_role")  # usually 'user'
-            chat_id = fields.get("chat_id")
-            content = fields.get("content", "")
-            is_first = fields.get("is_first_message", "0") in ("1", "true", "True")
-            message_id = fields.get("message_id")
-
-            logger.info("Received message")
-
-            # Validate minimal inputs
-            if not content or not chat_id or not user_id or not message_id:
-                logger.warning("Skipping invalid message: missing required fields")
-                continue
-
-            # Process
-            t0 = time.perf_counter()
-            content_preview = content[:80].replace("\n", " ")
-            logger.debug(f"Processing question (preview='{content_preview}', len={len(content)})")
-
-            final_text = talk_to_db(
-                question=content,
-                user_id=str(user_id),
-                user_role=str(user_role),
-                chat_id=str(chat_id),
-                is_first_message=is_first
-            )
-            dt = time.perf_counter() - t0
-
-            # Prepare metadata
-            metadata = {
-                "model": "gpt-5-mini",
-                "processing_time": f"{dt:.3f}s",
-                "suggested_title": (final_text or "")[:40],
-            }
-
-            # Publish response
-            await r.xadd(RESPONSE_STREAM_KEY, {
-                "chat_id": str(chat_id),
-                "user_id": str(user_id),
-                "message_id": str(message_id),  # to match on the consumer side
-                "content": final_text,
-                "ai_response_metadata": json.dumps(metadata, ensure_ascii=False),
-                "ai_references": json.dumps([], ensure_ascii=False),
-                "tokens_used": "0",
-                "response_time": f"{dt:.3f}",
-            })
-
-            logger.info("Published response")
+    async def fail(job: Job, stage: str, error: str, retryable: bool = True):
+        attempts = await count_attempt(r, job)
+        await metrics.incr(r, "errors", f"errors:{stage}")
+        delay = retry_delay(attempts)
+        if retryable and attempts < MAX_ATTEMPTS and time.time() + delay < job.deadline:
+            logger.warning(f"Attempt {attempts}/{MAX_ATTEMPTS} failed at {stage}, retrying in {delay:.1f}s: {error}")
+            # The job keeps its cursor slot; the worker loop is not blocked meanwhile
+            asyncio.get_running_loop().call_later(delay, requeue, job)
+            return True
+        logger.error(f"Giving up after {attempts} attempt(s) at {stage}, dead-lettered: {error}")
+        await dead_letter(r, job, stage, error, "ai_failed" if retryable else "ai_unavailable")
+        return False
 
-        except Exception:
+    async def run(job: Job):
+        retrying = False
+        try:
+            await handle_job(r, job)
+        except HeavyQuery as e:
+            await defer(r, job, e)
+        except DeadlineExceeded as e:
+            logger.info(f"Dropped expired message before {e.stage} ({_entry_age(job.entry_id):.0f}s old)")
+            await metrics.incr(r, "expired", f"expired:{e.stage}")
+        except StageFailed as e:
+            # An open circuit means the dependency is down: fail fast, don't queue retries behind it
+            retryable = not isinstance(e.error, CircuitOpen)
+            retrying = await fail(job, e.stage, f"{type(e.error).__name__}: {e.error}", retryable)
+        except Exception as e:
             logger.exception("Worker error")
-            await asyncio.sleep(1)
+            retrying = await fail(job, "worker", f"{type(e).__name__}: {e}")
+        finally:
+            scheduler.done(job)
+            if not retrying:
+                await forget_attempts(r, job)
+                cursor.closed(job.entry_id)
+                await cursor.save(r)
+
+    def finished(task):
+        running.discard(task)
+        wakeup.set()
+
+    reader = asyncio.create_task(read_stream(r, scheduler, cursor, wakeup))
+    heavy = asyncio.create_task(run_heavy_lane(r))
+    for task in (reader, heavy):
+        task.add_done_callback(lambda _: wakeup.set())
+
+    while True:
+        await wakeup.wait()
+        wakeup.clear()
+        for task in (reader, heavy):
+            if task.done():
+                task.result()  # surface a crashed reader or heavy lane
+        expired = scheduler.expire(time.time())
+        if expired:
+            for job in expired:
+                cursor.closed(job.entry_id)
+                await forget_attempts(r, job)
+            logger.info(f"Dropped {len(expired)} expired messages from the queue")
+            await metrics.incr(r, "expired", "expired:queued", amount=len(expired))
+            await cursor.save(r)
+        while len(running) < MAX_CONCURRENCY:
+            job = scheduler.pop()
+            if job is None:
+                break
+            task = asyncio.create_task(run(job))
+            running.add(task)
+            task.add_done_callback(finished)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,24 @@
+# ai/metrics.py
+"""
+Worker counters, kept in a Redis hash so they survive restarts and every
+worker replica adds to the same numbers:
+
+    HGETALL ai_worker:metrics
+"""
+import logging
+import os
+
+logger = logging.getLogger("ai_worker")
+
+METRICS_KEY = os.getenv("AI_METRICS_KEY", "ai_worker:metrics")
+
+
+async def incr(r, *names: str, amount: int = 1):
+    """Add `amount` to each counter; failures are logged and never break the worker."""
+    try:
+        pipe = r.pipeline(transaction=False)
+        for name in names:
+            pipe.hincrby(METRICS_KEY, name, amount)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Metrics update failed: {e}")
@@ -1,73 +1,233 @@
 # redis_utils.py
+import hashlib
 import json
 import os
+import time
 import redis
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
 from datetime import datetime, timezone
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable
 
-# اتصال به Redis (از REDIS_URL در .env استفاده می‌کند)
-r = redis.Redis.from_url(
+HISTORY_LEN = 20
+
+# اتصال به Redis از طریق یک pool قابل پیکربندی (از REDIS_URL در .env استفاده می‌کند).
+# BlockingConnectionPool باعث می‌شود در صورت پر بودن pool، درخواست منتظر بماند نه اینکه خطا بدهد.
+pool = redis.BlockingConnectionPool.from_url(
     os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+    max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "20")),
+    timeout=float(os.getenv("REDIS_POOL_TIMEOUT", "2")),
+    socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "2")),
+    socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", "2")),
+    health_check_interval=int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30")),
     decode_responses=True,  # خروجی‌ها به صورت str یونیکد
 )
+r = redis.Redis(connection_pool=pool)
+
+# کلیدهای هر چت (last_twenty، latest_user_json، latest_ai_json) با TTL لغزنده نگه داشته می‌شوند
+# و با هر فعالیت تمدید می‌شوند تا چت‌های رهاشده خودبه‌خود از Redis پاک شوند.
+CHAT_KEY_TTL_SEC = int(os.getenv("CHAT_KEY_TTL_SEC", str(7 * 24 * 3600)))
+# سقف اندازهٔ محتوای هر آیتم (بایت UTF-8)؛ پاسخ‌های جدولی خیلی بلند کوتاه ذخیره می‌شوند.
+ENTRY_MAX_BYTES = int(os.getenv("REDIS_ENTRY_MAX_BYTES", "8192"))
+TRUNCATED_SUFFIX = "… [truncated]"
+
+# آخرین پاسخ موفق هر سؤال نرمال‌شده این مدت نگه داشته می‌شود تا هنگام قطعی OpenAI یا پایگاه داده
+# به‌عنوان پاسخ «کهنه» (stale) برگردانده شود.
+ANSWER_CACHE_TTL_SEC = int(os.getenv("ANSWER_CACHE_TTL_SEC", str(24 * 3600)))
+
+# بعد از خطای اتصال، تا این مدت (ثانیه) سراغ Redis نمی‌رویم تا هر سؤال منتظر timeout نماند.
+RETRY_AFTER_SEC = float(os.getenv("REDIS_RETRY_AFTER_SEC", "5"))
+_down_since: Optional[float] = None
+
+# یک رفت‌وبرگشت برای پیش‌پردازش: افزودن پیام کاربر به تاریخچه، کوتاه کردن آن،
+# خواندن تاریخچه و ذخیرهٔ latest_user_json که خود تاریخچه را در بر دارد.
+# KEYS[1] = chat:{id}:last_twenty, KEYS[2] = chat:{id}:latest_user_json, KEYS[3] = chat:{id}:latest_ai_json
+# ARGV[1] = آیتم تاریخچه، ARGV[2] = طول تاریخچه، ARGV[3] = JSON کاربر بدون last_twenty_messages، ARGV[4] = TTL
+_RECORD_USER_TURN_LUA = """
+local ttl = tonumber(ARGV[4])
+redis.call('LPUSH', KEYS[1], ARGV[1])
+redis.call('LTRIM', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+redis.call('EXPIRE', KEYS[1], ttl)
+local items = redis.call('LRANGE', KEYS[1], 0, -1)
+local history = '[' .. table.concat(items, ', ') .. ']'
+local user_json = string.sub(ARGV[3], 1, -2) .. ', "last_twenty_messages": ' .. cjson.encode(history) .. '}'
+redis.call('SET', KEYS[2], user_json, 'EX', ttl)
+redis.call('EXPIRE', KEYS[3], ttl)
+return items
+"""
+_record_user_turn_script = r.register_script(_RECORD_USER_TURN_LUA)
+
 
 def now_iso() -> str:
     """زمان فعلی به ISO8601 با microseconds"""
     return datetime.now(timezone.utc).astimezone().isoformat(timespec="microseconds")
 
 def health() -> bool:
-    """ping ساده برای چک سلامت اتصال Redis"""
+    """وضعیت اتصال Redis بر اساس آخرین خطای اتصال (بدون ping اضافه)."""
+    return _down_since is None or (time.monotonic() - _down_since) >= RETRY_AFTER_SEC
+
+def _call(op_name: str, fn: Callable[[], Any], default: Any = None) -> Any:
+    """اجرای یک عملیات Redis؛ خطای اتصال وضعیت را «قطع» می‌کند و موفقیت آن را برمی‌گرداند."""
+    global _down_since
+    if not health():
+        return default
     try:
-        return r.ping()
-    except Exception:
-        return False
+        result = fn()
+    except (RedisConnectionError, RedisTimeoutError) as e:
+        if _down_since is None:
+            print(f"Redis unavailable ({op_name}): {e}")
+        _down_since = time.monotonic()
+        return default
+    except Exception as e:
+        print(f"Redis error {op_name}: {e}")
+        return default
+    _down_since = None
+    return result
+
+def _history_key(chat_id: str) -> str:
+    return f"chat:{chat_id}:last_twenty"
+
+def _chat_keys(chat_id: str) -> List[str]:
+    return [_history_key(chat_id), f"chat:{chat_id}:latest_user_json", f"chat:{chat_id}:latest_ai_json"]
+
+def cap_content(content: str, max_bytes: int = ENTRY_MAX_BYTES) -> str:
+    """محتوای بلندتر از سقف بایت را کوتاه می‌کند (بدون شکستن کاراکترهای چندبایتی)."""
+    if content is None:
+        return ""
+    encoded = content.encode("utf-8")
+    if max_bytes <= 0 or len(encoded) <= max_bytes:
+        return content
+    keep = max(max_bytes - len(TRUNCATED_SUFFIX.encode("utf-8")), 0)
+    return encoded[:keep].decode("utf-8", errors="ignore") + TRUNCATED_SUFFIX
+
+def _history_item(role: str, content: str, ts: Optional[str] = None) -> str:
+    item = {"role": role, "content": cap_content(content), "timestamp": ts or now_iso()}
+    return json.dumps(item, ensure_ascii=False)
+
+def record_user_turn(user_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    پیش‌پردازش یک سؤال در یک رفت‌وبرگشت (Lua): پیام کاربر به تاریخچه اضافه می‌شود و
+    latest_user_json همراه با last_twenty_messages ذخیره می‌شود و TTL همهٔ کلیدهای چت تمدید می‌شود.
+    تاریخچه (جدیدترین اول) برگردانده می‌شود.
+    """
+    chat_id = user_json["chat_id"]
+    item = _history_item("user", user_json["content"], user_json.get("timestamp"))
+    payload = {k: v for k, v in user_json.items() if k != "last_twenty_messages"}
+    raw = _call(
+        "record_user_turn",
+        lambda: _record_user_turn_script(
+            keys=_chat_keys(chat_id),
+            args=[item, HISTORY_LEN, json.dumps(payload, ensure_ascii=False), CHAT_KEY_TTL_SEC],
+        ),
+        default=[],
+    )
+    return [json.loads(x) for x in raw]
+
+def record_ai_turn(ai_json: Dict[str, Any]):
+    """
+    پس‌پردازش در یک رفت‌وبرگشت (pipeline): ذخیرهٔ latest_ai_json (با محتوای محدودشده)،
+    افزودن پاسخ به تاریخچه و تمدید TTL کلیدهای چت.
+    """
+    chat_id = ai_json["chat_id"]
+    history_key, user_key, ai_key = _chat_keys(chat_id)
+    stored = dict(ai_json, content=cap_content(ai_json["content"]))
+
+    def _run():
+        with r.pipeline() as p:
+            p.set(ai_key, json.dumps(stored, ensure_ascii=False), ex=CHAT_KEY_TTL_SEC)
+            p.lpush(history_key, _history_item("assistant", ai_json["content"], ai_json.get("timestamp")))
+            p.ltrim(history_key, 0, HISTORY_LEN - 1)
+            p.expire(history_key, CHAT_KEY_TTL_SEC)
+            p.expire(user_key, CHAT_KEY_TTL_SEC)
+            p.execute()
+
+    _call("record_ai_turn", _run)
 
 def push_last_twenty_message(chat_id: str, role: str, content: str, ts: Optional[str] = None):
     """تاریخچهٔ ۲۰ پیام آخر چت را به‌صورت لیست در Redis نگه می‌دارد (LPUSH/LTRIM)."""
-    key = f"chat:{chat_id}:last_twenty"
-    item = {"role": role, "content": content, "timestamp": ts or now_iso()}
-    try:
+    key = _history_key(chat_id)
+
+    def _run():
         with r.pipeline() as p:
-            p.lpush(key, json.dumps(item, ensure_ascii=False))
-            p.ltrim(key, 0, 19)
+            p.lpush(key, _history_item(role, content, ts))
+            p.ltrim(key, 0, HISTORY_LEN - 1)
+            p.expire(key, CHAT_KEY_TTL_SEC)
             p.execute()
-    except Exception as e:
-        print(f"Redis error push_last_twenty_message: {e}")
+
+    _call("push_last_twenty_message", _run)
 
 def get_last_twenty_messages(chat_id: str) -> List[Dict[str, Any]]:
     """خواندن تاریخچهٔ ۲۰ پیام آخر (جدیدترین اول)."""
-    key = f"chat:{chat_id}:last_twenty"
-    try:
-        raw = r.lrange(key, 0, -1)
-        return [json.loads(x) for x in raw]
-    except Exception as e:
-        print(f"Redis error get_last_twenty_messages: {e}")
-        return []
+    raw = _call("get_last_twenty_messages", lambda: r.lrange(_history_key(chat_id), 0, -1), default=[])
+    return [json.loads(x) for x in raw]
 
 def save_user_message_json(user_json: Dict[str, Any]):
     """ذخیرهٔ آخرین JSON پیام کاربر مطابق قرارداد تیم."""
     key = f"chat:{user_json['chat_id']}:latest_user_json"
-    try:
-        r.set(key, json.dumps(user_json, ensure_ascii=False))
-    except Exception as e:
-        print(f"Redis error save_user_message_json: {e}")
+    _call("save_user_message_json", lambda: r.set(key, json.dumps(user_json, ensure_ascii=False), ex=CHAT_KEY_TTL_SEC))
 
 def save_ai_response_json(ai_json: Dict[str, Any]):
     """ذخیرهٔ آخرین JSON پاسخ AI مطابق قرارداد تیم."""
     key = f"chat:{ai_json['chat_id']}:latest_ai_json"
-    try:
-        r.set(key, json.dumps(ai_json, ensure_ascii=False))
-    except Exception as e:
-        print(f"Redis error save_ai_response_json: {e}")
+    stored = dict(ai_json, content=cap_content(ai_json.get("content", "")))
+    _call("save_ai_response_json", lambda: r.set(key, json.dumps(stored, ensure_ascii=False), ex=CHAT_KEY_TTL_SEC))
 
 def get_latest_user_json(chat_id: str) -> Optional[Dict[str, Any]]:
     """خواندن آخرین JSON پیام کاربر."""
-    key = f"chat:{chat_id}:latest_user_json"
-    raw = r.get(key)
+    raw = _call("get_latest_user_json", lambda: r.get(f"chat:{chat_id}:latest_user_json"))
     return json.loads(raw) if raw else None
 
 def get_latest_ai_json(chat_id: str) -> Optional[Dict[str, Any]]:
     """خواندن آخرین JSON پاسخ AI."""
-    key = f"chat:{chat_id}:latest_ai_json"
-    raw = r.get(key)
+    raw = _call("get_latest_ai_json", lambda: r.get(f"chat:{chat_id}:latest_ai_json"))
     return json.loads(raw) if raw else None
+
+def _last_query_key(chat_id: str) -> str:
+    return f"chat:{chat_id}:last_query"
+
+def store_last_query(chat_id: str, question: str, sql: str):
+    """ذخیرهٔ آخرین سؤال و SQL معتبرِ اجراشدهٔ چت تا سؤال‌های پیگیری («همین برای ۱۴۰۱») آن را ویرایش کنند."""
+    payload = json.dumps({"question": cap_content(question, 2048), "sql": sql, "timestamp": now_iso()}, ensure_ascii=False)
+    _call("store_last_query", lambda: r.set(_last_query_key(chat_id), payload, ex=CHAT_KEY_TTL_SEC))
+
+def get_last_query(chat_id: str) -> Optional[Dict[str, Any]]:
+    """خواندن آخرین سؤال و SQL چت ({"question", "sql", "timestamp"}) یا None."""
+    raw = _call("get_last_query", lambda: r.get(_last_query_key(chat_id)))
+    return json.loads(raw) if raw else None
+
+def _answer_key(question_key: str) -> str:
+    return "answer_cache:" + hashlib.sha1(question_key.encode("utf-8")).hexdigest()
+
+def store_answer(question_key: str, answer: str):
+    """ذخیرهٔ آخرین پاسخ موفق برای یک سؤال نرمال‌شده (برای پاسخ کهنه هنگام قطعی)."""
+    payload = json.dumps({"answer": answer, "cached_at": now_iso()}, ensure_ascii=False)
+    _call("store_answer", lambda: r.set(_answer_key(question_key), payload, ex=ANSWER_CACHE_TTL_SEC))
+
+def get_cached_answer(question_key: str) -> Optional[Dict[str, Any]]:
+    """خواندن پاسخ ذخیره‌شده ({"answer", "cached_at"}) یا None."""
+    raw = _call("get_cached_answer", lambda: r.get(_answer_key(question_key)))
+    return json.loads(raw) if raw else None
+
+# شمارنده‌های ورکر در همان hash که ai_worker/metrics.py می‌نویسد (HGETALL ai_worker:metrics)
+METRICS_KEY = os.getenv("AI_METRICS_KEY", "ai_worker:metrics")
+
+def incr_metrics(*names: str):
+    """افزایش یک‌بارهٔ چند شمارنده در یک رفت‌وبرگشت (برای کدی که در thread اجرا می‌شود)."""
+    def _run():
+        with r.pipeline(transaction=False) as p:
+            for name in names:
+                p.hincrby(METRICS_KEY, name, 1)
+            p.execute()
+
+    _call("incr_metrics", _run)
+
+# لاگ اجرای کوئری‌ها و پلن‌های EXPLAIN ANALYZE؛ بک‌اند (ingest_query_log) آن را در پایگاه داده نگه می‌دارد
+QUERY_LOG_STREAM_KEY = os.getenv("QUERY_LOG_STREAM_KEY", "query_log_stream")
+QUERY_LOG_MAXLEN = int(os.getenv("QUERY_LOG_MAXLEN", "100000"))
+
+def log_query(fields: Dict[str, str]):
+    """افزودن یک رکورد (اجرا یا پلن) به استریم لاگ کوئری‌ها."""
+    _call("log_query", lambda: r.xadd(QUERY_LOG_STREAM_KEY, fields, maxlen=QUERY_LOG_MAXLEN, approximate=True))
+
+def claim_plan_sample(template_hash: str, ttl_sec: int) -> bool:
+    """True فقط برای اولین درخواست در هر ttl_sec برای یک قالب کوئری (نمونه‌گیری از پلن‌ها بین همهٔ ورکرها)."""
+    return bool(_call("claim_plan_sample", lambda: r.set(f"query_plan_sampled:{template_hash}", "1", nx=True, ex=ttl_sec)))
@@ -0,0 +1,58 @@
+# ai/result_cache.py
+"""
+Rows of an answered question, kept for a short while so the user can page
+through all of them ("show more") without the question going through SQL
+generation, the query and narration again. The backend reads them by
+message_id:
+
+    result:{message_id}         JSON: user_id, chat_id, columns, total, truncated, chunk_rows
+    result:{message_id}:chunks  list of base64(zlib(JSON rows)), chunk_rows rows each
+
+Chunks let a page decompress only the rows it needs.
+"""
+import base64
+import json
+import logging
+import os
+import zlib
+
+logger = logging.getLogger("ai_worker")
+
+RESULT_KEY_PREFIX = os.getenv("AI_RESULT_KEY_PREFIX", "result:")
+RESULT_TTL_SEC = int(os.getenv("AI_RESULT_TTL_SEC", str(30 * 60)))
+# Larger results keep only their first rows
+RESULT_MAX_ROWS = int(os.getenv("AI_RESULT_MAX_ROWS", "10000"))
+RESULT_CHUNK_ROWS = int(os.getenv("AI_RESULT_CHUNK_ROWS", "500"))
+
+
+def encode_chunks(rows: list, chunk_rows: int = RESULT_CHUNK_ROWS) -> list:
+    """Rows as compressed chunks; values become strings the way the narration sample does."""
+    chunks = []
+    for start in range(0, len(rows), chunk_rows):
+        chunk = [[None if v is None else str(v) for v in row] for row in rows[start:start + chunk_rows]]
+        raw = json.dumps(chunk, ensure_ascii=False).encode("utf-8")
+        chunks.append(base64.b64encode(zlib.compress(raw)).decode("ascii"))
+    return chunks
+
+
+async def store(r, message_id: str, user_id: str, chat_id: str, columns: list, chunks: list, total: int):
+    """Write a result from encode_chunks(); failures are logged, the answer is published regardless."""
+    key = f"{RESULT_KEY_PREFIX}{message_id}"
+    meta = {
+        "user_id": str(user_id),
+        "chat_id": str(chat_id),
+        "columns": list(columns),
+        "total": min(total, RESULT_MAX_ROWS),
+        "truncated": total > RESULT_MAX_ROWS,
+        "chunk_rows": RESULT_CHUNK_ROWS,
+    }
+    try:
+        pipe = r.pipeline(transaction=True)
+        pipe.delete(f"{key}:chunks")
+        if chunks:
+            pipe.rpush(f"{key}:chunks", *chunks)
+            pipe.expire(f"{key}:chunks", RESULT_TTL_SEC)
+        pipe.set(key, json.dumps(meta, ensure_ascii=False), ex=RESULT_TTL_SEC)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Result cache store failed: {e}")
@@ -0,0 +1,163 @@
+# ai/scheduler.py
+"""
+Fair-share scheduling for the AI worker.
+
+Jobs are grouped into lanes by user_role and, inside a lane, by user.
+Lanes share the worker by deficit round robin: on each visit a lane earns
+its weight in credits and every dispatched job costs one credit, so with
+weights admin=4, public=1 admins get four slots for every public one while
+both have work. Inside a lane users take turns one job at a time, so a
+user who queued 50 questions only delays their own later questions.
+A per-user in-flight cap keeps one user from occupying every worker slot.
+
+Every job carries the absolute deadline stamped by the backend. Expired
+jobs are swept out without running, and in catch-up mode (after an outage
+or backlog) each user's newest-deadline job is served first, so capacity
+goes to answers that can still be delivered.
+"""
+import math
+import os
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """'admin:4,public:1' -> {'admin': 4.0, 'public': 1.0}"""
+    weights = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        role, _, weight = part.partition(":")
+        weights[role.strip()] = float(weight or 1)
+    return weights
+
+
+ROLE_WEIGHTS = parse_weights(os.getenv("AI_ROLE_WEIGHTS", "admin:4,public:1"))
+DEFAULT_WEIGHT = float(os.getenv("AI_DEFAULT_ROLE_WEIGHT", "1"))
+PER_USER_INFLIGHT = int(os.getenv("AI_PER_USER_INFLIGHT", "1"))
+
+
+@dataclass
+class Job:
+    entry_id: str
+    fields: Dict[str, Any]
+    user_id: str = ""
+    role: str = "public"
+    deadline: float = math.inf
+    attempts: int = 0  # failed runs so far
+
+    def __post_init__(self):
+        self.user_id = str(self.fields.get("user_id", ""))
+        self.role = self.fields.get("user_role") or "public"
+        try:
+            self.deadline = float(self.fields["deadline"])
+        except (KeyError, TypeError, ValueError):
+            # Entries from older backends have no deadline
+            self.deadline = math.inf
+
+    def expired(self, now: float) -> bool:
+        return now >= self.deadline
+
+
+@dataclass
+class _Lane:
+    weight: float
+    deficit: float = 0.0
+    users: "OrderedDict[str, Deque[Job]]" = field(default_factory=OrderedDict)
+
+    def next_user(self, inflight: Dict[str, int], cap: int) -> Optional[str]:
+        for user_id, jobs in self.users.items():
+            if jobs and inflight.get(user_id, 0) < cap:
+                return user_id
+        return None
+
+    def take(self, user_id: str, newest_first: bool = False) -> Job:
+        jobs = self.users.pop(user_id)
+        if newest_first:
+            job = max(reversed(jobs), key=lambda j: j.deadline)
+            jobs.remove(job)
+        else:
+            job = jobs.popleft()
+        if jobs:
+            # Back of the line until every other user in the lane had a turn
+            self.users[user_id] = jobs
+        return job
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        role_weights: Optional[Dict[str, float]] = None,
+        default_weight: float = DEFAULT_WEIGHT,
+        per_user_inflight: int = PER_USER_INFLIGHT,
+    ):
+        self.role_weights = ROLE_WEIGHTS if role_weights is None else role_weights
+        self.default_weight = default_weight
+        self.per_user_inflight = max(1, per_user_inflight)
+        self._lanes: Dict[str, _Lane] = {}
+        self._order: Deque[str] = deque()
+        self._inflight: Dict[str, int] = {}
+        self._size = 0
+        # Catch-up mode: serve each user's newest-deadline job first
+        self.newest_first = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, job: Job):
+        lane = self._lanes.get(job.role)
+        if lane is None:
+            weight = self.role_weights.get(job.role, self.default_weight)
+            lane = self._lanes[job.role] = _Lane(weight=max(weight, 0.01))
+            self._order.append(job.role)
+        lane.users.setdefault(job.user_id, deque()).append(job)
+        self._size += 1
+
+    def pop(self) -> Optional[Job]:
+        """Next job to run, or None if nothing is runnable (empty, or every user at the in-flight cap)."""
+        if not any(lane.next_user(self._inflight, self.per_user_inflight) for lane in self._lanes.values()):
+            return None
+        while True:
+            role = self._order[0]
+            lane = self._lanes[role]
+            user_id = lane.next_user(self._inflight, self.per_user_inflight)
+            if user_id is None:
+                # Classic DRR: a lane with nothing to send does not bank credit
+                lane.deficit = 0.0
+                self._order.rotate(-1)
+                continue
+            if lane.deficit >= 1:
+                lane.deficit -= 1
+                job = lane.take(user_id, self.newest_first)
+                self._size -= 1
+                self._inflight[user_id] = self._inflight.get(user_id, 0) + 1
+                return job
+            lane.deficit += lane.weight
+            self._order.rotate(-1)
+
+    def expire(self, now: float) -> List[Job]:
+        """Remove and return every queued job whose deadline has passed."""
+        expired = []
+        for lane in self._lanes.values():
+            for user_id in list(lane.users):
+                jobs = lane.users[user_id]
+                if not any(job.expired(now) for job in jobs):
+                    continue
+                keep = deque(job for job in jobs if not job.expired(now))
+                expired.extend(job for job in jobs if job.expired(now))
+                if keep:
+                    lane.users[user_id] = keep
+                else:
+                    del lane.users[user_id]
+        self._size -= len(expired)
+        return expired
+
+    def done(self, job: Job):
+        """Release the job's in-flight slot."""
+        count = self._inflight.get(job.user_id, 0) - 1
+        if count > 0:
+            self._inflight[job.user_id] = count
+        else:
+            self._inflight.pop(job.user_id, None)
+
+    def inflight(self, user_id: str) -> int:
+        return self._inflight.get(user_id, 0)
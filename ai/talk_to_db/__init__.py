@@ -3,4 +3,7 @@
 # =========================
 
 # (empty on purpose) — makes this a package
-from .talk_to_db import talk_to_db
+from .talk_to_db import talk_to_db, answer_heavy
+from .deadline import DeadlineExceeded
+from .errors import StageFailed, HeavyQuery
+from .breaker import CircuitOpen
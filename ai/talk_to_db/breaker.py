@@ -0,0 +1,121 @@
+# =========================
+# File: talk_to_db/breaker.py
+# =========================
+
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable
+
+FAILURE_RATE = float(os.getenv("AI_BREAKER_FAILURE_RATE", "0.5"))
+MIN_CALLS = int(os.getenv("AI_BREAKER_MIN_CALLS", "5"))
+WINDOW_SEC = float(os.getenv("AI_BREAKER_WINDOW_SEC", "60"))
+OPEN_SEC = float(os.getenv("AI_BREAKER_OPEN_SEC", "30"))
+
+
+class CircuitOpen(Exception):
+    """The dependency is considered down; the call was not attempted."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} circuit is open (next probe in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through and outcomes are kept for the last WINDOW_SEC.
+    Once at least MIN_CALLS were made and FAILURE_RATE of them failed, the
+    breaker opens and calls fail at once with CircuitOpen. After OPEN_SEC a
+    single probe call is let through (half-open): success closes the breaker,
+    failure opens it again.
+
+    Only exceptions for which is_failure() is true count as failures; e.g. a
+    SQL syntax error means the database answered.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        is_failure: Callable[[BaseException], bool] = lambda e: True,
+        failure_rate: float = FAILURE_RATE,
+        min_calls: int = MIN_CALLS,
+        window_sec: float = WINDOW_SEC,
+        open_sec: float = OPEN_SEC,
+    ):
+        self.name = name
+        self.is_failure = is_failure
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_sec = window_sec
+        self.open_sec = open_sec
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+        self._outcomes: deque = deque()  # (monotonic time, ok)
+        self._opened_at = 0.0
+        self._probing = False
+
+    def retry_in(self) -> float:
+        """Seconds until a call may be attempted again (0 when closed or ready to probe)."""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.open_sec - time.monotonic())
+
+    def _before_call(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._opened_at >= self.open_sec:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            retry_in = max(0.0, self._opened_at + self.open_sec - now)
+        raise CircuitOpen(self.name, retry_in)
+
+    def _trip(self, now: float):
+        self.state = self.OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        logging.warning(f"Circuit {self.name} opened for {self.open_sec:.0f}s")
+
+    def _after_call(self, ok: bool):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                if ok:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                    logging.info(f"Circuit {self.name} closed")
+                else:
+                    self._trip(now)
+                return
+
+            self._outcomes.append((now, ok))
+            while self._outcomes and now - self._outcomes[0][0] > self.window_sec:
+                self._outcomes.popleft()
+            calls = len(self._outcomes)
+            failures = sum(1 for _, good in self._outcomes if not good)
+            if calls >= self.min_calls and failures / calls >= self.failure_rate:
+                self._trip(now)
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        self._before_call()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._after_call(not self.is_failure(e))
+            raise
+        self._after_call(True)
+        return result
+
+__all__ = ["CircuitBreaker", "CircuitOpen"]
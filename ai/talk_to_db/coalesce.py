@@ -0,0 +1,106 @@
+# =========================
+# File: talk_to_db/coalesce.py
+# =========================
+
+from __future__ import annotations
+import logging
+import re
+import threading
+import unicodedata
+from typing import Any, Callable, Dict
+
+# Arabic code points users type on non-Persian keyboards, and Persian/Arabic digits
+_CHAR_MAP = str.maketrans({
+    "\u064a": "\u06cc",  # Arabic yeh -> Persian yeh
+    "\u0649": "\u06cc",  # alef maksura -> Persian yeh
+    "\u0643": "\u06a9",  # Arabic kaf -> keheh
+    "\u0629": "\u0647",  # teh marbuta -> heh
+    "\u200c": " ",       # ZWNJ
+    **{chr(0x06f0 + i): str(i) for i in range(10)},
+    **{chr(0x0660 + i): str(i) for i in range(10)},
+})
+_TRAILING_PUNCT = re.compile(r"[\s?!.؟،,]+$")
+_SPACES = re.compile(r"\s+")
+
+_SQL_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_SQL_LITERAL = re.compile(r"('(?:[^']|'')*')")
+
+
+def normalize_question(question: str) -> str:
+    """Key for "the same question": spelling variants, spacing and trailing punctuation ignored."""
+    text = unicodedata.normalize("NFKC", question).translate(_CHAR_MAP)
+    text = _TRAILING_PUNCT.sub("", text)
+    return _SPACES.sub(" ", text).strip().lower()
+
+
+def canonical_sql(query: str) -> str:
+    """Key for "the same query": comments, spacing, keyword case and a trailing ';' ignored; literals kept."""
+    parts = _SQL_LITERAL.split(_SQL_COMMENT.sub(" ", query))
+    # split() with a capture group puts the literals at odd indexes
+    text = "".join(p if i % 2 else _SPACES.sub(" ", p).lower() for i, p in enumerate(parts))
+    return text.strip().rstrip(";").strip()
+
+
+_SQL_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+
+
+def sql_template(query: str) -> str:
+    """canonical_sql with every literal replaced by ?: queries that differ only in values share a template."""
+    parts = _SQL_LITERAL.split(canonical_sql(query))
+    return "".join("?" if i % 2 else _SQL_NUMBER.sub("?", p) for i, p in enumerate(parts))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Runs fn once per key among callers that overlap in time: the first caller
+    (the leader) executes it, later callers wait for and share its result or
+    exception. Nothing is cached; the key is free again once the leader returns.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.followers += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.followers:
+                logging.info(f"{self.name}: {call.followers} identical request(s) shared one execution")
+        return call.result
+
+
+# One per stage; talk_to_db runs in worker threads
+questions = SingleFlight("question")
+queries = SingleFlight("query")
+
+__all__ = ["SingleFlight", "normalize_question", "canonical_sql", "sql_template", "questions", "queries"]
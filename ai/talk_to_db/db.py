@@ -3,9 +3,20 @@
 # =========================
 
 from __future__ import annotations
+import json
 import os
 import psycopg2
-from typing import Tuple
+from typing import NamedTuple, Optional, Tuple
+from .validation import _split_statements
+
+# SQLSTATE query_canceled: statement_timeout ran out
+_QUERY_CANCELED = "57014"
+
+
+class Plan(NamedTuple):
+    """The planner's estimates for a query's top node."""
+    cost: float
+    rows: float
 
 
 
@@ -32,4 +43,33 @@ def execute_query(query: str, cur) -> Tuple[list, list]:
 
     return results, columns
 
-__all__ = ["connect_to_db", "execute_query"]
\ No newline at end of file
+def explain_query(query: str, cur) -> Optional[Plan]:
+    """
+    Plan the query without running it, so syntax errors and unknown columns or
+    tables surface without a scan. Returns the planner's total cost and rows,
+    or None for several statements: everything after the first would really
+    execute.
+    """
+    statements = _split_statements(query.strip())
+    if len(statements) != 1:
+        return None
+    cur.execute("EXPLAIN (FORMAT JSON) " + statements[0].strip().rstrip(";"))
+    plan = cur.fetchall()[0][0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    top = plan[0]["Plan"]
+    return Plan(float(top["Total Cost"]), float(top["Plan Rows"]))
+
+
+def is_timeout(e: BaseException) -> bool:
+    """The query was cancelled by statement_timeout: too expensive, not a database outage."""
+    return getattr(e, "pgcode", None) == _QUERY_CANCELED
+
+
+def is_outage(e: BaseException) -> bool:
+    """Errors that say the database is down or overloaded, as opposed to a bad query."""
+    if is_timeout(e):
+        return False
+    return isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError, ConnectionError))
+
+__all__ = ["Plan", "connect_to_db", "execute_query", "explain_query", "is_timeout", "is_outage"]
\ No newline at end of file
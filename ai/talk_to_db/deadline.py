@@ -0,0 +1,23 @@
+# =========================
+# File: talk_to_db/deadline.py
+# =========================
+
+from __future__ import annotations
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(Exception):
+    """The caller stopped waiting before `stage` started; its answer would never be delivered."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"deadline passed before {stage}")
+        self.stage = stage
+
+
+def check_deadline(deadline: Optional[float], stage: str) -> None:
+    """Raise DeadlineExceeded if the absolute deadline (epoch seconds) has passed."""
+    if deadline is not None and time.time() >= deadline:
+        raise DeadlineExceeded(stage)
+
+__all__ = ["DeadlineExceeded", "check_deadline"]
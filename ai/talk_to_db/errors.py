@@ -0,0 +1,36 @@
+# =========================
+# File: talk_to_db/errors.py
+# =========================
+
+from __future__ import annotations
+
+
+class StageFailed(Exception):
+    """talk_to_db failed in `stage`; the worker retries the question or dead-letters it."""
+
+    def __init__(self, stage: str, error: Exception):
+        super().__init__(f"{stage}: {error}")
+        self.stage = stage
+        self.error = error
+
+class HeavyQuery(Exception):
+    """The SQL's planned cost is above the interactive limit; the worker queues it as a background job."""
+
+    def __init__(self, query: str, cost: float, question: str):
+        super().__init__(f"planned cost {cost:.0f}")
+        self.query = query
+        self.cost = cost
+        # With a follow-up's context, for narrating the result later
+        self.question = question
+
+class QueryRejected(Exception):
+    """The SQL is over the asking role's resource limits (see guard.py); the user is told to narrow the question."""
+
+    def __init__(self, reason: str, role: str, estimate: float = 0.0, limit: float = 0.0):
+        super().__init__(f"{reason} over the {role} limit of {limit:.0f}")
+        self.reason = reason  # "cost" or "timeout"
+        self.role = role
+        self.estimate = estimate
+        self.limit = limit
+
+__all__ = ["StageFailed", "HeavyQuery", "QueryRejected"]
@@ -0,0 +1,124 @@
+# =========================
+# File: talk_to_db/followup.py
+# =========================
+
+from __future__ import annotations
+import os
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from .coalesce import normalize_question
+
+# Questions longer than this are treated as standalone
+FOLLOWUP_MAX_WORDS = int(os.getenv("AI_FOLLOWUP_MAX_WORDS", "8"))
+
+# A short question that refers back to the previous one is a follow-up
+_REFERS = {"همین", "همون", "همینو", "همونو", "اون", "same", "those"}
+# Words that carry no edit of their own ("same thing for 1401", "حالا فقط صادرات").
+# Common at the start of any question too, so they only mark a follow-up when
+# nothing else is asked ("how many countries ..." is standalone).
+_FILLER = _REFERS | {
+    "حالا", "فقط", "و", "اما", "ولی", "چطور", "برای", "در", "تو", "توی",
+    "رو", "را", "هم", "به", "مورد", "طور", "چی", "چه", "سال", "ماه", "چطوره", "بود", "باشه",
+    "now", "only", "and", "but", "what", "how", "for", "in",
+    "thing", "about", "the", "that", "year", "month", "just", "please",
+}
+
+_MONTHS = {
+    "فروردین": 1, "اردیبهشت": 2, "خرداد": 3, "تیر": 4, "مرداد": 5, "شهریور": 6,
+    "مهر": 7, "آبان": 8, "آذر": 9, "دی": 10, "بهمن": 11, "اسفند": 12,
+}
+_TYPES = {"صادرات": "صادرات", "export": "صادرات", "exports": "صادرات",
+          "واردات": "واردات", "import": "واردات", "imports": "واردات"}
+_YEAR = re.compile(r"^1[34]\d\d$")
+
+_SQL_YEAR = re.compile(r"""((?:\b|")year"?)\s*=\s*'?(1[34]\d\d)'?""", re.I)
+_SQL_MONTH = re.compile(r"""((?:\b|")month"?)\s*=\s*'?(\d{1,2})'?""", re.I)
+_SQL_TYPE = re.compile(r"""((?:\b|")type"?)\s*=\s*'([^']*)'""", re.I)
+_SQL_TYPE_ANY = re.compile(r"""(\b|")type\b""", re.I)
+_SQL_SELECT = re.compile(r"\bselect\b", re.I)
+_SQL_FROM = re.compile(r"\bfrom\b", re.I)
+_SQL_WHERE = re.compile(r"\bwhere\b(.*?)(?=\bgroup\s+by\b|\bhaving\b|\border\s+by\b|\blimit\b|;|\Z)", re.I | re.S)
+_SQL_CLAUSE_END = re.compile(r"\s*(?=\bgroup\s+by\b|\bhaving\b|\border\s+by\b|\blimit\b|;|\Z)", re.I)
+
+
+@dataclass
+class Followup:
+    previous_question: str
+    previous_sql: str
+    # Set when the edit could be applied without the model
+    sql: Optional[str] = None
+
+    def standalone(self, question: str) -> str:
+        """The follow-up with its context, for when the previous SQL cannot be edited."""
+        return f"{self.previous_question}\n{question}"
+
+
+def is_followup(question: str) -> bool:
+    tokens = normalize_question(question).split()
+    if not tokens or len(tokens) > FOLLOWUP_MAX_WORDS:
+        return False
+    if any(t in _REFERS for t in tokens):
+        return True
+    # A bare "1401?" or "what about exports?" only makes sense against the previous question
+    return all(t in _FILLER or t in _MONTHS or t in _TYPES or _YEAR.match(t) for t in tokens)
+
+
+def _set_type(sql: str, value: str) -> Optional[str]:
+    matches = _SQL_TYPE.findall(sql)
+    if len(matches) == 1:
+        return _SQL_TYPE.sub(lambda m: f"{m.group(1)} = '{value}'", sql)
+    if _SQL_TYPE_ANY.search(sql) or len(_SQL_SELECT.findall(sql)) != 1:
+        return None
+    # No type filter yet: add one to the only WHERE, or add the WHERE
+    where = list(_SQL_WHERE.finditer(sql))
+    if len(where) > 1:
+        return None
+    if where:
+        m = where[0]
+        head, clause = sql[:m.start()], f"WHERE type = '{value}' AND ({m.group(1).strip()})"
+    else:
+        start = _SQL_FROM.search(sql)
+        m = _SQL_CLAUSE_END.search(sql, start.end() if start else 0)
+        head, clause = sql[:m.start()].rstrip() + " ", f"WHERE type = '{value}'"
+    tail = sql[m.end():].lstrip()
+    return head + clause + (" " + tail if tail and not tail.startswith(";") else tail)
+
+
+def apply_edit(question: str, sql: str) -> Optional[str]:
+    """
+    Edit the previous SQL for follow-ups that only change the year, the month or
+    imports/exports. None when the follow-up asks for anything else (or the SQL
+    has no single place to make the change); the model handles those.
+    """
+    tokens = normalize_question(question).split()
+    years = [t for t in tokens if _YEAR.match(t)]
+    months = [_MONTHS[t] for t in tokens if t in _MONTHS]
+    types = {_TYPES[t] for t in tokens if t in _TYPES}
+    rest = [t for t in tokens if t not in _FILLER and t not in _MONTHS and t not in _TYPES and not _YEAR.match(t)]
+    if rest or not (years or months or types) or len(years) > 1 or len(months) > 1 or len(types) > 1:
+        return None
+
+    if years:
+        if len(_SQL_YEAR.findall(sql)) != 1:
+            return None
+        sql = _SQL_YEAR.sub(lambda m: f"{m.group(1)} = {years[0]}", sql)
+    if months:
+        if len(_SQL_MONTH.findall(sql)) != 1:
+            return None
+        sql = _SQL_MONTH.sub(lambda m: f"{m.group(1)} = {months[0]}", sql)
+    if types:
+        sql = _set_type(sql, types.pop())
+    return sql
+
+
+def detect(question: str, previous: Optional[dict]) -> Optional[Followup]:
+    """A Followup when the chat has a previous query and the question reads as a follow-up to it."""
+    if not previous or not previous.get("sql") or not is_followup(question):
+        return None
+    followup = Followup(previous.get("question", ""), previous["sql"])
+    followup.sql = apply_edit(question, followup.previous_sql)
+    return followup
+
+__all__ = ["Followup", "detect", "is_followup", "apply_edit"]
@@ -0,0 +1,114 @@
+# =========================
+# File: talk_to_db/guard.py
+# =========================
+
+from __future__ import annotations
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from .coalesce import canonical_sql
+from .db import Plan
+from .errors import QueryRejected
+
+# Plans are reused for the same (canonical) SQL; statistics drift, so not forever
+PLAN_CACHE_SIZE = int(os.getenv("AI_PLAN_CACHE_SIZE", "1024"))
+PLAN_CACHE_TTL_SEC = float(os.getenv("AI_PLAN_CACHE_TTL_SEC", "600"))
+
+
+@dataclass(frozen=True)
+class RoleLimits:
+    """
+    What one role's questions may cost the database. Over max_cost (planner
+    estimate) a query is rejected; over max_rows estimated rows it is capped
+    with a LIMIT instead. 0 means no limit. statement_timeout and work_mem
+    are set for the transaction the query runs in.
+    """
+    role: str
+    max_cost: float
+    max_rows: int
+    statement_timeout_ms: int
+    work_mem: str
+
+
+def _role_limits(role: str, max_cost: str, max_rows: str, statement_timeout_ms: str, work_mem: str) -> RoleLimits:
+    prefix = f"AI_{role.upper()}_"
+    return RoleLimits(
+        role=role,
+        max_cost=float(os.getenv(prefix + "MAX_COST", max_cost)),
+        max_rows=int(os.getenv(prefix + "MAX_ROWS", max_rows)),
+        statement_timeout_ms=int(os.getenv(prefix + "STATEMENT_TIMEOUT_MS", statement_timeout_ms)),
+        work_mem=os.getenv(prefix + "WORK_MEM", work_mem),
+    )
+
+
+ROLE_LIMITS = {
+    "public": _role_limits("public", "50000000", "50000", "30000", "16MB"),
+    "admin": _role_limits("admin", "0", "0", "120000", "64MB"),
+}
+
+
+def limits_for(role: Optional[str]) -> RoleLimits:
+    """Unknown roles get the public limits."""
+    return ROLE_LIMITS.get(role or "public", ROLE_LIMITS["public"])
+
+
+class PlanCache:
+    """Thread-safe LRU of EXPLAIN estimates by canonical SQL, each kept for ttl seconds."""
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._plans: "OrderedDict[str, Tuple[float, Plan]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query: str) -> Optional[Plan]:
+        key = canonical_sql(query)
+        with self._lock:
+            entry = self._plans.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self._plans[key]
+                return None
+            self._plans.move_to_end(key)
+            return entry[1]
+
+    def put(self, query: str, plan: Optional[Plan]):
+        if plan is None or self.size <= 0:
+            return
+        key = canonical_sql(query)
+        with self._lock:
+            self._plans[key] = (time.monotonic(), plan)
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.size:
+                self._plans.popitem(last=False)
+
+
+plans = PlanCache(PLAN_CACHE_SIZE, PLAN_CACHE_TTL_SEC)
+
+
+def check_plan(query: str, plan: Optional[Plan], limits: RoleLimits) -> str:
+    """
+    The SQL to run for this role: the query itself, or the query capped at
+    max_rows when the planner expects more. Raises QueryRejected when the
+    estimated cost is over max_cost. Without a plan (several statements;
+    validation rejects those anyway) the query is returned unchanged.
+    """
+    if plan is None:
+        return query
+    if limits.max_cost and plan.cost > limits.max_cost:
+        raise QueryRejected("cost", limits.role, plan.cost, limits.max_cost)
+    if limits.max_rows and plan.rows > limits.max_rows:
+        return f"SELECT * FROM ({query.strip().rstrip(';')}) AS capped LIMIT {int(limits.max_rows)}"
+    return query
+
+
+def apply_limits(cur, limits: RoleLimits, statement_timeout_ms: Optional[int] = None):
+    """Per-role session limits for the current transaction only (SET LOCAL)."""
+    cur.execute("SET LOCAL statement_timeout = %s", (statement_timeout_ms or limits.statement_timeout_ms,))
+    cur.execute("SET LOCAL work_mem = %s", (limits.work_mem,))
+
+__all__ = ["RoleLimits", "ROLE_LIMITS", "limits_for", "PlanCache", "plans", "check_plan", "apply_limits"]
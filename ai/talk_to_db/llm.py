@@ -3,32 +3,171 @@
 # =========================
 
 from __future__ import annotations
-import time, json
+import time, json, logging, os, random, threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from typing import Optional
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, InternalServerError, RateLimitError
 
-from .prompts import SYSTEM_PROMPT_SQL, SYSTEM_PROMPT_SQL_TO_TEXT
+from .prompts import SYSTEM_PROMPT_SQL, SYSTEM_PROMPT_SQL_TO_TEXT, SQL_REPAIR_PROMPT, SQL_FOLLOWUP_PROMPT
 from .utils import truncate_for_log
 
 load_dotenv()
 
-# Instantiate OpenAI client once per process
+# Total time budget per stage, retries and hedges included
+SQL_TIMEOUT_SEC = float(os.getenv("LLM_SQL_TIMEOUT_SEC", "60"))
+SQL_SIMPLE_TIMEOUT_SEC = float(os.getenv("LLM_SQL_SIMPLE_TIMEOUT_SEC", "20"))
+ANSWER_TIMEOUT_SEC = float(os.getenv("LLM_ANSWER_TIMEOUT_SEC", "30"))
+CONNECT_TIMEOUT_SEC = float(os.getenv("LLM_CONNECT_TIMEOUT_SEC", "5"))
+# Retries on connection errors, timeouts, 5xx and 429, with full jitter
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+RETRY_BASE_SEC = float(os.getenv("LLM_RETRY_BASE_SEC", "0.5"))
+# Hedging: if a call is slower than the stage's recent p95, send a second one and take the first answer
+HEDGE = os.getenv("LLM_HEDGE", "false").lower() == "true"
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# One keep-alive pool shared by both stages and all worker threads
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY_SEC = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SEC", "60"))
+
+# SQL model per routing tier (see routing.py); narration always uses the small model
+SQL_MODEL_SIMPLE = os.getenv("LLM_SQL_MODEL_SIMPLE", "gpt-5-mini")
+SQL_MODEL_COMPLEX = os.getenv("LLM_SQL_MODEL_COMPLEX", "gpt-5")
+
+RETRYABLE = (APIConnectionError, InternalServerError, RateLimitError)
+
+http_client = httpx.Client(
+    limits=httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE,
+        keepalive_expiry=KEEPALIVE_EXPIRY_SEC,
+    ),
+    timeout=httpx.Timeout(SQL_TIMEOUT_SEC, connect=CONNECT_TIMEOUT_SEC),
+)
+
+# Instantiate OpenAI client once per process; retries are ours (bounded by the stage budget)
 try:
-    client = OpenAI()
+    client = OpenAI(http_client=http_client, max_retries=0)
 except Exception:
     print("Failed to instantiate OpenAI client.")
 
+_hedge_pool = ThreadPoolExecutor(max_workers=MAX_CONNECTIONS, thread_name_prefix="llm-hedge")
 
-def question_to_query(question: str) -> str:
 
+class _Stage:
+    """Model, time budget and recent latencies (for the hedge delay) of one LLM stage."""
+
+    def __init__(self, name: str, model: str, timeout: float):
+        self.name = name
+        self.model = model
+        self.timeout = timeout
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+SQL_STAGES = {
+    "simple": _Stage("sql_generation[simple]", SQL_MODEL_SIMPLE, SQL_SIMPLE_TIMEOUT_SEC),
+    "complex": _Stage("sql_generation[complex]", SQL_MODEL_COMPLEX, SQL_TIMEOUT_SEC),
+}
+ANSWER_STAGE = _Stage("answer", "gpt-5-mini", ANSWER_TIMEOUT_SEC)
+
+
+def _create(stage: _Stage, messages: list, timeout: float) -> str:
+    t0 = time.monotonic()
     response = client.chat.completions.create(
-        model="gpt-5",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT_SQL},
-            {"role": "user", "content": question},
-        ],
+        model=stage.model,
+        messages=messages,
+        timeout=httpx.Timeout(timeout, connect=min(CONNECT_TIMEOUT_SEC, timeout)),
     )
-    sql = response.choices[0].message.content
+    stage.observe(time.monotonic() - t0)
+    return response.choices[0].message.content
+
+
+def _hedged(stage: _Stage, messages: list, timeout: float) -> str:
+    hedge_after = stage.p95() if HEDGE else None
+    if hedge_after is None or hedge_after >= timeout:
+        return _create(stage, messages, timeout)
+
+    first = _hedge_pool.submit(_create, stage, messages, timeout)
+    try:
+        return first.result(timeout=hedge_after)
+    except FutureTimeout:
+        pass
+    logging.info(f"LLM {stage.name} slower than p95 ({hedge_after:.1f}s), sending a hedge request")
+    second = _hedge_pool.submit(_create, stage, messages, timeout - hedge_after)
+
+    # First successful answer wins; the loser finishes in the background and is ignored
+    pending = {first, second}
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+        if not pending:
+            raise future.exception()
+
+
+def _complete(stage: _Stage, messages: list) -> str:
+    """One chat completion within the stage budget, with jittered retries on transient errors."""
+    deadline = time.monotonic() + stage.timeout
+    attempt = 0
+    while True:
+        try:
+            return _hedged(stage, messages, deadline - time.monotonic())
+        except RETRYABLE as e:
+            attempt += 1
+            delay = random.uniform(0, RETRY_BASE_SEC * 2 ** (attempt - 1))
+            if attempt > MAX_RETRIES or time.monotonic() + delay >= deadline:
+                raise
+            logging.warning(f"LLM {stage.name} attempt {attempt} failed ({type(e).__name__}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def question_to_query(question: str, tier: str = "complex") -> str:
+
+    sql = _complete(SQL_STAGES[tier], [
+        {"role": "system", "content": SYSTEM_PROMPT_SQL},
+        {"role": "user", "content": question},
+    ])
+
+    return sql
+
+
+def repair_query(question: str, query: str, error: str, tier: str = "complex") -> str:
+    """Ask for a corrected query, giving the model its failing SQL and the PostgreSQL error."""
+
+    sql = _complete(SQL_STAGES[tier], [
+        {"role": "system", "content": SYSTEM_PROMPT_SQL},
+        {"role": "user", "content": question},
+        {"role": "assistant", "content": query},
+        {"role": "user", "content": SQL_REPAIR_PROMPT.format(error=truncate_for_log(error, 1000))},
+    ])
+
+    return sql
+
+
+def edit_query(previous_question: str, previous_query: str, question: str, tier: str = "simple") -> str:
+    """Adapt the previous turn's SQL to a follow-up question; an edit is a small job, so the small model by default."""
+
+    sql = _complete(SQL_STAGES[tier], [
+        {"role": "system", "content": SYSTEM_PROMPT_SQL},
+        {"role": "user", "content": previous_question},
+        {"role": "assistant", "content": previous_query},
+        {"role": "user", "content": SQL_FOLLOWUP_PROMPT.format(question=question)},
+    ])
 
     return sql
 
@@ -68,16 +207,16 @@ def query_to_result(results: list, columns: list, user_question: str) -> str:
 
 
     t0 = time.time()
-    response = client.chat.completions.create(
-        model="gpt-5-mini",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT_SQL_TO_TEXT},
-            {"role": "user", "content": user_payload},
-        ],
-    )
-    txt = response.choices[0].message.content
+    txt = _complete(ANSWER_STAGE, [
+        {"role": "system", "content": SYSTEM_PROMPT_SQL_TO_TEXT},
+        {"role": "user", "content": user_payload},
+    ])
     dt = time.time() - t0
 
     return txt
 
-__all__ = ["question_to_query", "query_to_result"]
\ No newline at end of file
+def is_outage(e: BaseException) -> bool:
+    """Errors that say OpenAI is unreachable or overloaded (timeouts are APIConnectionErrors)."""
+    return isinstance(e, (APIConnectionError, InternalServerError, RateLimitError))
+
+__all__ = ["question_to_query", "repair_query", "edit_query", "query_to_result", "is_outage"]
\ No newline at end of file
@@ -7,4 +7,15 @@ NO_RESULTS_MESSAGE = """هیچ رکوردی پیدا نشد.
 
 یک سوال نمونه:
 ۱۰ کالای با ارزش دلاری بالا که از امارات در ماه فروردین ۴۰۴ چه کالاهایی وارد شده‌اند؟"""
-__all__ = ["NO_RESULTS_MESSAGE"]
+
+# Prefixed to a cached answer served while OpenAI or the database is unavailable
+STALE_ANSWER_NOTE = "⚠️ سرویس در حال حاضر در دسترس نیست؛ این پاسخ ذخیره‌شده از {cached_at} است و ممکن است به‌روز نباشد.\n\n"
+# When the generated SQL still fails after the repair attempts
+REPAIR_FAILED_MESSAGE = "متأسفانه نتوانستیم برای این سؤال کوئری درستی بسازیم. لطفاً سؤال را دقیق‌تر یا ساده‌تر بیان کنید."
+# When the query is over the user's resource limits (estimated cost, or statement_timeout)
+QUERY_REJECTED_MESSAGE = """این سؤال به پردازش بسیار سنگینی روی پایگاه داده نیاز دارد و اجرا نشد.
+برای گرفتن پاسخ:
+۱- بازه زمانی را کوتاه‌تر کنید (مثلاً یک سال به جای چند سال)
+۲- کشور، کالا یا کد تعرفه مشخصی را در سؤال بیاورید
+۳- به جای فهرست همه ردیف‌ها، جمع یا ۱۰ مورد برتر را بپرسید"""
+__all__ = ["NO_RESULTS_MESSAGE", "STALE_ANSWER_NOTE", "REPAIR_FAILED_MESSAGE", "QUERY_REJECTED_MESSAGE"]
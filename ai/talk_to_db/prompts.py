@@ -52,4 +52,20 @@ SYSTEM_PROMPT_SQL_TO_TEXT = r"""
 - اگر داده‌ای وجود نداشت، بگو داده‌ای وجود ندارد
 """
 
-__all__ = ["SYSTEM_PROMPT_SQL", "SYSTEM_PROMPT_SQL_TO_TEXT"]
\ No newline at end of file
+# Sent after the failing SQL (as the assistant turn) when PostgreSQL rejects it
+SQL_REPAIR_PROMPT = r"""
+این کوئری در PostgreSQL با خطای زیر اجرا نشد:
+{error}
+
+کوئری را اصلاح کن تا همان سؤال را پاسخ دهد. فقط کد postgres اصلاح‌شده را بنویس و چیز اضافی نگو.
+"""
+
+# Sent after the previous turn's SQL (as the assistant turn) for a follow-up question
+SQL_FOLLOWUP_PROMPT = r"""
+سؤال بعدی کاربر ادامهٔ سؤال قبلی است:
+{question}
+
+کوئری قبلی را فقط به اندازهٔ لازم تغییر بده (مثلاً شرط، گروه‌بندی یا مرتب‌سازی) تا این سؤال را پاسخ دهد. فقط کد postgres کامل و اصلاح‌شده را بنویس و چیز اضافی نگو.
+"""
+
+__all__ = ["SYSTEM_PROMPT_SQL", "SYSTEM_PROMPT_SQL_TO_TEXT", "SQL_REPAIR_PROMPT", "SQL_FOLLOWUP_PROMPT"]
\ No newline at end of file
@@ -0,0 +1,78 @@
+# =========================
+# File: talk_to_db/querylog.py
+# =========================
+
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+from .coalesce import normalize_question, canonical_sql, sql_template
+from redis_utils import log_query, claim_plan_sample, incr_metrics, now_iso
+
+# Every executed query goes to the query log stream (redis_utils.log_query); the
+# backend keeps it per template. Slower than SLOW_QUERY_MS, a template's plan is
+# sampled with EXPLAIN ANALYZE at most once per PLAN_SAMPLE_INTERVAL_SEC
+SLOW_QUERY_MS = float(os.getenv("AI_SLOW_QUERY_MS", "2000"))
+PLAN_SAMPLE_INTERVAL_SEC = int(os.getenv("AI_PLAN_SAMPLE_INTERVAL_SEC", "3600"))
+PLAN_TIMEOUT_MS = int(os.getenv("AI_PLAN_TIMEOUT_MS", "60000"))
+# EXPLAIN ANALYZE runs the query again: point this at a replica where there is one
+PLAN_DATABASE_URL = os.getenv("AI_PLAN_DATABASE_URL") or os.getenv("DATABASE_URL")
+
+_sampler = ThreadPoolExecutor(max_workers=1, thread_name_prefix="plan-sample")
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def record_query(question: str, query: str, duration_ms: float, row_count: int, role: str):
+    """Log one execution; a slow one also queues a plan sample of its template in the background."""
+    template = sql_template(query)
+    template_hash = _hash(template)
+    log_query({
+        "kind": "execution",
+        "template_hash": template_hash,
+        "template": template,
+        "sql": canonical_sql(query),
+        "question_hash": _hash(normalize_question(question)),
+        "duration_ms": f"{duration_ms:.1f}",
+        "row_count": str(row_count),
+        "role": role,
+        "ts": now_iso(),
+    })
+    if duration_ms >= SLOW_QUERY_MS and PLAN_DATABASE_URL and claim_plan_sample(template_hash, PLAN_SAMPLE_INTERVAL_SEC):
+        _sampler.submit(_capture_plan, template_hash, template, query)
+
+
+def _capture_plan(template_hash: str, template: str, query: str):
+    """EXPLAIN (ANALYZE, BUFFERS) in a read-only transaction with PLAN_TIMEOUT_MS."""
+    try:
+        conn = psycopg2.connect(PLAN_DATABASE_URL)
+        try:
+            conn.set_session(readonly=True)
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL statement_timeout = %s", (PLAN_TIMEOUT_MS,))
+                cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query.strip().rstrip(";"))
+                plan = cur.fetchall()[0][0]
+            conn.rollback()
+        finally:
+            conn.close()
+    except Exception as e:
+        logging.info(f"Plan sample failed for {template_hash}: {e}")
+        incr_metrics("querylog:plan_failed")
+        return
+
+    log_query({
+        "kind": "plan",
+        "template_hash": template_hash,
+        "template": template,
+        "sql": canonical_sql(query),
+        "plan": plan if isinstance(plan, str) else json.dumps(plan),
+        "ts": now_iso(),
+    })
+    incr_metrics("querylog:plan_captured")
+
+__all__ = ["SLOW_QUERY_MS", "record_query"]
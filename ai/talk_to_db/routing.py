@@ -0,0 +1,79 @@
+# =========================
+# File: talk_to_db/routing.py
+# =========================
+
+from __future__ import annotations
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict
+
+from .coalesce import normalize_question
+
+SIMPLE = "simple"
+COMPLEX = "complex"
+
+ROUTING_ENABLED = os.getenv("AI_ROUTING", "true").lower() == "true"
+# Questions scoring above this go to the large model
+SIMPLE_MAX_SCORE = int(os.getenv("AI_ROUTE_SIMPLE_MAX_SCORE", "3"))
+
+_AGGREGATES = {
+    "جمع", "مجموع", "میانگین", "متوسط", "بیشترین", "کمترین", "حداکثر", "حداقل",
+    "تعداد", "چند", "چقدر", "سهم", "درصد", "رتبه", "برترین",
+    "sum", "total", "average", "avg", "max", "min", "count", "top", "share",
+}
+# Grouping, comparison and trend questions need joins, window functions or several aggregates
+_COMPARISONS = {
+    "مقایسه", "رشد", "تغییر", "روند", "تفکیک", "نسبت", "گروه", "هر",
+    "compare", "growth", "trend", "per", "versus", "vs",
+}
+_MONTHS = {
+    "فروردین", "اردیبهشت", "خرداد", "تیر", "مرداد", "شهریور",
+    "مهر", "آبان", "آذر", "دی", "بهمن", "اسفند",
+}
+_TIME_WORDS = {"سال", "ماه", "فصل", "هفته", "روز", "امسال", "پارسال", "year", "month", "quarter", "week"}
+_YEAR = re.compile(r"\b(?:1[34]\d\d|20\d\d|4\d\d)\b")
+_RANGE = re.compile(r"(?:\bاز\b|\bبین\b|\bbetween\b|\bfrom\b).+(?:\bتا\b|\band\b|\bto\b)")
+_LIST_SEP = re.compile(r"[،,]|\sو\s|\sیا\s|\sand\s|\sor\s")
+
+
+@dataclass
+class Route:
+    tier: str
+    score: int
+    features: Dict[str, int] = field(default_factory=dict)
+
+
+def features(question: str) -> Dict[str, int]:
+    text = normalize_question(question)
+    tokens = text.split()
+    words = set(tokens)
+    return {
+        "words": len(tokens),
+        "aggregates": len(words & _AGGREGATES),
+        "comparisons": len(words & _COMPARISONS),
+        "time_refs": len(words & _MONTHS) + len(words & _TIME_WORDS) + len(_YEAR.findall(text)),
+        "ranges": 1 if _RANGE.search(text) else 0,
+        "entities": len(_LIST_SEP.findall(text)),
+    }
+
+
+def classify(question: str) -> Route:
+    """
+    Pick the SQL model tier from cheap lexical features. A single lookup or
+    count goes to the small model; comparisons, ranges, several filters or
+    long questions go to the large one.
+    """
+    f = features(question)
+    score = (
+        f["aggregates"]
+        + 2 * f["comparisons"]
+        + f["time_refs"]
+        + 2 * f["ranges"]
+        + f["entities"]
+        + (2 if f["words"] > 25 else 1 if f["words"] > 15 else 0)
+    )
+    simple = ROUTING_ENABLED and score <= SIMPLE_MAX_SCORE and not f["comparisons"]
+    return Route(SIMPLE if simple else COMPLEX, score, f)
+
+__all__ = ["SIMPLE", "COMPLEX", "Route", "classify", "features"]
@@ -3,15 +3,24 @@
 # =========================
 
 from __future__ import annotations
-import json, time
+import json, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from dotenv import load_dotenv
 import logging
-from .llm import question_to_query, query_to_result
+from .llm import question_to_query, repair_query, edit_query, query_to_result, is_outage as is_llm_outage
 from .validation import validate_query
-from .db import connect_to_db, execute_query
+from .db import connect_to_db, execute_query, explain_query, is_timeout as is_db_timeout, is_outage as is_db_outage
 from .like_suggest import run_query_with_like, _make_like_pattern, _extract_field_and_value
-from .messages import NO_RESULTS_MESSAGE
+from .messages import NO_RESULTS_MESSAGE, STALE_ANSWER_NOTE, REPAIR_FAILED_MESSAGE, QUERY_REJECTED_MESSAGE
+from .deadline import DeadlineExceeded, check_deadline
+from .errors import StageFailed, HeavyQuery, QueryRejected
+from .coalesce import questions, queries, normalize_question, canonical_sql
+from .breaker import CircuitBreaker, CircuitOpen
+from .routing import SIMPLE, COMPLEX, classify
+from .followup import Followup, detect as detect_followup
+from .guard import RoleLimits, limits_for, plans, check_plan, apply_limits
+from .querylog import record_query
 from decimal import Decimal
 
 logging.basicConfig(level=logging.INFO)
@@ -21,14 +30,60 @@ logging.basicConfig(level=logging.INFO)
 from redis_utils import (
     health as redis_health_check,
     now_iso,
-    push_last_twenty_message,
-    get_last_twenty_messages,
-    save_user_message_json,
-    save_ai_response_json,
+    record_user_turn,
+    record_ai_turn,
+    store_answer,
+    get_cached_answer,
+    store_last_query,
+    get_last_query,
+    incr_metrics,
 )
 
 load_dotenv()
 
+# One breaker per dependency call: while open, calls fail at once instead of
+# every queued question waiting for the client timeout
+sql_breaker = CircuitBreaker("question_to_query", is_failure=is_llm_outage)
+answer_breaker = CircuitBreaker("query_to_result", is_failure=is_llm_outage)
+db_breaker = CircuitBreaker("database", is_failure=is_db_outage)
+BREAKERS = (sql_breaker, answer_breaker, db_breaker)
+
+# Stale answers are refreshed in the background once the breakers allow a probe
+_refresher = ThreadPoolExecutor(max_workers=int(os.getenv("AI_REFRESH_WORKERS", "1")), thread_name_prefix="answer-refresh")
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+# Times a query rejected by PostgreSQL is sent back to the model with the error
+REPAIR_ATTEMPTS = int(os.getenv("AI_SQL_REPAIR_ATTEMPTS", "2"))
+# Planner cost (EXPLAIN total cost) above which an interactive question's SQL is
+# handed to the worker's heavy-job lane instead of running while the user waits; 0 disables
+HEAVY_QUERY_COST = float(os.getenv("AI_HEAVY_QUERY_COST", "5000000"))
+# statement_timeout for heavy jobs, in place of the role's interactive one
+HEAVY_STATEMENT_TIMEOUT_MS = int(os.getenv("AI_HEAVY_STATEMENT_TIMEOUT_MS", "900000"))
+
+
+# Rows of finished heavy jobs by role and SQL, with when they finished. Identical
+# questions deferred together queue a job each; only the first runs the SQL.
+_heavy_results = {}
+_heavy_results_lock = threading.Lock()
+
+
+class _RepairFailed(Exception):
+    pass
+
+
+class Answer(str):
+    """
+    talk_to_db's reply. `stale` answers come from the cache while a dependency
+    is down; `sql` is the query the answer was computed from, if any, and
+    `columns`/`rows` its full result when it had rows.
+    """
+    stale = False
+    cached_at = None
+    sql = None
+    columns = None
+    rows = None
+
 
 def talk_to_db(
     question: str,
@@ -36,22 +91,19 @@ def talk_to_db(
     user_role: str,
     chat_id: str,
     is_first_message: bool,
-
+    deadline: Optional[float] = None,
+    record_history: bool = True,
+    defer_heavy: bool = False,
 ) -> str:
     logging.info(question)
 
-    conn = None
-    cur = None
+    stage = "history"
     try:
-        # 0) Redis health check (optional)
+        # 0) Redis state comes from the last connection error (no extra ping)
         if not redis_health_check():
-            logging.info("⚠️ اتصال به Redis مشکل دارد (ping ناموفق).")
-
-        # 1) Update history & store user JSON
-        push_last_twenty_message(chat_id, "user", question)
-        last_twenty = get_last_twenty_messages(chat_id)
-        last_twenty_str = json.dumps(last_twenty, ensure_ascii=False)
+            logging.info("⚠️ اتصال به Redis مشکل دارد (خطای اتصال اخیر).")
 
+        # 1) Update history & store user JSON (single round trip)
         user_json = {
             "user_id": str(user_id),
             "user_role": user_role,
@@ -60,28 +112,410 @@ def talk_to_db(
             "content": question,
             "is_first_message": "1" if is_first_message else "0",
             "timestamp": now_iso(),
-            "last_twenty_messages": last_twenty_str,
         }
-        save_user_message_json(user_json)
+        if record_history:  # a retried question is already in the history
+            last_twenty = record_user_turn(user_json)
 
-        # 2) Generate SQL
-        query = question_to_query(question)
+        # A follow-up ("همین برای ۱۴۰۱") edits this chat's previous SQL
+        followup = detect_followup(question, get_last_query(str(chat_id)))
+
+        # 2-4) SQL, query and narration, shared by identical questions in flight
+        max_cost = HEAVY_QUERY_COST if defer_heavy and HEAVY_QUERY_COST > 0 else None
+        final_text = _shared_answer(question, deadline, followup, max_cost, limits_for(user_role))
+
+        # 5-6) Store AI JSON & update history with assistant message
+        stage = "history"
+        # With its context, so a follow-up to a follow-up still knows what was asked
+        _record_answer(user_id, chat_id, followup.standalone(question) if followup else question, final_text)
+
+        return final_text
+
+    except (DeadlineExceeded, StageFailed, HeavyQuery):
+        # Not an answer: the worker drops or retries the question instead of publishing
+        raise
+    except Exception as e:
+        # The worker decides between retrying and dead-lettering
+        raise StageFailed(stage, e) from e
+
+
+def _record_answer(user_id: str, chat_id: str, question: str, answer: Answer):
+    ai_json = {
+        "user_id": str(user_id),
+        "chat_id": str(chat_id),
+        "content": answer,
+        "ai_response_metadata": json.dumps(
+            {
+                "model": "gpt-5-mini",
+                "processing_time": "0s",
+                "suggested_title": "عنوان پیشنهادی",
+            },
+            ensure_ascii=False,
+        ),
+        "ai_references": json.dumps([{"title": "سورس نمونه"}], ensure_ascii=False),
+        "tokens_used": "",
+        "response_time": now_iso(),
+        "timestamp": now_iso(),
+    }
+    record_ai_turn(ai_json)
+    if answer.sql:
+        store_last_query(str(chat_id), question, answer.sql)
+
+
+def answer_heavy(
+    question: str,
+    query: str,
+    user_id: str,
+    chat_id: str,
+    progress=None,
+    user_role: str = "public",
+    queued_at: Optional[float] = None,
+) -> Answer:
+    """
+    Run SQL the interactive lane deferred as too expensive (see HeavyQuery),
+    narrate the rows and record the turn. No deadline: nobody is blocked on
+    it, but the role's row cap, work_mem and HEAVY_STATEMENT_TIMEOUT_MS still apply.
+    A job queued (at `queued_at`, epoch seconds) before the same SQL finished
+    for the same role reuses those rows instead of running it again.
+    `progress(stage)` is called as each stage starts.
+    """
+    progress = progress or (lambda stage: None)
+    conn = None
+    cur = None
+    stage = "query"
+    try:
+        progress(stage)
+        limits = limits_for(user_role)
+        key = f"{limits.role}\n{canonical_sql(query)}"
+        shared = _shared_heavy_rows(key, queued_at)
+        rejected = False
+        if shared is not None:
+            incr_metrics("heavy:coalesced")
+            results, columns = shared
+        else:
+            conn, cur = db_breaker.call(_connect)
+            try:
+                # The job carries the SQL as written: the role's row cap applies here
+                _, to_run = _checked_query(query, cur, limits)
+                apply_limits(cur, limits, HEAVY_STATEMENT_TIMEOUT_MS)
+                results, columns = _run_query(question, to_run, cur, limits, HEAVY_STATEMENT_TIMEOUT_MS)
+                with _heavy_results_lock:
+                    _heavy_results[key] = (time.time(), results, columns)
+            except QueryRejected as e:
+                logging.info(f"Heavy query rejected by the resource guard: {e}")
+                incr_metrics("guard:rejected", f"guard:rejected:{e.reason}", "guard:rejected:heavy")
+                results, columns, rejected = [], [], True
+            except Exception as e:
+                if not is_db_timeout(e):
+                    raise
+                incr_metrics("guard:rejected", "guard:rejected:timeout", "guard:rejected:heavy")
+                results, columns, rejected = [], [], True
+
+        stage = "answer"
+        progress(stage)
+        if rejected:
+            final_text = QUERY_REJECTED_MESSAGE
+        elif results:
+            final_text = answer_breaker.call(lambda: query_to_result(results, columns, question))
+            if isinstance(final_text, tuple):
+                final_text, *_ = final_text
+        else:
+            final_text = NO_RESULTS_MESSAGE
+        answer = Answer(final_text)
+        answer.sql = query
+        if results:
+            answer.columns, answer.rows = columns, results
+
+        stage = "history"
+        _record_answer(user_id, chat_id, question, answer)
+        return answer
+    except Exception as e:
+        raise StageFailed(stage, e) from e
+    finally:
+        if cur is not None:
+            cur.close()
+        if conn is not None:
+            conn.close()
+
+
+def _shared_heavy_rows(key: str, queued_at: Optional[float]):
+    """
+    (rows, columns) a job queued at `queued_at` can reuse, or None. Jobs arrive
+    in queue order, so rows finished before this job was queued are of no use
+    to later ones either and are dropped.
+    """
+    if queued_at is None:
+        return None
+    with _heavy_results_lock:
+        for stale in [k for k, (finished_at, _, _) in _heavy_results.items() if finished_at < queued_at]:
+            del _heavy_results[stale]
+        entry = _heavy_results.get(key)
+    return entry[1:] if entry else None
+
+
+def _shared_answer(
+    question: str,
+    deadline: Optional[float],
+    followup: Optional[Followup] = None,
+    max_cost: Optional[float] = None,
+    limits: Optional[RoleLimits] = None,
+) -> Answer:
+    """
+    Identical (normalized) questions in flight share one answer. A follower
+    whose leader ran out of time tries again under its own deadline.
+    A follow-up is only the same question on top of the same previous SQL.
+    Roles have different resource limits, so they do not share answers.
+    """
+    limits = limits or limits_for(None)
+    key = normalize_question(question)
+    if followup is not None:
+        key += "\n" + canonical_sql(followup.previous_sql)
+    key += "\n" + limits.role
+    while True:
+        try:
+            return questions.do(key, lambda: _fresh_answer(key, question, deadline, followup, max_cost, limits))
+        except DeadlineExceeded:
+            if deadline is not None and time.time() >= deadline:
+                raise
+        except StageFailed as e:
+            if not isinstance(e.error, CircuitOpen):
+                raise
+            stale = _stale_answer(key, question, followup, limits)
+            if stale is None:
+                raise
+            return stale
+
+
+def _fresh_answer(
+    key: str,
+    question: str,
+    deadline: Optional[float],
+    followup: Optional[Followup] = None,
+    max_cost: Optional[float] = None,
+    limits: Optional[RoleLimits] = None,
+) -> Answer:
+    answer = _answer(question, deadline, followup, max_cost, limits)
+    if not isinstance(answer, Answer):
+        answer = Answer(answer)
+    store_answer(key, answer)
+    return answer
+
+
+def _stale_answer(
+    key: str,
+    question: str,
+    followup: Optional[Followup] = None,
+    limits: Optional[RoleLimits] = None,
+) -> Optional[Answer]:
+    """The cached answer for this question, marked stale, with a refresh queued; None if never answered."""
+    cached = get_cached_answer(key)
+    if cached is None:
+        return None
+    cached_at = cached["cached_at"][:16].replace("T", " ")
+    answer = Answer(STALE_ANSWER_NOTE.format(cached_at=cached_at) + cached["answer"])
+    answer.stale = True
+    answer.cached_at = cached["cached_at"]
+
+    with _refreshing_lock:
+        if key in _refreshing:
+            return answer
+        _refreshing.add(key)
+    _refresher.submit(_refresh, key, question, followup, limits)
+    return answer
+
+
+def _refresh(key: str, question: str, followup: Optional[Followup] = None, limits: Optional[RoleLimits] = None):
+    try:
+        # Wait until every breaker may probe, so the refresh is the half-open probe
+        time.sleep(max(breaker.retry_in() for breaker in BREAKERS))
+        questions.do(key, lambda: _fresh_answer(key, question, None, followup, None, limits))
+        logging.info("Stale answer refreshed in the background")
+    except Exception as e:
+        logging.info(f"Background refresh failed: {e}")
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+
+def _generate_sql(question: str, tier: str) -> str:
+    query = sql_breaker.call(lambda: question_to_query(question, tier))
+
+    logging.info(query)
+
+    if isinstance(query, tuple):
+        query, *_ = query
+    return query
 
-        logging.info(query)
 
-        if isinstance(query, tuple):
-            query, *_ = query
+def _followup_sql(question: str, followup: Followup) -> Optional[str]:
+    """The previous turn's SQL edited for the follow-up, or None to generate the SQL from scratch."""
+    if followup.sql is not None and validate_query(followup.sql):
+        incr_metrics("followup:rule")
+        logging.info(f"Follow-up applied to the previous SQL without the model: {followup.sql}")
+        return followup.sql
 
+    query = sql_breaker.call(lambda: edit_query(followup.previous_question, followup.previous_sql, question))
+    logging.info(query)
+    if isinstance(query, tuple):
+        query, *_ = query
+    if validate_query(query):
+        incr_metrics("followup:edit")
+        return query
+    incr_metrics("followup:fallback")
+    return None
+
+
+def _escalate(question: str, reason: str, deadline: Optional[float], error: Optional[Exception] = None):
+    """Regenerate the SQL with the large model after the small model's SQL was rejected."""
+    check_deadline(deadline, "sql_generation")
+    incr_metrics("escalated", f"escalated:{reason}")
+    logging.info(f"Escalating SQL generation to {COMPLEX} model ({reason}{': ' + str(error) if error else ''})")
+    return COMPLEX, _generate_sql(question, COMPLEX)
+
+
+def _run_with_repair(
+    question: str,
+    query: str,
+    tier: str,
+    conn,
+    cur,
+    deadline: Optional[float],
+    max_cost: Optional[float] = None,
+    limits: Optional[RoleLimits] = None,
+):
+    """
+    EXPLAIN the query first (syntax errors and unknown columns surface without
+    a scan), then run it. If PostgreSQL rejects it, the error and the failing
+    SQL go back to the large model for a corrected query, at most
+    REPAIR_ATTEMPTS times. Returns the query that worked with its rows.
+    The plan is checked against the role's limits (guard.py), which raises
+    QueryRejected; a query planned above max_cost raises HeavyQuery instead
+    of running.
+    """
+    limits = limits or limits_for(None)
+    attempt = 0
+    while True:
+        try:
+            plan, to_run = _checked_query(query, cur, limits)
+            if max_cost is not None and plan is not None and plan.cost > max_cost:
+                raise HeavyQuery(query, plan.cost, question)
+            apply_limits(cur, limits)
+            results, columns = _run_query(question, to_run, cur, limits)
+            if attempt:
+                incr_metrics("repair:succeeded")
+            return query, results, columns
+        except Exception as e:
+            if isinstance(e, (CircuitOpen, HeavyQuery, QueryRejected)) or is_db_outage(e):
+                raise
+            if is_db_timeout(e):
+                raise QueryRejected("timeout", limits.role, limit=limits.statement_timeout_ms) from e
+            conn.rollback()
+            if attempt >= REPAIR_ATTEMPTS:
+                incr_metrics("repair:failed")
+                logging.info(f"SQL still failing after {attempt} repair attempt(s): {e}")
+                raise _RepairFailed() from e
+            error = e
+
+        attempt += 1
+        check_deadline(deadline, "sql_generation")
+        if tier != COMPLEX:
+            tier = COMPLEX
+            incr_metrics("escalated", "escalated:execution")
+        incr_metrics("repair:attempt")
+        logging.info(f"Repairing SQL (attempt {attempt}/{REPAIR_ATTEMPTS}): {error}")
+        query = sql_breaker.call(lambda: repair_query(question, query, str(error), tier))
+        logging.info(query)
         if not validate_query(query):
-            return "درخواست نامعتبر است."
+            incr_metrics("repair:failed")
+            raise _RepairFailed()
+
+
+def _checked_query(query: str, cur, limits: RoleLimits):
+    """The query's plan (cached) and the SQL to run for the role: capped at max_rows, or QueryRejected."""
+    plan = plans.get(query)
+    if plan is None:
+        plan = db_breaker.call(lambda: explain_query(query, cur))
+        plans.put(query, plan)
+    to_run = check_plan(query, plan, limits)
+    if to_run is not query:
+        incr_metrics("guard:capped", f"guard:capped:{limits.role}")
+    return plan, to_run
+
+
+def _run_query(question: str, query: str, cur, limits: RoleLimits, statement_timeout_ms: Optional[int] = None):
+    """
+    Different questions can still produce the same SQL. Only runs under the
+    same limits share an execution: it runs on the leader's cursor, with the
+    leader's statement_timeout and work_mem (apply_limits). The leader logs it
+    (querylog.py), once, with the database time rather than a follower's wait.
+    """
+    timeout = statement_timeout_ms or limits.statement_timeout_ms
+    key = f"{limits.role}\n{timeout}\n{canonical_sql(query)}"
+
+    def run():
+        t0 = time.perf_counter()
+        results, columns = db_breaker.call(lambda: execute_query(query, cur))
+        record_query(question, query, (time.perf_counter() - t0) * 1000, len(results), limits.role)
+        return results, columns
+
+    return queries.do(key, run)
+
+
+def _connect():
+    conn, cur = connect_to_db()
+    if not cur or not conn:
+        raise ConnectionError("عدم امکان اتصال به پایگاه داده.")
+    return conn, cur
+
+
+def _answer(
+    question: str,
+    deadline: Optional[float],
+    followup: Optional[Followup] = None,
+    max_cost: Optional[float] = None,
+    limits: Optional[RoleLimits] = None,
+) -> str:
+    """Stages 2-4: generate SQL, run it, and narrate the rows (or LIKE suggestions)."""
+    conn = None
+    cur = None
+    stage = "sql_generation"
+    try:
+        # 2) Generate SQL: a follow-up edits the previous SQL, any other question
+        #    goes to the model tier its complexity calls for
+        check_deadline(deadline, stage)
+        query = None
+        if followup is not None:
+            tier = SIMPLE
+            query = _followup_sql(question, followup)
+            # Repair and narration need the context the follow-up leaves out
+            question = followup.standalone(question)
+
+        if query is None:
+            route = classify(question)
+            incr_metrics(f"route:{route.tier}")
+            logging.info(f"Routing to {route.tier} SQL model (score={route.score}, {route.features})")
+            tier = route.tier
+            query = _generate_sql(question, tier)
+
+            if not validate_query(query) and tier != COMPLEX:
+                tier, query = _escalate(question, "validation", deadline)
+
+            if not validate_query(query):
+                return "درخواست نامعتبر است."
 
 
         # 3) Execute query
-        conn, cur = connect_to_db()
-        if not cur or not conn:
-            return "عدم امکان اتصال به پایگاه داده."
+        check_deadline(deadline, "query")
+        stage = "query"
+        conn, cur = db_breaker.call(_connect)
 
-        results, columns = execute_query(query, cur)
+        try:
+            query, results, columns = _run_with_repair(question, query, tier, conn, cur, deadline, max_cost, limits)
+        except _RepairFailed:
+            return REPAIR_FAILED_MESSAGE
+        except QueryRejected as e:
+            logging.info(f"Query rejected by the resource guard: {e}")
+            incr_metrics("guard:rejected", f"guard:rejected:{e.reason}", f"guard:rejected:{e.role}")
+            return QUERY_REJECTED_MESSAGE
         if not results:
             print("Query executed: no rows returned.")
         else:
@@ -101,6 +535,8 @@ def talk_to_db(
 
 
         # 4) Check if original query returned results
+        check_deadline(deadline, "answer")
+        stage = "answer"
         if not results or results[0][0] == Decimal('0.00') or results is None:
             print("Original query returned no results.")
             # Check for LIKE suggestions
@@ -137,7 +573,9 @@ def talk_to_db(
                             if suggestion_results:
                                 print(f"Suggestion query executed: {len(suggestion_results)} rows returned.")
                                 # Convert suggestion result to Persian answer using second LLM
-                                suggestion_answer = query_to_result(suggestion_results, suggestion_columns, suggestion)
+                                suggestion_answer = answer_breaker.call(
+                                    lambda: query_to_result(suggestion_results, suggestion_columns, suggestion)
+                                )
                                 if isinstance(suggestion_answer, tuple):
                                     suggestion_answer, *_ = suggestion_answer
                                 
@@ -166,41 +604,25 @@ def talk_to_db(
         else:
             # Original query returned results - process normally with second LLM
             t0 = time.time()
-            final_answer = query_to_result(results, columns, question)
+            final_answer = answer_breaker.call(lambda: query_to_result(results, columns, question))
             if isinstance(final_answer, tuple):
                 final_text, a_tokens, a_model = final_answer
             else:
                 final_text, a_tokens, a_model = final_answer, None, "gpt-5-mini"
             dt = time.time() - t0
 
-        # 5) Save AI response JSON
-        ai_json = {
-            "user_id": str(user_id),
-            "chat_id": str(chat_id),
-            "content": final_text,
-            "ai_response_metadata": json.dumps(
-                {
-                    "model": "gpt-5-mini",
-                    "processing_time": "0s",
-                    "suggested_title": "عنوان پیشنهادی",
-                },
-                ensure_ascii=False,
-            ),
-            "ai_references": json.dumps([{"title": "سورس نمونه"}], ensure_ascii=False),
-            "tokens_used": "",
-            "response_time": now_iso(),
-            "timestamp": now_iso(),
-        }
-        save_ai_response_json(ai_json)
-
-        # 6) Update history with assistant message
-        push_last_twenty_message(chat_id, "assistant", final_text)
-
-        return final_text
+        answer = Answer(final_text)
+        answer.sql = query
+        if results:
+            answer.columns, answer.rows = columns, results
+        return answer
 
+    except (DeadlineExceeded, HeavyQuery):
+        raise
     except Exception as e:
-
-        return f"خطا در اجرای درخواست: {str(e)}"
+        raise StageFailed(stage, e) from e
     finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+        if cur is not None:
+            cur.close()
+        if conn is not None:
+            conn.close()
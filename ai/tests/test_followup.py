@@ -0,0 +1,47 @@
+import pytest
+from talk_to_db.followup import apply_edit, detect, is_followup
+
+PREVIOUS = {
+    "question": "صادرات به عراق در سال ۱۴۰۰",
+    "sql": "SELECT SUM(dollar) FROM final_true WHERE type = 'صادرات' AND country = 'عراق' AND year = 1400",
+}
+
+
+@pytest.mark.parametrize("question", [
+    "همین برای ۱۴۰۱",
+    "همون رو برای واردات",
+    "حالا فقط صادرات",
+    "۱۴۰۱؟",
+    "what about 1401?",
+    "same for imports",
+    "and for Iraq, same thing",
+])
+def test_followups(question):
+    assert is_followup(question)
+
+
+@pytest.mark.parametrize("question", [
+    # Short, and starting with a word follow-ups also start with, but asking something new
+    "how many countries did Iran trade with",
+    "what were total exports in 1400?",
+    "در سال ۱۴۰۰ چقدر صادرات داشتیم؟",
+    "برای عراق چقدر صادرات داشتیم",
+    "فقط کشورهای همسایه",
+    "countries that imported cars in 1400",
+    # Refers back, but too long to be an edit of the previous question
+    "same countries but split by month and product group and sorted by value",
+])
+def test_standalone_questions(question):
+    assert not is_followup(question)
+    assert detect(question, PREVIOUS) is None
+
+
+def test_detect_edits_the_previous_sql():
+    followup = detect("همین برای ۱۴۰۱", PREVIOUS)
+    assert followup.previous_question == PREVIOUS["question"]
+    assert followup.sql == PREVIOUS["sql"].replace("1400", "1401")
+
+    # Nothing to edit without a previous query
+    assert detect("همین برای ۱۴۰۱", None) is None
+    # Anything beyond the year, month or type is left to the model
+    assert apply_edit("same for Iraq", PREVIOUS["sql"]) is None
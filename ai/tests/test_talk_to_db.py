@@ -0,0 +1,99 @@
+import importlib
+import time
+import pytest
+from talk_to_db.guard import PlanCache, limits_for
+
+# The package exports the talk_to_db function under the module's name
+t = importlib.import_module("talk_to_db.talk_to_db")
+
+QUERY = "SELECT country, dollar FROM final_true WHERE year = 1400"
+
+
+class FakeCursor:
+    """The analytics database: EXPLAIN estimates `rows` rows; every query returns one."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+        self.result = []
+        self.description = [("country",), ("dollar",)]
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+        if sql.startswith("EXPLAIN"):
+            self.result = [([{"Plan": {"Total Cost": 1e7, "Plan Rows": self.rows}}],)]
+        elif not sql.startswith("SET"):
+            self.result = [("عراق", 10)]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def heavy_lane(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(t, "plans", PlanCache(0, 0))
+    monkeypatch.setattr(t, "_heavy_results", {})
+    monkeypatch.setattr(t, "incr_metrics", lambda *names: None)
+    monkeypatch.setattr(t, "record_query", lambda *args: None)
+    monkeypatch.setattr(t, "query_to_result", lambda rows, columns, question: "پاسخ")
+    monkeypatch.setattr(t, "_record_answer", lambda user_id, chat_id, question, answer: recorded.append(answer))
+    return recorded
+
+
+def run_heavy(monkeypatch, cur, role, queued_at=None):
+    monkeypatch.setattr(t, "_connect", lambda: (FakeConnection(), cur))
+    return t.answer_heavy("صادرات به تفکیک کشور", QUERY, "1", "2", user_role=role, queued_at=queued_at)
+
+
+def test_public_heavy_job_over_max_rows_is_capped(heavy_lane, monkeypatch):
+    max_rows = limits_for("public").max_rows
+    cur = FakeCursor(rows=max_rows * 10)
+    answer = run_heavy(monkeypatch, cur, "public")
+    assert cur.executed[-1] == f"SELECT * FROM ({QUERY}) AS capped LIMIT {max_rows}"
+    # The turn keeps the SQL as written, for follow-ups to edit
+    assert answer.sql == QUERY
+    assert heavy_lane == [answer]
+
+
+def test_heavy_job_under_max_rows_runs_as_written(heavy_lane, monkeypatch):
+    cur = FakeCursor(rows=limits_for("public").max_rows)
+    run_heavy(monkeypatch, cur, "public")
+    assert cur.executed[-1] == QUERY
+
+    # Admins have no row cap
+    cur = FakeCursor(rows=10_000_000)
+    run_heavy(monkeypatch, cur, "admin")
+    assert cur.executed[-1] == QUERY
+
+
+def test_heavy_jobs_queued_together_run_the_sql_once(heavy_lane, monkeypatch):
+    # Identical questions in flight each deferred a job before the first one ran
+    queued_at = time.time()
+    first = FakeCursor(rows=10)
+    run_heavy(monkeypatch, first, "public", queued_at)
+    assert first.executed[-1] == QUERY
+
+    second = FakeCursor(rows=10)
+    answer = run_heavy(monkeypatch, second, "public", queued_at)
+    assert second.executed == []
+    assert answer.rows == [("عراق", 10)]
+    assert len(heavy_lane) == 2
+
+    # Other roles have other limits
+    admin = FakeCursor(rows=10)
+    run_heavy(monkeypatch, admin, "admin", queued_at)
+    assert admin.executed[-1] == QUERY
+
+    # Asked after the rows were read: runs again
+    later = FakeCursor(rows=10)
+    run_heavy(monkeypatch, later, "public", time.time() + 1)
+    assert later.executed[-1] == QUERY
@@ -1,8 +1,11 @@
 from django.contrib.auth.signals import user_logged_in, user_login_failed, user_logged_out
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 from django.contrib.auth import get_user_model
-from .models import UserSecurity
+from .models import UserSecurity, UserRole
+from apps.chat.conditional import bump_profile_version
+from apps.chat.user_cache import invalidate_user_snapshot
 
 User = get_user_model()
 
@@ -37,6 +40,26 @@ def handle_user_logged_out(sender, request, user, **kwargs):
     print(f"User {user.email} logged out at {timezone.now()}")
 
 
+@receiver(post_save, sender=User)
+def invalidate_profile_on_user_change(sender, instance, **kwargs):
+    bump_profile_version(instance.pk)
+    invalidate_user_snapshot(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_snapshot_on_user_delete(sender, instance, **kwargs):
+    invalidate_user_snapshot(instance.pk)
+
+
+@receiver(post_save, sender=UserSecurity)
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+def invalidate_profile_on_related_change(sender, instance, **kwargs):
+    bump_profile_version(instance.user_id)
+    if sender is UserRole:
+        invalidate_user_snapshot(instance.user_id)
+
+
 def get_client_ip(request):
     x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
     if x_forwarded_for:
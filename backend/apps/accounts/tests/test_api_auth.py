@@ -193,3 +193,21 @@ def test_register_validates_email_format(api_client):
         )
         assert r.status_code == 400
         assert "email" in r.data
+
+@pytest.mark.django_db
+def test_me_endpoint_conditional_get(api_client, user, monkeypatch):
+    version = {"value": "3"}
+    monkeypatch.setattr("apps.accounts.views.get_profile_version", lambda user_id: version["value"])
+    api_client.force_authenticate(user=user)
+
+    r = api_client.get(ME_URL)
+    assert r.status_code == 200
+    etag = r["ETag"]
+
+    r = api_client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+    assert r.status_code == 304
+
+    version["value"] = "4"
+    r = api_client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+    assert r.status_code == 200
+    assert r.data["email"] == user.email
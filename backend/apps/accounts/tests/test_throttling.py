@@ -0,0 +1,67 @@
+import pytest
+from django.contrib.auth import get_user_model
+from redis.exceptions import RedisError
+import apps.accounts.throttling as throttling
+from apps.accounts.throttling import parse_rate, hit, _script_args
+
+User = get_user_model()
+
+CHATS_URL = "/api/chat/active/"
+
+
+class DownRedis:
+    def register_script(self, script):
+        def call(keys, args):
+            raise RedisError("connection refused")
+        return call
+
+
+@pytest.fixture
+def user_client(api_client, db):
+    user = User.objects.create_user(email="throttle@example.com", password="pass1234")
+    api_client.force_authenticate(user=user)
+    return api_client
+
+
+def test_parse_rate():
+    assert parse_rate("10/minute") == (10, 60)
+    assert parse_rate("3/hour") == (3, 3600)
+    assert parse_rate(None) is None
+
+
+def test_script_args_keep_rates_apart():
+    keys, args = _script_args([("throttle_user_1", 20, 60), ("throttle_user_1", 120, 60)])
+    assert keys == ["ratelimit:throttle_user_1:20/60", "ratelimit:throttle_user_1:120/60"]
+    assert args == [20, 3000, 120, 500]
+
+
+def test_hit_returns_none_when_redis_down(monkeypatch):
+    monkeypatch.setattr(throttling, "_script", None)
+    monkeypatch.setattr(throttling, "_down_since", None)
+    monkeypatch.setattr(throttling, "get_sync_redis_connection", lambda: DownRedis())
+    assert hit([("k", 1, 60)]) is None
+    # Backs off instead of retrying Redis on the next call
+    assert throttling._down_since is not None
+
+
+@pytest.mark.django_db
+def test_denied_request_returns_retry_after(user_client, monkeypatch):
+    monkeypatch.setattr(throttling, "hit", lambda limits: (False, 12.0))
+    response = user_client.get(CHATS_URL)
+    assert response.status_code == 429
+    assert response["Retry-After"] == "12"
+
+
+@pytest.mark.django_db
+def test_allowed_request_passes(user_client, monkeypatch):
+    calls = []
+    monkeypatch.setattr(throttling, "hit", lambda limits: calls.append(limits) or (True, 0.0))
+    response = user_client.get(CHATS_URL)
+    assert response.status_code == 200
+    assert calls and calls[0][0][0].startswith("throttle_user_")
+
+
+@pytest.mark.django_db
+def test_falls_back_to_local_cache(user_client, monkeypatch):
+    monkeypatch.setattr(throttling, "hit", lambda limits: None)
+    assert user_client.get(CHATS_URL).status_code == 200
@@ -0,0 +1,134 @@
+import time
+import logging
+from redis.exceptions import RedisError
+from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+from apps.chat.redis_config import get_sync_redis_connection
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "ratelimit:"
+# After a Redis failure, throttles use the local cache for this long instead
+# of paying a connection timeout on every request
+RETRY_AFTER_SECONDS = 5
+
+# Token bucket in GCRA form, checked and updated atomically for every key.
+# The request is allowed only if every bucket has room; nothing is consumed
+# otherwise. Redis TIME is the clock, so all nodes agree.
+# KEYS[i] = bucket, ARGV[2i-1] = burst (requests per period), ARGV[2i] = ms per request
+# Returns {allowed (1/0), ms until allowed}
+_GCRA_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local wait = 0
+local tats = {}
+for i, key in ipairs(KEYS) do
+    local burst = tonumber(ARGV[2 * i - 1])
+    local interval = tonumber(ARGV[2 * i])
+    local tat = tonumber(redis.call('GET', key)) or now
+    if tat < now then tat = now end
+    local new_tat = tat + interval
+    local allow_at = new_tat - burst * interval
+    if allow_at - now > wait then wait = allow_at - now end
+    tats[i] = new_tat
+end
+if wait > 0 then
+    return {0, wait}
+end
+for i, key in ipairs(KEYS) do
+    redis.call('SET', key, tats[i], 'PX', tats[i] - now)
+end
+return {1, 0}
+"""
+
+_DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+_down_since = None
+_script = None
+
+
+def parse_rate(rate):
+    """'10/minute' -> (10, 60), the same format DRF throttles use. None stays None."""
+    if rate is None:
+        return None
+    num, period = rate.split('/')
+    return int(num), _DURATIONS[period[0]]
+
+
+def _script_args(limits):
+    keys, args = [], []
+    for key, num_requests, duration in limits:
+        keys.append(f"{KEY_PREFIX}{key}:{num_requests}/{duration}")
+        args += [num_requests, max(1, duration * 1000 // num_requests)]
+    return keys, args
+
+
+def _result(raw):
+    allowed, wait_ms = raw
+    return bool(allowed), int(wait_ms) / 1000.0
+
+
+def hit(limits):
+    """
+    Count one request against every (key, num_requests, duration) bucket in
+    one round trip. Returns (allowed, retry_after_seconds), or None when Redis
+    is unavailable so the caller can pick its own fallback.
+    """
+    global _down_since, _script
+    if _down_since is not None and time.monotonic() - _down_since < RETRY_AFTER_SECONDS:
+        return None
+    keys, args = _script_args(limits)
+    try:
+        if _script is None:
+            _script = get_sync_redis_connection().register_script(_GCRA_LUA)
+        raw = _script(keys=keys, args=args)
+    except RedisError as e:
+        if _down_since is None:
+            logger.warning(f"Rate limiter unavailable, using local cache: {e}")
+        _down_since = time.monotonic()
+        return None
+    _down_since = None
+    return _result(raw)
+
+
+async def ahit(redis_conn, limits):
+    """Async variant of hit() on an existing asyncio Redis client."""
+    keys, args = _script_args(limits)
+    try:
+        raw = await redis_conn.register_script(_GCRA_LUA)(keys=keys, args=args)
+    except RedisError as e:
+        logger.warning(f"Rate limiter unavailable: {e}")
+        return None
+    return _result(raw)
+
+
+class RedisThrottleMixin:
+    """
+    DRF throttle backed by the shared Redis limiter, so limits hold across
+    all ASGI processes. Falls back to DRF's cache-based check if Redis is down.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        result = hit([(self.key, self.num_requests, self.duration)])
+        if result is None:
+            self.retry_after = None
+            return super().allow_request(request, view)
+        allowed, self.retry_after = result
+        return allowed
+
+    def wait(self):
+        if self.retry_after is None:
+            return super().wait()
+        return self.retry_after
+
+
+class RedisAnonRateThrottle(RedisThrottleMixin, AnonRateThrottle):
+    pass
+
+
+class RedisUserRateThrottle(RedisThrottleMixin, UserRateThrottle):
+    pass
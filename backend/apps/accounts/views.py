@@ -5,7 +5,7 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework_simplejwt.tokens import AccessToken
 from .serializers import RegisterSerializer, MeSerializer, APILoginSerializer, ForgotPasswordSerializer, ResetPasswordSerializer, LogoutSerializer, ChangePasswordSerializer
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+from .throttling import RedisAnonRateThrottle, RedisUserRateThrottle
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
@@ -16,14 +16,15 @@ from datetime import timedelta
 from .models import PasswordResetToken, EmailVerificationToken
 from rest_framework.exceptions import ValidationError
 from rest_framework.decorators import action
+from apps.chat.conditional import ConditionalGetMixin, get_profile_version
 
-class CustomAnonThrottle(AnonRateThrottle):
+class CustomAnonThrottle(RedisAnonRateThrottle):
     rate = '5/minute'
 
-class CustomUserThrottle(UserRateThrottle):
+class CustomUserThrottle(RedisUserRateThrottle):
     rate = '20/minute'
 
-class EmailThrottle(AnonRateThrottle):
+class EmailThrottle(RedisAnonRateThrottle):
     rate = '3/hour'
 
 class RegisterView(generics.CreateAPIView):
@@ -70,7 +71,7 @@ class RefreshView(TokenRefreshView):
     permission_classes = [AllowAny]
     throttle_classes = [CustomAnonThrottle]
 
-class MeView(generics.RetrieveUpdateAPIView):
+class MeView(ConditionalGetMixin, generics.RetrieveUpdateAPIView):
     permission_classes = [IsAuthenticated]
     throttle_classes = [CustomUserThrottle]
     serializer_class = MeSerializer
@@ -79,6 +80,13 @@ class MeView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         return self.request.user
 
+    def get_etag(self, request):
+        # Bumped on any user, security or role change (see signals.py)
+        version = get_profile_version(request.user.id)
+        if version is None:
+            return None
+        return f"me-{request.user.id}-{version}"
+
     def patch(self, request, *args, **kwargs):
         partial = True
         instance = self.get_object()
@@ -0,0 +1,75 @@
+import time
+from apps.chat.redis_config import (
+    CHAT_STREAM_KEY,
+    DEAD_LETTER_STREAM_KEY,
+    AI_RESPONSE_DEADLINE_SECONDS,
+)
+
+# Fields the AI worker adds when it dead-letters a question
+DLQ_PREFIX = "dlq_"
+# Tells the worker to answer through the job event stream (see replay_dead_letter)
+REPLAYED_FIELD = "replayed"
+
+
+def _entry(entry_id, fields):
+    request = {k: v for k, v in fields.items() if not k.startswith(DLQ_PREFIX)}
+    return {
+        'id': entry_id,
+        'stage': fields.get('dlq_stage'),
+        'error': fields.get('dlq_error'),
+        'attempts': int(fields.get('dlq_attempts') or 0),
+        'failed_at': float(fields['dlq_failed_at']) if fields.get('dlq_failed_at') else None,
+        'original_entry_id': fields.get('dlq_entry_id'),
+        'chat_id': request.get('chat_id'),
+        'user_id': request.get('user_id'),
+        'message_id': request.get('message_id'),
+        'content': request.get('content'),
+    }
+
+
+def list_dead_letters(conn, count=50, before=None):
+    """Newest first; pass the last id of a page as `before` to get the next one."""
+    max_id = f"({before}" if before else '+'
+    entries = conn.xrevrange(DEAD_LETTER_STREAM_KEY, max=max_id, min='-', count=count)
+    return {
+        'total': conn.xlen(DEAD_LETTER_STREAM_KEY),
+        'results': [_entry(entry_id, fields) for entry_id, fields in entries],
+    }
+
+
+def replay_dead_letter(conn, entry_id):
+    """
+    Put the question back on the AI stream with a fresh deadline and remove it
+    from the dead-letter stream. Returns the new stream entry id, or None if
+    there is no such dead letter.
+
+    The consumer that asked stopped waiting when the question failed, so it is
+    marked as replayed: the worker then answers it with job events, which
+    relay_ai_job_events saves as the chat's assistant message (apps.chat.jobs).
+    """
+    entries = conn.xrange(DEAD_LETTER_STREAM_KEY, min=entry_id, max=entry_id)
+    if not entries:
+        return None
+    _, fields = entries[0]
+    request = {k: v for k, v in fields.items() if not k.startswith(DLQ_PREFIX)}
+    request['deadline'] = f"{time.time() + AI_RESPONSE_DEADLINE_SECONDS:.3f}"
+    request[REPLAYED_FIELD] = "1"
+
+    pipe = conn.pipeline()
+    pipe.xadd(CHAT_STREAM_KEY, request, maxlen=10000, approximate=True)
+    pipe.xdel(DEAD_LETTER_STREAM_KEY, entry_id)
+    new_id, _ = pipe.execute()
+    return new_id
+
+
+def delete_dead_letter(conn, entry_id):
+    return bool(conn.xdel(DEAD_LETTER_STREAM_KEY, entry_id))
+
+
+def purge_dead_letters(conn):
+    """Drop every dead letter; returns how many there were."""
+    pipe = conn.pipeline()
+    pipe.xlen(DEAD_LETTER_STREAM_KEY)
+    pipe.delete(DEAD_LETTER_STREAM_KEY)
+    count, _ = pipe.execute()
+    return count
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from apps.chat.redis_config import get_sync_redis_connection
+from apps.adminpanel.redis_memory import build_memory_report, store_memory_report
+
+
+class Command(BaseCommand):
+    help = "Scan Redis, aggregate memory usage by key family and store the report for the admin panel. Run periodically (e.g. from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scan-count", type=int, default=1000, help="COUNT hint passed to SCAN")
+
+    def handle(self, *args, **options):
+        conn = get_sync_redis_connection()
+        report = build_memory_report(conn, scan_count=options["scan_count"])
+        store_memory_report(conn, report)
+
+        self.stdout.write(f"{report['total_keys']} keys, {report['total_bytes']} bytes")
+        for row in report["families"][:20]:
+            self.stdout.write(
+                f"{row['family']}: {row['keys']} keys, {row['bytes']} bytes, {row['without_ttl']} without TTL"
+            )
@@ -0,0 +1,77 @@
+import re
+import json
+from django.utils import timezone
+
+REPORT_KEY = "admin:redis_memory_report"
+REPORT_TTL_SECONDS = 24 * 3600
+
+_UUID_RE = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+_NUMBER_RE = re.compile(r"(?<=[:_])\d+(?=$|[:_])")
+
+
+def key_family(key):
+    """Collapse ids in a key so e.g. chat:12:last_twenty and chat:9:last_twenty share a family."""
+    family = _UUID_RE.sub("{id}", key)
+    return _NUMBER_RE.sub("{id}", family)
+
+
+def build_memory_report(conn, scan_count=1000, batch_size=500):
+    """
+    Walk the keyspace with SCAN (never KEYS) and sum MEMORY USAGE per key family.
+    Memory usage and TTL are fetched through one pipeline per batch of keys.
+    """
+    families = {}
+
+    def flush(batch):
+        pipe = conn.pipeline(transaction=False)
+        for key in batch:
+            pipe.memory_usage(key)
+            pipe.ttl(key)
+        values = pipe.execute()
+        for i, key in enumerate(batch):
+            usage, ttl = values[2 * i], values[2 * i + 1]
+            stats = families.setdefault(key_family(key), {"keys": 0, "bytes": 0, "without_ttl": 0})
+            stats["keys"] += 1
+            stats["bytes"] += usage or 0
+            if ttl == -1:
+                stats["without_ttl"] += 1
+
+    batch = []
+    for key in conn.scan_iter(count=scan_count):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    rows = [
+        {
+            "family": family,
+            "keys": stats["keys"],
+            "bytes": stats["bytes"],
+            "avg_bytes": stats["bytes"] // stats["keys"],
+            "without_ttl": stats["without_ttl"],
+        }
+        for family, stats in families.items()
+    ]
+    rows.sort(key=lambda row: row["bytes"], reverse=True)
+
+    info = conn.info("memory")
+    return {
+        "generated_at": timezone.now().isoformat(),
+        "used_memory": info.get("used_memory"),
+        "maxmemory": info.get("maxmemory"),
+        "total_keys": sum(row["keys"] for row in rows),
+        "total_bytes": sum(row["bytes"] for row in rows),
+        "families": rows,
+    }
+
+
+def store_memory_report(conn, report):
+    conn.set(REPORT_KEY, json.dumps(report), ex=REPORT_TTL_SECONDS)
+
+
+def get_stored_memory_report(conn):
+    raw = conn.get(REPORT_KEY)
+    return json.loads(raw) if raw else None
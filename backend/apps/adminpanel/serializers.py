@@ -12,7 +12,8 @@ from django.conf import settings
 from datetime import timedelta
 import secrets
 import logging
-from apps.chat.models import Chat, Message
+from apps.chat.models import Chat, Message, DeletionJob
+from apps.querylog.models import QueryTemplate, QueryExecution
 
 logger = logging.getLogger(__name__)
 
@@ -349,9 +350,18 @@ class AdminMessageSerializer(serializers.ModelSerializer):
         ]
 
 
+class AdminMessageSearchSerializer(AdminMessageSerializer):
+    chat_id = serializers.IntegerField(read_only=True)
+    user = serializers.StringRelatedField(source='chat.user')
+    snippet = serializers.CharField(read_only=True)
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta(AdminMessageSerializer.Meta):
+        fields = AdminMessageSerializer.Meta.fields + ['chat_id', 'user', 'snippet', 'rank']
+
+
 class AdminChatListSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField()
-    message_count = serializers.IntegerField(source='messages.count', read_only=True)
 
     class Meta:
         model = Chat
@@ -372,7 +382,67 @@ class AdminChatDetailSerializer(AdminChatListSerializer):
     class Meta(AdminChatListSerializer.Meta):
         fields = AdminChatListSerializer.Meta.fields + ['messages']
 
+class AdminDeletionJobSerializer(serializers.ModelSerializer):
+    requested_by = serializers.StringRelatedField()
+    progress = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = DeletionJob
+        fields = [
+            'id',
+            'target_type',
+            'target_id',
+            'target_label',
+            'requested_by',
+            'status',
+            'total_items',
+            'deleted_items',
+            'progress',
+            'error',
+            'created_at',
+            'started_at',
+            'finished_at',
+        ]
+
 class AdminErrorLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = ErrorLog
         fields = '__all__'
+
+
+class AdminQueryExecutionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = QueryExecution
+        fields = ['question_hash', 'sql', 'duration_ms', 'row_count', 'role', 'executed_at']
+
+
+class AdminQueryTemplateSerializer(serializers.ModelSerializer):
+    avg_ms = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = QueryTemplate
+        fields = [
+            'id',
+            'template',
+            'sample_sql',
+            'executions',
+            'avg_ms',
+            'max_ms',
+            'total_ms',
+            'total_rows',
+            'first_seen',
+            'last_seen',
+            'plan',
+            'plan_sql',
+            'plan_captured_at',
+        ]
+
+
+class AdminQueryTemplateDetailSerializer(AdminQueryTemplateSerializer):
+    recent_runs = serializers.SerializerMethodField()
+
+    class Meta(AdminQueryTemplateSerializer.Meta):
+        fields = AdminQueryTemplateSerializer.Meta.fields + ['recent_runs']
+
+    def get_recent_runs(self, obj):
+        return AdminQueryExecutionSerializer(obj.runs.all()[:20], many=True).data
@@ -0,0 +1,77 @@
+import pytest
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from apps.adminpanel.redis_memory import key_family, build_memory_report, store_memory_report
+
+User = get_user_model()
+
+
+def test_key_family_collapses_ids():
+    assert key_family("chat:12:last_twenty") == "chat:{id}:last_twenty"
+    assert key_family("chat:7:latest_ai_json") == "chat:{id}:latest_ai_json"
+    assert key_family("msg_map:0b8e3a52-2c1f-4a4e-9d3f-1f2e3d4c5b6a") == "msg_map:{id}"
+    assert key_family("asgi:group:chat_3_41") == "asgi:group:chat_{id}_{id}"
+    assert key_family("chat_stream") == "chat_stream"
+
+
+def test_build_memory_report_groups_by_family(fake_redis):
+    fake_redis.sizes = {
+        "chat:1:last_twenty": 100,
+        "chat:2:last_twenty": 300,
+        "chat:1:latest_ai_json": 5000,
+        "chat_stream": 50,
+    }
+    fake_redis.ttls = {"chat:1:last_twenty": 60, "chat:1:latest_ai_json": 60}
+    fake_redis.used_memory = 4096
+    report = build_memory_report(fake_redis, batch_size=3)
+
+    assert report["total_keys"] == 4
+    assert report["total_bytes"] == 5450
+    assert report["used_memory"] == 4096
+    families = {row["family"]: row for row in report["families"]}
+    assert report["families"][0]["family"] == "chat:{id}:latest_ai_json"
+    assert families["chat:{id}:last_twenty"] == {
+        "family": "chat:{id}:last_twenty",
+        "keys": 2,
+        "bytes": 400,
+        "avg_bytes": 200,
+        "without_ttl": 1,
+    }
+
+
+@pytest.mark.django_db
+def test_redis_memory_requires_superuser():
+    user = User.objects.create_user(email="plain@example.com", password="pass1234")
+    client = APIClient()
+    client.force_authenticate(user=user)
+    response = client.get(reverse("adminpanel:redis-memory-list"))
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_redis_memory_only_scans_on_refresh(fake_redis, monkeypatch):
+    admin = User.objects.create_superuser(email="boss@example.com", password="pass1234")
+    client = APIClient()
+    client.force_authenticate(user=admin)
+    url = reverse("adminpanel:redis-memory-list")
+    fake_redis.sizes = {"chat:1:last_twenty": 100}
+    scans = []
+    scan_iter = fake_redis.scan_iter
+    monkeypatch.setattr(fake_redis, "scan_iter", lambda **kwargs: scans.append(kwargs) or scan_iter(**kwargs))
+
+    # No stored report: nothing is built in the request
+    response = client.get(url)
+    assert response.status_code == 404
+    assert scans == []
+
+    store_memory_report(fake_redis, {"total_keys": 7})
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.json() == {"total_keys": 7}
+    assert scans == []
+
+    response = client.get(url, {"refresh": "1"})
+    assert response.status_code == 200
+    assert "chat:{id}:last_twenty" in [row["family"] for row in response.json()["families"]]
+    assert len(scans) == 1
@@ -0,0 +1,58 @@
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from apps.querylog.models import QueryTemplate, QueryExecution
+
+User = get_user_model()
+
+
+@pytest.fixture
+def templates(db):
+    # avg 500 ms over 10 runs vs. one 3 s run
+    frequent = QueryTemplate.objects.create(
+        template_hash="a" * 40, template="select sum(dollar) from final_true where year = ?",
+        sample_sql="select sum(dollar) from final_true where year = 1402",
+        executions=10, total_ms=5000, max_ms=900,
+    )
+    slowest = QueryTemplate.objects.create(
+        template_hash="b" * 40, template="select * from final_true a, final_true b where a.year = ?",
+        sample_sql="select * from final_true a, final_true b where a.year = 1402",
+        executions=1, total_ms=3000, max_ms=3000,
+        plan=[{"Plan": {"Node Type": "Nested Loop"}}], plan_captured_at=timezone.now(),
+    )
+    QueryExecution.objects.create(
+        entry_id="1-0", template=slowest, question_hash="c" * 40, sql=slowest.sample_sql,
+        duration_ms=3000, row_count=100000, role="public", executed_at=timezone.now(),
+    )
+    return frequent, slowest
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+def test_slowest_templates_first_with_plans(templates):
+    frequent, slowest = templates
+    client = client_for(User.objects.create_superuser(email="root@example.com", password="pass1234"))
+
+    response = client.get(reverse("adminpanel:querytemplate-list"))
+    assert response.status_code == 200
+    results = response.data["results"]
+    assert [t["id"] for t in results] == [slowest.id, frequent.id]
+    assert results[0]["avg_ms"] == 3000
+    assert results[0]["plan"] == [{"Plan": {"Node Type": "Nested Loop"}}]
+
+    response = client.get(reverse("adminpanel:querytemplate-list"), {"sort": "total"})
+    assert [t["id"] for t in response.data["results"]] == [frequent.id, slowest.id]
+
+    response = client.get(reverse("adminpanel:querytemplate-detail", args=[slowest.id]))
+    assert [run["row_count"] for run in response.data["recent_runs"]] == [100000]
+
+
+def test_only_superusers(templates):
+    client = client_for(User.objects.create_user(email="user@example.com", password="pass1234"))
+    assert client.get(reverse("adminpanel:querytemplate-list")).status_code == 403
@@ -11,6 +11,10 @@ router.register(r'messages', views.AdminMessageViewSet)
 router.register(r'email-logs', views.AdminEmailLogViewSet)
 router.register(r'send-email', views.AdminEmailViewSet, basename='send-email')
 router.register(r'error-logs', views.AdminErrorLogViewSet)
+router.register(r'deletion-jobs', views.AdminDeletionJobViewSet)
+router.register(r'redis-memory', views.AdminRedisMemoryViewSet, basename='redis-memory')
+router.register(r'dead-letters', views.AdminDeadLetterViewSet, basename='dead-letters')
+router.register(r'slow-queries', views.AdminSlowQueryViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
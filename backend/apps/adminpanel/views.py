@@ -4,6 +4,8 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.functions import Greatest
 from .serializers import (
     AdminUserListSerializer,
     AdminUserDetailSerializer,
@@ -14,17 +16,31 @@ from .serializers import (
     AdminChatListSerializer,
     AdminChatDetailSerializer,
     AdminMessageSerializer,
+    AdminMessageSearchSerializer,
     AdminEmailLogSerializer,
     AdminSendEmailSerializer,
-    AdminErrorLogSerializer
+    AdminErrorLogSerializer,
+    AdminDeletionJobSerializer,
+    AdminQueryTemplateSerializer,
+    AdminQueryTemplateDetailSerializer
 )
 from .permissions import IsSuperUser
 from apps.emails.services import EmailService
 from apps.emails.models import EmailLog
 from apps.errorlog.models import ErrorLog
-from apps.chat.models import Chat, Message
+from apps.chat.models import Chat, Message, DeletionJob
+from apps.querylog.models import QueryTemplate
+from apps.chat.deletion import request_user_deletion
+from apps.chat.archival import restore_chat
+from apps.chat.redis_config import get_sync_redis_connection
+from apps.chat.pagination import RecentMessageKeysetPagination
+from apps.chat.search import search_messages
+from .redis_memory import build_memory_report, store_memory_report, get_stored_memory_report
+from .dead_letters import list_dead_letters, replay_dead_letter, delete_dead_letter, purge_dead_letters
+from redis.exceptions import RedisError
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample
 import logging
+import re
 
 
 User = get_user_model()
@@ -215,13 +231,21 @@ class AdminUserViewSet(viewsets.ModelViewSet):
             'is_active': user.is_active
         })
 
+    def destroy(self, request, *args, **kwargs):
+        job = self.perform_destroy(self.get_object())
+        return Response(
+            {'message': 'User deletion scheduled', 'job_id': job.id},
+            status=status.HTTP_202_ACCEPTED
+        )
+
     def perform_destroy(self, instance):
         from rest_framework import serializers
         if instance.is_superuser:
             raise serializers.ValidationError(
                 "Superuser accounts cannot be deleted"
             )
-        instance.delete()
+        # The account is deactivated now; chats and messages go in the background
+        return request_user_deletion(instance, requested_by=self.request.user)
 
 
 class AdminChatViewSet(viewsets.ReadOnlyModelViewSet):
@@ -230,13 +254,24 @@ class AdminChatViewSet(viewsets.ReadOnlyModelViewSet):
     Provides list and retrieve actions.
     """
     permission_classes = [IsAuthenticated, IsSuperUser]
-    queryset = Chat.objects.all().prefetch_related('messages').order_by('-last_activity')
+    queryset = Chat.objects.filter(is_deleted=False).select_related('user').order_by('-last_activity')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related('messages')
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'list':
             return AdminChatListSerializer
         return AdminChatDetailSerializer
 
+    def retrieve(self, request, *args, **kwargs):
+        chat = get_object_or_404(Chat, pk=kwargs['pk'], is_deleted=False)
+        restore_chat(chat)
+        return super().retrieve(request, *args, **kwargs)
+
 
 class AdminMessageViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -244,8 +279,34 @@ class AdminMessageViewSet(viewsets.ReadOnlyModelViewSet):
     Provides list and retrieve actions.
     """
     permission_classes = [IsAuthenticated, IsSuperUser]
-    queryset = Message.objects.all().order_by('-created_at')
+    queryset = Message.objects.all().order_by('-created_at', '-id')
     serializer_class = AdminMessageSerializer
+    pagination_class = RecentMessageKeysetPagination
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('q', str, required=True, description='Search text'),
+            OpenApiParameter('user_id', int, description='Only search this user\'s chats'),
+            OpenApiParameter('limit', int, description='Maximum results (default 20, max 100)'),
+        ],
+        responses={200: AdminMessageSearchSerializer(many=True)},
+        description="Ranked full-text search over all messages"
+    )
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': "Query parameter 'q' is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            user_id = request.query_params.get('user_id')
+            user_id = int(user_id) if user_id else None
+            limit = max(1, min(int(request.query_params.get('limit', 20)), 100))
+        except ValueError:
+            return Response({'error': 'user_id and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = search_messages(query, user_id=user_id, limit=limit)
+        serializer = AdminMessageSearchSerializer(results, many=True)
+        return Response({'results': serializer.data})
 
 class AdminErrorLogViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -255,3 +316,142 @@ class AdminErrorLogViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticated, IsSuperUser]
     queryset = ErrorLog.objects.all().order_by('-created_at')
     serializer_class = AdminErrorLogSerializer
+
+
+class AdminDeletionJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Progress of background chat/user deletions.
+    Filter with ?status=pending|running|done|failed.
+    """
+    permission_classes = [IsAuthenticated, IsSuperUser]
+    queryset = DeletionJob.objects.all().select_related('requested_by').order_by('-created_at')
+    serializer_class = AdminDeletionJobSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        job_status = self.request.query_params.get('status')
+        if job_status:
+            queryset = queryset.filter(status=job_status)
+        return queryset
+
+
+class AdminSlowQueryViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Templates of AI-generated SQL (values replaced by ?), slowest first, with
+    the latest EXPLAIN (ANALYZE, BUFFERS) plan the AI worker sampled for them.
+    Order with ?sort=avg (default), max, total or executions; a template's
+    detail adds its recent executions.
+    """
+    permission_classes = [IsAuthenticated, IsSuperUser]
+    queryset = QueryTemplate.objects.all()
+    serializer_class = AdminQueryTemplateSerializer
+    SORT_FIELDS = {
+        'avg': '-avg_duration',
+        'max': '-max_ms',
+        'total': '-total_ms',
+        'executions': '-executions',
+    }
+
+    def get_queryset(self):
+        order = self.SORT_FIELDS.get(self.request.query_params.get('sort'), '-avg_duration')
+        return super().get_queryset().annotate(
+            avg_duration=F('total_ms') / Greatest('executions', 1)
+        ).order_by(order, 'id')
+
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return AdminQueryTemplateDetailSerializer
+        return super().get_serializer_class()
+
+
+class AdminRedisMemoryViewSet(viewsets.ViewSet):
+    """
+    Redis memory usage grouped by key family.
+    Returns the last report stored by the `redis_memory_report` command;
+    pass ?refresh=1 to rebuild it now. Without a stored report this is a
+    404: building one scans the whole keyspace, so only on request.
+    """
+    permission_classes = [IsAuthenticated, IsSuperUser]
+
+    def list(self, request):
+        refresh = request.query_params.get('refresh') in ('1', 'true', 'True')
+        try:
+            conn = get_sync_redis_connection()
+            if refresh:
+                report = build_memory_report(conn)
+                store_memory_report(conn, report)
+            else:
+                report = get_stored_memory_report(conn)
+        except RedisError as e:
+            logger.error(f"Redis memory report failed: {str(e)}")
+            return Response(
+                {'error': 'Redis is unavailable'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        if report is None:
+            return Response(
+                {'error': 'No report yet. Run the redis_memory_report command or pass ?refresh=1'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(report)
+
+
+class AdminDeadLetterViewSet(viewsets.ViewSet):
+    """
+    Questions the AI worker gave up on after its retries, with the failing
+    stage and error. Newest first; page with ?count= and ?before=<id>.
+    Replay puts a question back on the AI stream, its answer is saved to the
+    chat by relay_ai_job_events; purge drops them all.
+    """
+    permission_classes = [IsAuthenticated, IsSuperUser]
+    lookup_value_regex = r'\d+-\d+'
+
+    def _redis_unavailable(self, e):
+        logger.error(f"Dead-letter stream access failed: {str(e)}")
+        return Response(
+            {'error': 'Redis is unavailable'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+
+    def list(self, request):
+        try:
+            count = max(1, min(int(request.query_params.get('count', 50)), 500))
+        except ValueError:
+            return Response({'error': 'count must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        before = request.query_params.get('before')
+        if before and not re.fullmatch(self.lookup_value_regex, before):
+            return Response({'error': 'before must be a stream entry id'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = list_dead_letters(get_sync_redis_connection(), count, before)
+        except RedisError as e:
+            return self._redis_unavailable(e)
+        return Response(page)
+
+    def destroy(self, request, pk=None):
+        try:
+            deleted = delete_dead_letter(get_sync_redis_connection(), pk)
+        except RedisError as e:
+            return self._redis_unavailable(e)
+        if not deleted:
+            return Response({'error': 'Dead letter not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def replay(self, request, pk=None):
+        try:
+            entry_id = replay_dead_letter(get_sync_redis_connection(), pk)
+        except RedisError as e:
+            return self._redis_unavailable(e)
+        if entry_id is None:
+            return Response({'error': 'Dead letter not found'}, status=status.HTTP_404_NOT_FOUND)
+        logger.info(f"Dead letter {pk} replayed as {entry_id} by {request.user.email}")
+        return Response({'entry_id': entry_id})
+
+    @action(detail=False, methods=['post'])
+    def purge(self, request):
+        try:
+            purged = purge_dead_letters(get_sync_redis_connection())
+        except RedisError as e:
+            return self._redis_unavailable(e)
+        logger.info(f"{purged} dead letters purged by {request.user.email}")
+        return Response({'purged': purged})
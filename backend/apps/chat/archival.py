@@ -0,0 +1,130 @@
+import json
+import logging
+from datetime import timedelta
+import zstandard
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Chat, Message, ChatArchive
+from .search import index_messages, remove_from_index
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_FIELDS = [
+    'id',
+    'role',
+    'content',
+    'created_at',
+    'ai_response_metadata',
+    'ai_references',
+    'tokens_used',
+    'response_time',
+]
+ZSTD_LEVEL = 10
+RESTORE_BATCH_SIZE = 500
+
+
+def pack_messages(rows):
+    """
+    Column-pack message rows (dicts of ARCHIVED_FIELDS) into one zstd blob.
+    Values of the same field sit next to each other, which compresses far
+    better than row-by-row JSON. Returns (blob, uncompressed_size).
+    """
+    columns = {field: [] for field in ARCHIVED_FIELDS}
+    for row in rows:
+        for field in ARCHIVED_FIELDS:
+            value = row[field]
+            columns[field].append(value.isoformat() if field == 'created_at' else value)
+    raw = json.dumps(columns, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw), len(raw)
+
+
+def unpack_messages(data):
+    columns = json.loads(zstandard.ZstdDecompressor().decompress(bytes(data)))
+    return [
+        {field: columns[field][i] for field in ARCHIVED_FIELDS}
+        for i in range(len(columns['id']))
+    ]
+
+
+def cold_chat_ids(days=None):
+    """Archived chats whose messages are due to move to cold storage."""
+    days = settings.CHAT_COLD_STORAGE_AFTER_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    return Chat.objects.filter(
+        is_archived=True,
+        in_cold_storage=False,
+        is_deleted=False,
+        archived_at__lte=cutoff,
+        message_count__gt=0
+    ).order_by('pk').values_list('pk', flat=True)
+
+
+def archive_chat(chat_id):
+    """Move one archived chat's messages into a ChatArchive blob. Returns the number moved."""
+    with transaction.atomic():
+        # The row lock also holds back concurrent message inserts (FK check) until commit
+        chat = Chat.objects.select_for_update().filter(
+            pk=chat_id, is_archived=True, in_cold_storage=False, is_deleted=False
+        ).first()
+        if chat is None:
+            return 0
+        rows = list(
+            Message._base_manager.filter(chat_id=chat_id)
+            .order_by('created_at', 'id')
+            .values(*ARCHIVED_FIELDS)
+        )
+        if not rows:
+            return 0
+
+        data, raw_size = pack_messages(rows)
+        ChatArchive.objects.update_or_create(
+            chat=chat,
+            defaults={
+                'codec': ChatArchive.CODEC_ZSTD,
+                'data': data,
+                'message_count': len(rows),
+                'raw_size': raw_size,
+            }
+        )
+        ids = [row['id'] for row in rows]
+        # _base_manager: a plain DELETE that leaves the chat summary columns as they are
+        Message._base_manager.filter(chat_id=chat_id, pk__lte=max(ids)).delete()
+        remove_from_index(ids)
+        Chat.objects.filter(pk=chat_id).update(in_cold_storage=True)
+    logger.info(f"Archived {len(rows)} messages of chat {chat_id} ({raw_size} -> {len(data)} bytes)")
+    return len(rows)
+
+
+def restore_chat(chat):
+    """Bring a cold chat's messages back into the Message table. No-op for hot chats."""
+    if not chat.in_cold_storage:
+        return 0
+    with transaction.atomic():
+        locked = Chat.objects.select_for_update().filter(pk=chat.pk, in_cold_storage=True).first()
+        if locked is None:
+            # Restored by a concurrent request
+            chat.in_cold_storage = False
+            return 0
+        archive = ChatArchive.objects.filter(chat_id=chat.pk).first()
+        rows = unpack_messages(archive.data) if archive else []
+
+        messages = []
+        for row in rows:
+            row = dict(row, created_at=parse_datetime(row['created_at']))
+            messages.append(Message(chat_id=chat.pk, **row))
+        created_at = [message.created_at for message in messages]
+        Message.objects.bulk_create(messages, batch_size=RESTORE_BATCH_SIZE)
+        # bulk_create stamps auto_now_add fields with the current time; put the originals back
+        for message, value in zip(messages, created_at):
+            message.created_at = value
+        Message.objects.bulk_update(messages, ['created_at'], batch_size=RESTORE_BATCH_SIZE)
+        index_messages([(message.pk, message.content) for message in messages])
+
+        if archive:
+            archive.delete()
+        Chat.objects.filter(pk=chat.pk).update(in_cold_storage=False)
+    chat.in_cold_storage = False
+    logger.info(f"Restored {len(messages)} messages of chat {chat.pk} from cold storage")
+    return len(messages)
@@ -0,0 +1,97 @@
+import hashlib
+import time
+import logging
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from redis.exceptions import RedisError
+from .redis_config import get_sync_redis_connection
+
+logger = logging.getLogger(__name__)
+
+CHAT_LIST_VERSION_KEY = "chat_list_version:{user_id}"
+PROFILE_VERSION_KEY = "profile_version:{user_id}"
+# Versions expire so a missed bump (e.g. Redis blip) cannot pin a stale ETag forever
+VERSION_TTL_SECONDS = 24 * 3600
+
+
+def _get_version(key):
+    """Current version for key, created on first use. None if Redis is unavailable."""
+    try:
+        conn = get_sync_redis_connection()
+        pipe = conn.pipeline(transaction=False)
+        # Seed with a clock value so a recreated key never repeats an old version
+        pipe.set(key, time.time_ns(), nx=True, ex=VERSION_TTL_SECONDS)
+        pipe.get(key)
+        return pipe.execute()[1]
+    except RedisError as e:
+        logger.warning(f"Version lookup failed for {key}: {e}")
+        return None
+
+
+def _bump_version(key):
+    def bump():
+        try:
+            conn = get_sync_redis_connection()
+            pipe = conn.pipeline(transaction=False)
+            pipe.incr(key)
+            pipe.expire(key, VERSION_TTL_SECONDS)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Version bump failed for {key}: {e}")
+
+    # Bump only once the change is visible to readers
+    transaction.on_commit(bump)
+
+
+def get_chat_list_version(user_id):
+    return _get_version(CHAT_LIST_VERSION_KEY.format(user_id=user_id))
+
+
+def bump_chat_list_version(user_id):
+    _bump_version(CHAT_LIST_VERSION_KEY.format(user_id=user_id))
+
+
+def get_profile_version(user_id):
+    return _get_version(PROFILE_VERSION_KEY.format(user_id=user_id))
+
+
+def bump_profile_version(user_id):
+    _bump_version(PROFILE_VERSION_KEY.format(user_id=user_id))
+
+
+class ConditionalGetMixin:
+    """
+    Answers If-None-Match / If-Modified-Since with 304 before the queryset or
+    serializer runs. Views provide cheap validators via get_etag() and/or
+    get_last_modified(); returning None from both disables the check.
+    """
+
+    def get_etag(self, request):
+        return None
+
+    def get_last_modified(self, request):
+        return None
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        if etag is not None:
+            # Different pages/cursors of the same resource need different tags
+            path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()[:8]
+            etag = quote_etag(f"{etag}-{path_hash}")
+        last_modified = self.get_last_modified(request)
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+
+        response = None
+        if etag is not None or last_modified is not None:
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+
+        if response.status_code in (200, 304):
+            if etag is not None:
+                response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
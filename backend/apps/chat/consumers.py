@@ -11,8 +11,13 @@ from .redis_config import (
     cleanup_chat_entries
 )
 from .models import Chat, Message
+from .user_cache import aget_user_snapshot
+from .results import aget_result_page, RESULT_PAGE_SIZE
+from apps.accounts.throttling import ahit, parse_rate
+from django.conf import settings
 from datetime import datetime
 import json
+import time
 import asyncio
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -30,7 +35,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def get_chat(self):
         try:
-            return Chat.objects.get(id=self.chat_id, user=self.user)
+            return Chat.objects.get(id=self.chat_id, user=self.user, is_deleted=False)
         except Chat.DoesNotExist:
             return None
 
@@ -47,22 +52,58 @@ class ChatConsumer(AsyncWebsocketConsumer):
             created_at=datetime.utcnow()
         )
 
-    @database_sync_to_async
-    def get_user_role(self):
-        """Get user's role from UserRole or determine if admin"""
-        if self.user.is_superuser:
-            return 'admin'
-        try:
-            if hasattr(self.user, 'userrole'):
-                return self.user.userrole.role
-            return 'public'
-        except Exception:
-            return 'public'
+    async def get_user_role(self):
+        """
+        Role from the cached user snapshot: one Redis GET, no database query.
+        None once the user is deactivated or removed (snapshot invalidated).
+        """
+        snapshot = await aget_user_snapshot(self.redis, self.user.id)
+        if snapshot is None or not snapshot['is_active']:
+            return None
+        return snapshot['role']
+
+    async def check_rate_limit(self, user_role):
+        """
+        Per-user and per-role message budgets (settings.CHAT_MESSAGE_RATES),
+        checked in one Redis round trip. Returns seconds to wait, 0 if allowed.
+        """
+        limits = []
+        user_rate = parse_rate(settings.CHAT_MESSAGE_RATES['user'].get(user_role))
+        if user_rate:
+            limits.append((f"ws_user:{self.user.id}", *user_rate))
+        role_rate = parse_rate(settings.CHAT_MESSAGE_RATES['role'].get(user_role))
+        if role_rate:
+            limits.append((f"ws_role:{user_role}", *role_rate))
+        if not limits:
+            return 0
+
+        result = await ahit(self.redis, limits)
+        if result is None:
+            # Without Redis the AI pipeline is down anyway; let the request report that
+            return 0
+        allowed, retry_after = result
+        return 0 if allowed else retry_after
+
+    async def check_page_rate_limit(self):
+        """
+        result_page frames have their own per-user bucket (settings.RESULT_PAGE_RATE),
+        without the role lookup. Returns seconds to wait, 0 if allowed.
+        """
+        rate = parse_rate(settings.RESULT_PAGE_RATE)
+        if not rate:
+            return 0
+        result = await ahit(self.redis, [(f"ws_page:{self.user.id}", *rate)])
+        if result is None:
+            return 0
+        allowed, retry_after = result
+        return 0 if allowed else retry_after
 
     @database_sync_to_async
     def update_chat_title(self, title):
         from .models import Chat
+        from .conditional import bump_chat_list_version
         Chat.objects.filter(id=self.chat_id).update(title=title)
+        bump_chat_list_version(self.user.id)
 
     async def connect(self):
         if self.scope["user"].is_anonymous:
@@ -148,21 +189,37 @@ class ChatConsumer(AsyncWebsocketConsumer):
             except Exception as e:
                 print(f"Error in parent disconnect: {e}")
 
+    async def get_response_cursor(self):
+        """ID of the newest response entry, so a reply published right after the request is not missed."""
+        entries = await self.redis.xrevrange(RESPONSE_STREAM_KEY, count=1)
+        return entries[0][0] if entries else "0-0"
+
     async def wait_for_ai_response(self, last_id="$", timeout=60, max_retries=3):
         """
         انتظار برای دریافت پاسخ AI از Redis با قابلیت retry
+        The worker answers questions out of order, so only the response whose
+        message_id matches self.pending_message_id is returned.
         """
+        message_id = getattr(self, 'pending_message_id', None)
         for attempt in range(max_retries):
             try:
-                response = await self.redis.xread(
-                    {RESPONSE_STREAM_KEY: last_id}, 
-                    block=timeout * 1000, 
-                    count=1
-                )
-                
-                if response:
+                deadline = time.monotonic() + timeout
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    response = await self.redis.xread(
+                        {RESPONSE_STREAM_KEY: last_id},
+                        block=max(1, int(remaining * 1000)),
+                        count=100
+                    )
+                    if not response:
+                        break
                     _, messages = response[0]
-                    return messages[0]
+                    for entry_id, fields in messages:
+                        last_id = entry_id
+                        if message_id is None or fields.get('message_id') == message_id:
+                            return entry_id, fields
                 
                 if attempt < max_retries - 1:  
                     await self.send(json.dumps({
@@ -178,6 +235,28 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 
         return None
 
+    async def send_result_page(self, data):
+        """Answer a {'type': 'result_page', 'message_id', 'offset', 'limit'} frame from the result cache."""
+        try:
+            page = await aget_result_page(
+                self.redis,
+                str(data.get('message_id')),
+                user_id=self.user.id,
+                chat_id=self.chat_id,
+                offset=int(data.get('offset', 0)),
+                limit=int(data.get('limit', RESULT_PAGE_SIZE))
+            )
+        except (TypeError, ValueError):
+            page = None
+        if page is None:
+            await self.send(json.dumps({
+                'type': 'error',
+                'code': 'result_expired',
+                'message': 'These results are no longer available. Please ask the question again.'
+            }))
+            return
+        await self.send(json.dumps({'type': 'result_page', 'data': page}))
+
     async def receive(self, text_data):
         message_id = None
         request_entry_id = None
@@ -185,13 +264,41 @@ class ChatConsumer(AsyncWebsocketConsumer):
         
         try:
             data = json.loads(text_data)
+            if data.get('type') == 'result_page':
+                # Paging over a previous answer's rows: no AI involved
+                retry_after = await self.check_page_rate_limit()
+                if retry_after:
+                    await self.send(json.dumps({
+                        'type': 'error',
+                        'code': 'rate_limited',
+                        'message': 'Too many page requests. Please wait before loading more.',
+                        'retry_after': retry_after
+                    }))
+                    return
+                await self.send_result_page(data)
+                return
+
             content = data.get('content')
             
             if not content:
                 return
 
-            # Create and save message
             user_role = await self.get_user_role()
+            if user_role is None:
+                await self.close(code=4003)
+                return
+
+            retry_after = await self.check_rate_limit(user_role)
+            if retry_after:
+                await self.send(json.dumps({
+                    'type': 'error',
+                    'code': 'rate_limited',
+                    'message': 'Too many messages. Please wait before sending another.',
+                    'retry_after': retry_after
+                }))
+                return
+
+            # Create and save message
             await self.save_message(content, 'user')
 
             # Get chat history
@@ -211,7 +318,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
             message_data['last_twenty_messages'] = chat_history_json
 
             # Send to Redis
+            response_cursor = await self.get_response_cursor()
             message_id, request_entry_id = await send_message_to_ai(self.redis, message_data)
+            self.pending_message_id = message_id
 
             # Send confirmations
             await self.send(json.dumps({
@@ -226,8 +335,42 @@ class ChatConsumer(AsyncWebsocketConsumer):
             }))
 
             # Wait for and process AI response
-            msg = await self.wait_for_ai_response()
-            if msg:
+            msg = await self.wait_for_ai_response(last_id=response_cursor)
+            if msg and msg[1].get('type') == 'error':
+                # The worker gave up on this question (it is in the dead-letter stream)
+                response_entry_id, response_data = msg
+                await cleanup_message_entries(
+                    self.redis,
+                    message_id=message_id,
+                    response_entry_id=response_entry_id
+                )
+                code = response_data.get('code', 'ai_failed')
+                await self.send(json.dumps({
+                    'type': 'error',
+                    'code': code,
+                    'message': (
+                        'The AI service is temporarily unavailable. Please try again in a minute.'
+                        if code == 'ai_unavailable'
+                        else 'The AI could not answer this message. Please try again later.'
+                    )
+                }))
+
+            elif msg and msg[1].get('type') == 'deferred':
+                # Too heavy to answer while we wait: the worker runs it in its
+                # background lane and progress arrives as ai_job_event
+                response_entry_id, _ = msg
+                await cleanup_message_entries(
+                    self.redis,
+                    message_id=message_id,
+                    response_entry_id=response_entry_id
+                )
+                await self.send(json.dumps({
+                    'type': 'job_queued',
+                    'message_id': message_id,
+                    'message': 'This question needs a longer analysis. The answer will appear here when it is ready.'
+                }))
+
+            elif msg:
                 response_entry_id, response_data = msg
                 
                 try:
@@ -277,6 +420,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'message': str(e)
             }))
 
+    async def ai_job_event(self, event):
+        """Heavy-job progress or result, relayed from the worker by relay_ai_job_events (apps/chat/jobs.py)."""
+        await self.send(json.dumps(event['frame']))
+
     async def process_ai_response(self, response_data):
         """Process AI response data"""
         # Save message
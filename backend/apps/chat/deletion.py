@@ -0,0 +1,172 @@
+import logging
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from apps.errorlog.models import ErrorLog
+from .models import Chat, Message, DeletionJob
+from .conditional import bump_chat_list_version, bump_profile_version
+from .search import remove_from_index
+from .user_cache import invalidate_user_snapshot
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+# A running job that has not reported progress for this long is assumed dead
+STALE_AFTER = timedelta(minutes=30)
+
+
+def _active_job(target_type, target_id):
+    return DeletionJob.objects.filter(
+        target_type=target_type,
+        target_id=target_id,
+        status__in=[DeletionJob.STATUS_PENDING, DeletionJob.STATUS_RUNNING]
+    ).first()
+
+
+def request_chat_deletion(chat, requested_by=None):
+    """Hide the chat immediately and queue the actual delete."""
+    with transaction.atomic():
+        Chat.objects.filter(pk=chat.pk).update(is_deleted=True)
+        job = _active_job(DeletionJob.TARGET_CHAT, chat.pk) or DeletionJob.objects.create(
+            target_type=DeletionJob.TARGET_CHAT,
+            target_id=chat.pk,
+            target_label=(chat.title or '')[:255],
+            requested_by=requested_by,
+            total_items=chat.message_count + 1,
+        )
+        bump_chat_list_version(chat.user_id)
+    return job
+
+
+def request_user_deletion(user, requested_by=None):
+    """Deactivate the user (which blocks login and token use) and queue the actual delete."""
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        chats = Chat.objects.filter(user=user)
+        chats.update(is_deleted=True)
+        job = _active_job(DeletionJob.TARGET_USER, user.pk)
+        if job is None:
+            totals = chats.aggregate(messages=Sum('message_count'))
+            job = DeletionJob.objects.create(
+                target_type=DeletionJob.TARGET_USER,
+                target_id=user.pk,
+                target_label=user.email,
+                requested_by=requested_by,
+                total_items=(totals['messages'] or 0) + chats.count() + 1,
+            )
+        bump_chat_list_version(user.pk)
+        bump_profile_version(user.pk)
+        invalidate_user_snapshot(user.pk)
+    return job
+
+
+def _report(job, count):
+    if count:
+        DeletionJob.objects.filter(pk=job.pk).update(
+            deleted_items=F('deleted_items') + count,
+            updated_at=timezone.now()
+        )
+
+
+def _delete_in_batches(queryset, batch_size, on_batch=None):
+    """
+    Delete rows in primary-key ranges, one short transaction per batch.
+    Expects a plain queryset without delete signals, so each batch is a
+    single DELETE and no rows are loaded into memory.
+    """
+    total = 0
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return total
+        with transaction.atomic():
+            queryset.filter(pk__gte=ids[0], pk__lte=ids[-1]).delete()
+            if on_batch:
+                on_batch(ids)
+        total += len(ids)
+
+
+def _nullify_in_batches(queryset, field, batch_size):
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        queryset.filter(pk__gte=ids[0], pk__lte=ids[-1]).update(**{field: None})
+
+
+def _delete_chat(job, chat_id, batch_size):
+    # _base_manager skips MessageQuerySet.delete(), which would recompute
+    # the summary of a chat that is about to disappear
+    messages = Message._base_manager.filter(chat_id=chat_id)
+
+    def on_batch(ids):
+        remove_from_index(ids)
+        _report(job, len(ids))
+
+    _delete_in_batches(messages, batch_size, on_batch)
+    # Only the (now empty) chat row is left for the cascade collector
+    Chat.objects.filter(pk=chat_id).delete()
+    _report(job, 1)
+
+
+def _delete_user(job, user_id, batch_size):
+    chat_ids = list(Chat.objects.filter(user_id=user_id).order_by('pk').values_list('pk', flat=True))
+    for chat_id in chat_ids:
+        _delete_chat(job, chat_id, batch_size)
+
+    # SET_NULL relations would otherwise be updated row by row by the collector
+    _nullify_in_batches(ErrorLog.objects.filter(user_id=user_id), 'user', batch_size)
+    _nullify_in_batches(OutstandingToken.objects.filter(user_id=user_id), 'user', batch_size)
+
+    User.objects.filter(pk=user_id).delete()
+    _report(job, 1)
+
+
+def claim_next_job():
+    """Atomically move the oldest pending job to running; None if there is nothing to do."""
+    stale = timezone.now() - STALE_AFTER
+    DeletionJob.objects.filter(status=DeletionJob.STATUS_RUNNING, updated_at__lt=stale).update(
+        status=DeletionJob.STATUS_PENDING
+    )
+    for job in DeletionJob.objects.filter(status=DeletionJob.STATUS_PENDING).order_by('created_at')[:10]:
+        now = timezone.now()
+        claimed = DeletionJob.objects.filter(pk=job.pk, status=DeletionJob.STATUS_PENDING).update(
+            status=DeletionJob.STATUS_RUNNING,
+            started_at=now,
+            updated_at=now
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def run_job(job, batch_size=BATCH_SIZE):
+    """Process one job to completion. Safe to re-run after a crash: every step is idempotent."""
+    try:
+        if job.target_type == DeletionJob.TARGET_CHAT:
+            _delete_chat(job, job.target_id, batch_size)
+        else:
+            _delete_user(job, job.target_id, batch_size)
+    except Exception as e:
+        logger.error(f"Deletion job {job.pk} failed: {str(e)}")
+        DeletionJob.objects.filter(pk=job.pk).update(
+            status=DeletionJob.STATUS_FAILED,
+            error=str(e),
+            updated_at=timezone.now()
+        )
+        return False
+
+    now = timezone.now()
+    DeletionJob.objects.filter(pk=job.pk).update(
+        status=DeletionJob.STATUS_DONE,
+        error='',
+        finished_at=now,
+        updated_at=now
+    )
+    logger.info(f"Deletion job {job.pk} finished ({job.target_type} {job.target_id})")
+    return True
@@ -0,0 +1,275 @@
+import csv
+import io
+import json
+import logging
+import re
+import time
+import uuid
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from redis.exceptions import RedisError
+from .redis_config import get_sync_redis_connection
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+}
+# Sorted set of the user's running exports: slot token -> start time
+EXPORT_SLOTS_KEY = "export_slots:{user_id}"
+# Safety net: a slot whose release was lost frees itself after this long
+EXPORT_SLOT_TTL_SECONDS = 3600
+
+_SAFE_START = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+_WRITES = re.compile(
+    r"\b(insert|update|delete|merge|drop|alter|create|truncate|copy|grant|revoke|call|vacuum|lock)\b",
+    re.IGNORECASE,
+)
+_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+
+class ExportUnavailable(Exception):
+    """The analytics database (or the requested format) cannot be used right now."""
+
+
+def message_sql(message):
+    """
+    The validated SQL the AI worker ran for an assistant message, or None.
+    Checked again here (one read-only statement) although exports also run
+    in a READ ONLY transaction.
+    """
+    metadata = message.ai_response_metadata
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except ValueError:
+            return None
+    sql = (metadata or {}).get('sql') if isinstance(metadata, dict) else None
+    if not sql:
+        return None
+    sql = sql.strip().rstrip(';').strip()
+    code = _LITERAL.sub("''", sql)
+    if ';' in code or not _SAFE_START.match(code) or _WRITES.search(code):
+        return None
+    return sql
+
+
+def row_limit(role):
+    """Most rows a user of this role may export; None means no cap."""
+    limits = settings.EXPORT_ROW_LIMITS
+    return limits.get(role, limits.get('public'))
+
+
+def acquire_slot(user_id):
+    """
+    Take one of the user's EXPORT_MAX_CONCURRENT export slots. Returns the
+    slot's token for release_slot(), or None when all are in use. Slots older
+    than EXPORT_SLOT_TTL_SECONDS are dropped first, so one whose release was
+    lost (a restart mid-export) frees itself whatever the user retries.
+    Without Redis exports are not limited, like the rate limits.
+    """
+    key = EXPORT_SLOTS_KEY.format(user_id=user_id)
+    token = uuid.uuid4().hex
+    now = time.time()
+    try:
+        conn = get_sync_redis_connection()
+        pipe = conn.pipeline()
+        pipe.zremrangebyscore(key, '-inf', now - EXPORT_SLOT_TTL_SECONDS)
+        pipe.zadd(key, {token: now})
+        pipe.zcard(key)
+        pipe.expire(key, EXPORT_SLOT_TTL_SECONDS)
+        _, _, in_use, _ = pipe.execute()
+        if in_use > settings.EXPORT_MAX_CONCURRENT:
+            conn.zrem(key, token)
+            return None
+    except RedisError as e:
+        logger.warning(f"Export slot check failed for {user_id}: {e}")
+    return token
+
+
+def release_slot(user_id, token):
+    try:
+        get_sync_redis_connection().zrem(EXPORT_SLOTS_KEY.format(user_id=user_id), token)
+    except RedisError as e:
+        logger.warning(f"Export slot release failed for {user_id}: {e}")
+
+
+def _connect():
+    # Only the export path talks to the analytics database
+    import psycopg2
+
+    if not settings.ANALYTICS_DATABASE_URL:
+        raise ExportUnavailable("ANALYTICS_DATABASE_URL is not set")
+    try:
+        return psycopg2.connect(settings.ANALYTICS_DATABASE_URL)
+    except psycopg2.Error as e:
+        raise ExportUnavailable(str(e)) from e
+
+
+class QueryExport:
+    """
+    A query running on the analytics database behind a server-side (named)
+    cursor: rows are fetched EXPORT_FETCH_SIZE at a time, so memory stays flat
+    however large the result is.
+    """
+
+    def __init__(self, sql, limit=None, fetch_size=None):
+        self.fetch_size = fetch_size or settings.EXPORT_FETCH_SIZE
+        self.conn = _connect()
+        try:
+            self.conn.set_session(readonly=True)
+            with self.conn.cursor() as cur:
+                cur.execute("SET LOCAL statement_timeout = %s", (settings.EXPORT_STATEMENT_TIMEOUT_MS,))
+            self.cursor = self.conn.cursor(name=f"export_{uuid.uuid4().hex}")
+            self.cursor.itersize = self.fetch_size
+            if limit is not None:
+                # Inlined, not a parameter: with parameters psycopg2 would read the
+                # % of LIKE patterns in the generated SQL as placeholders
+                sql = f"SELECT * FROM ({sql}) AS export LIMIT {int(limit)}"
+            self.cursor.execute(sql)
+            # A named cursor only knows its columns once the first rows arrive
+            self.first = self.cursor.fetchmany(self.fetch_size)
+            self.columns = [desc[0] for desc in self.cursor.description]
+        except Exception:
+            self.close()
+            raise
+
+    def batches(self):
+        if self.first:
+            yield self.first
+            self.first = None
+        while True:
+            rows = self.cursor.fetchmany(self.fetch_size)
+            if not rows:
+                return
+            yield rows
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception as e:
+            logger.warning(f"Closing export connection failed: {e}")
+
+
+def _csv_encode(rows, header=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header is not None:
+        # BOM so spreadsheet programs read the Persian text as UTF-8
+        buffer.write('\ufeff')
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+class _ParquetSink:
+    """Write-only file for ParquetWriter that hands over each row group as it is written."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+def _pyarrow():
+    # Optional: only Parquet exports need it
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportUnavailable("Parquet export needs pyarrow")
+    return pa, pq
+
+
+def _parquet_encoder(columns):
+    pa, pq = _pyarrow()
+    sink = _ParquetSink()
+    state = {}
+
+    def encode(rows):
+        data = {name: [row[i] for row in rows] for i, name in enumerate(columns)}
+        if 'writer' not in state:
+            # Types come from the first batch; all-NULL columns are written as text
+            # and numerics as float64 (a later batch may not fit the first one's
+            # decimal precision and scale)
+            table = pa.table(data)
+            fields = [
+                pa.field(f.name, pa.string()) if pa.types.is_null(f.type)
+                else pa.field(f.name, pa.float64()) if pa.types.is_decimal(f.type)
+                else f
+                for f in table.schema
+            ]
+            state['schema'] = pa.schema(fields)
+            state['text'] = {f.name for f in table.schema if pa.types.is_null(f.type)}
+            state['writer'] = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), state['schema'])
+        for field in state['schema']:
+            if field.name in state['text']:
+                data[field.name] = [None if v is None else str(v) for v in data[field.name]]
+            elif pa.types.is_floating(field.type):
+                data[field.name] = [None if v is None else float(v) for v in data[field.name]]
+        state['writer'].write_table(pa.table(data, schema=state['schema']))
+        return sink.drain()
+
+    def finish():
+        if 'writer' in state:
+            state['writer'].close()
+        return sink.drain()
+
+    return encode, finish
+
+
+def check_format(fmt):
+    """ValueError for unknown formats, ExportUnavailable when the format's library is missing."""
+    if fmt not in EXPORT_CONTENT_TYPES:
+        raise ValueError(fmt)
+    if fmt == 'parquet':
+        _pyarrow()
+
+
+async def stream_export(export, fmt, on_close=None):
+    """
+    Async iterator of encoded chunks, one per fetched batch. Async so the ASGI
+    handler streams it instead of collecting a sync iterator into a list; the
+    blocking fetches run in worker threads. Closes the cursor when done or
+    when the client goes away.
+    """
+    fetch = sync_to_async(lambda batches: next(batches, None), thread_sensitive=False)
+    try:
+        batches = export.batches()
+        if fmt == 'parquet':
+            encode, finish = _parquet_encoder(export.columns)
+            while (rows := await fetch(batches)) is not None:
+                yield await sync_to_async(encode, thread_sensitive=False)(rows)
+            yield finish()
+        else:
+            header = export.columns
+            yielded = False
+            while (rows := await fetch(batches)) is not None:
+                yield _csv_encode(rows, header)
+                header, yielded = None, True
+            if not yielded:
+                yield _csv_encode([], header)
+    finally:
+        await sync_to_async(export.close, thread_sensitive=False)()
+        if on_close is not None:
+            await sync_to_async(on_close, thread_sensitive=False)()
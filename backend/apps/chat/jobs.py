@@ -0,0 +1,122 @@
+import json
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from redis.exceptions import ResponseError
+from .models import Chat, Message
+from .redis_config import JOB_EVENTS_STREAM_KEY, JOB_EVENTS_GROUP
+
+logger = logging.getLogger(__name__)
+
+# Set once a heavy job's answer is saved, so a redelivered "done" event is not saved twice
+JOB_SAVED_KEY = "job_saved:{message_id}"
+JOB_SAVED_TTL_SECONDS = 7 * 24 * 3600
+
+
+def ensure_group(conn):
+    try:
+        conn.xgroup_create(JOB_EVENTS_STREAM_KEY, JOB_EVENTS_GROUP, id="$", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def save_answer(conn, event):
+    """Save a finished heavy job's answer as the chat's assistant message. False if already saved or the chat is gone."""
+    key = JOB_SAVED_KEY.format(message_id=event.get('message_id'))
+    if conn.exists(key):
+        return False
+    chat = Chat.objects.filter(id=event.get('chat_id'), user_id=event.get('user_id'), is_deleted=False).first()
+    if chat is None:
+        return False
+
+    Message.objects.create(
+        chat=chat,
+        role=Message.ROLE_ASSISTANT,
+        content=event.get('content', ''),
+        ai_response_metadata=event.get('ai_response_metadata'),
+        ai_references=event.get('ai_references'),
+        tokens_used=int(event.get('tokens_used') or 0),
+        response_time=float(event.get('response_time') or 0),
+    )
+    conn.set(key, "1", ex=JOB_SAVED_TTL_SECONDS)
+
+    try:
+        metadata = json.loads(event.get('ai_response_metadata') or '{}')
+    except json.JSONDecodeError:
+        metadata = {}
+    if title := metadata.get('suggested_title'):
+        from .conditional import bump_chat_list_version
+        Chat.objects.filter(id=chat.id).update(title=title)
+        bump_chat_list_version(chat.user_id)
+    return True
+
+
+def event_frame(event):
+    """The websocket frame for a job event, shaped like the interactive ones; None for unknown events."""
+    kind = event.get('event')
+    message_id = event.get('message_id')
+    if kind in ('running', 'progress'):
+        return {'type': 'job_progress', 'message_id': message_id, 'stage': event.get('stage') or kind}
+    if kind == 'done':
+        data = {k: v for k, v in event.items() if k != 'event'}
+        return {'type': 'ai_response', 'message_id': message_id, 'data': data}
+    if kind == 'failed':
+        code = event.get('code', 'ai_failed')
+        return {
+            'type': 'error',
+            'code': code,
+            'message_id': message_id,
+            'message': (
+                'The AI service is temporarily unavailable. Please try again in a minute.'
+                if code == 'ai_unavailable'
+                else 'The AI could not answer this message. Please try again later.'
+            )
+        }
+    return None
+
+
+def handle_event(conn, event):
+    if event.get('event') == 'done':
+        save_answer(conn, event)
+    frame = event_frame(event)
+    if frame is None:
+        return
+    # ChatConsumer's group; nobody may be connected, the saved message is there on reload
+    group = f"chat_{event.get('user_id')}_{event.get('chat_id')}"
+    async_to_sync(get_channel_layer().group_send)(group, {'type': 'ai_job_event', 'frame': frame})
+
+
+def relay_events(conn, consumer, pending=False, count=100, block_ms=1000):
+    """
+    Handle one batch of job events as `consumer` of JOB_EVENTS_GROUP and
+    acknowledge them. With pending=True, re-handle all of this consumer's
+    events that were read but never acknowledged (it stopped midway, or an
+    event failed), `count` at a time. Returns how many were handled; a
+    failing event stays pending for the next pending pass.
+    """
+    start = "0" if pending else ">"
+    handled = 0
+    while True:
+        response = conn.xreadgroup(
+            JOB_EVENTS_GROUP,
+            consumer,
+            {JOB_EVENTS_STREAM_KEY: start},
+            count=count,
+            block=None if pending else block_ms
+        )
+        last_id = None
+        for _, entries in response or []:
+            for entry_id, event in entries:
+                last_id = entry_id
+                try:
+                    handle_event(conn, event)
+                except Exception:
+                    logger.exception(f"Job event {entry_id} failed")
+                    continue
+                conn.xack(JOB_EVENTS_STREAM_KEY, JOB_EVENTS_GROUP, entry_id)
+                handled += 1
+        if not pending or last_id is None:
+            return handled
+        # Pending entries after the last one seen, so failing ones are not read again in this pass
+        start = last_id
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.chat.archival import archive_chat, cold_chat_ids
+
+
+class Command(BaseCommand):
+    help = "Move messages of long-archived chats into compressed cold storage (restored when the chat is reopened)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.CHAT_COLD_STORAGE_AFTER_DAYS,
+            help="Only chats archived at least this many days ago"
+        )
+        parser.add_argument("--limit", type=int, default=None, help="Maximum number of chats to archive in this run")
+
+    def handle(self, *args, **options):
+        chat_ids = list(cold_chat_ids(options["days"])[:options["limit"]])
+        chats = messages = 0
+        for chat_id in chat_ids:
+            moved = archive_chat(chat_id)
+            if moved:
+                chats += 1
+                messages += moved
+                self.stdout.write(f"Chat {chat_id}: {moved} messages archived")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {messages} messages from {chats} chats moved to cold storage"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from apps.chat.models import Chat
+
+
+class Command(BaseCommand):
+    help = "Populate the denormalized chat summary columns (message count, last message) from existing messages."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Chats updated per UPDATE statement")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        last_id = 0
+        total = 0
+        while True:
+            ids = list(
+                Chat.objects.filter(pk__gt=last_id).order_by("pk").values_list("pk", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            total += Chat.refresh_summaries(ids)
+            last_id = ids[-1]
+            self.stdout.write(f"Backfilled {total} chats (up to id {last_id})")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {total} chats backfilled"))
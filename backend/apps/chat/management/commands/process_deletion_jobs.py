@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from apps.chat.deletion import BATCH_SIZE, claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Process queued chat/user deletions in primary-key batches. Use --loop to run as a worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows deleted per transaction")
+        parser.add_argument("--loop", action="store_true", help="Keep polling for new jobs")
+        parser.add_argument("--sleep", type=float, default=5.0, help="Seconds between polls when idle (with --loop)")
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if not options["loop"]:
+                    break
+                time.sleep(options["sleep"])
+                continue
+
+            self.stdout.write(f"Deleting {job.target_type} {job.target_id} (job {job.pk})")
+            if run_job(job, batch_size=options["batch_size"]):
+                self.stdout.write(self.style.SUCCESS(f"Job {job.pk} done"))
+            else:
+                self.stdout.write(self.style.ERROR(f"Job {job.pk} failed"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from apps.chat.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index over message content (e.g. after changing normalization rules)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Messages indexed per batch")
+
+    def handle(self, *args, **options):
+        total = rebuild_index(batch_size=options["batch_size"], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Done: {total} messages indexed"))
@@ -0,0 +1,38 @@
+import socket
+import time
+from django.core.management.base import BaseCommand
+from apps.chat.jobs import ensure_group, relay_events
+from apps.chat.redis_config import get_sync_redis_connection
+
+# Events that failed (e.g. the database was down) are retried this often
+PENDING_RETRY_SECONDS = 60
+
+
+class Command(BaseCommand):
+    help = "Relay the AI worker's heavy-job progress and results to chat websockets, saving finished answers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--consumer", default=socket.gethostname(), help="Consumer name in the relay group")
+        parser.add_argument("--once", action="store_true", help="Handle the events waiting now and exit")
+
+    def relay_pending(self, conn, consumer):
+        handled = relay_events(conn, consumer, pending=True)
+        if handled:
+            self.stdout.write(f"{handled} unacknowledged events handled")
+        return time.monotonic()
+
+    def handle(self, *args, **options):
+        conn = get_sync_redis_connection()
+        ensure_group(conn)
+        consumer = options["consumer"]
+
+        last_pending = self.relay_pending(conn, consumer)
+        while True:
+            if time.monotonic() - last_pending >= PENDING_RETRY_SECONDS:
+                last_pending = self.relay_pending(conn, consumer)
+            handled = relay_events(conn, consumer)
+            if handled:
+                self.stdout.write(f"{handled} events relayed")
+            elif options["once"]:
+                break
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -5,6 +5,7 @@ from django.contrib.auth.models import AnonymousUser
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from urllib.parse import parse_qs
+from .user_cache import get_user_snapshot, snapshot_user
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,11 +16,15 @@ User = get_user_model()
 def get_user(token_key):
     try:
         access_token = AccessToken(token_key)
-        user = User.objects.get(id=access_token.payload.get('user_id'))
-        return user
-    except (InvalidToken, TokenError, User.DoesNotExist):
+    except (InvalidToken, TokenError):
         return AnonymousUser()
 
+    # Cached snapshot instead of a User query on every connect
+    snapshot = get_user_snapshot(access_token.payload.get('user_id'))
+    if snapshot is None or not snapshot['is_active']:
+        return AnonymousUser()
+    return snapshot_user(snapshot)
+
 class JwtAuthMiddleware(BaseMiddleware):
     async def __call__(self, scope, receive, send):
         # Get the token from query string
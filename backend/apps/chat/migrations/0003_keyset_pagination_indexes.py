@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-19 11:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_chat_summary_columns'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='chat',
+            name='chat_chat_user_id_255cec_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='chat_messag_chat_id_013eed_idx',
+        ),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['user', 'is_archived', '-last_activity', '-id'], name='chat_chat_user_id_91ee40_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat', 'created_at', 'id'], name='chat_messag_chat_id_83c40a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['-created_at', '-id'], name='chat_messag_created_78daf0_idx'),
+        ),
+    ]
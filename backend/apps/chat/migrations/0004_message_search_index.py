@@ -0,0 +1,43 @@
+from django.db import migrations
+
+# Frozen copies of apps.chat.search's table names; existing messages are
+# indexed afterwards with `manage.py rebuild_message_search_index`
+SQLITE_TABLE = 'chat_message_fts'
+POSTGRES_TABLE = 'chat_message_search'
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {SQLITE_TABLE} USING fts5(body, tokenize='unicode61 remove_diacritics 2')"
+        )
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE TABLE {POSTGRES_TABLE} ("
+            f"message_id bigint PRIMARY KEY REFERENCES chat_message(id) ON DELETE CASCADE, "
+            f"body text NOT NULL, "
+            f"document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX {POSTGRES_TABLE}_document_idx ON {POSTGRES_TABLE} USING GIN (document)"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SQLITE_TABLE}")
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {POSTGRES_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
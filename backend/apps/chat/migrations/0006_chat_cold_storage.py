@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-19 11:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_archived_at(apps, schema_editor):
+    # Best available estimate for chats archived before archived_at existed
+    Chat = apps.get_model('chat', 'Chat')
+    Chat.objects.filter(is_archived=True, archived_at__isnull=True).update(archived_at=F('last_activity'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_chat_deletion_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codec', models.CharField(default='zstd', max_length=10)),
+                ('data', models.BinaryField()),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('raw_size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='in_cold_storage',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['is_archived', 'in_cold_storage', 'archived_at'], name='chat_chat_is_arch_82ea10_idx'),
+        ),
+        migrations.AddField(
+            model_name='chatarchive',
+            name='chat',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archive', to='chat.chat'),
+        ),
+        migrations.RunPython(backfill_archived_at, migrations.RunPython.noop),
+    ]
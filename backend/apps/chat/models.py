@@ -1,8 +1,10 @@
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
-from django.db.models import Q, Index, F, JSONField
+from django.db.models import Q, Index, F, JSONField, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Substr
 from django.contrib.auth import get_user_model
+from .conditional import bump_chat_list_version
 
 User = get_user_model()
 
@@ -12,17 +14,61 @@ class Chat(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     last_activity = models.DateTimeField(auto_now=True)
     is_archived = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(null=True, blank=True)
+    # Messages live in ChatArchive instead of the Message table (see archival.py)
+    in_cold_storage = models.BooleanField(default=False)
+    # Set when deletion is requested; rows are removed later by a DeletionJob
+    is_deleted = models.BooleanField(default=False)
+
+    # Denormalized summary, maintained on message insert/delete (see signals.py)
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_preview = models.CharField(max_length=100, blank=True, default='')
+    last_message_role = models.CharField(max_length=10, blank=True, default='')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+
+    PREVIEW_LENGTH = 100
+    SUMMARY_FIELDS = ['message_count', 'last_message_preview', 'last_message_role', 'last_message_at', 'last_activity']
 
     class Meta:
         indexes = [
             Index(fields=['-last_activity']),
-            Index(fields=['user', '-created_at'])
+            Index(fields=['user', '-created_at']),
+            Index(fields=['user', 'is_archived', '-last_activity', '-id']),
+            Index(fields=['is_archived', 'in_cold_storage', 'archived_at']),
         ]
         ordering = ['-last_activity']
 
     def __str__(self):
         return f"Chat {self.id} - {self.title or 'Untitled'}"
 
+    @classmethod
+    def refresh_summaries(cls, chat_ids=None):
+        """Recompute the summary columns from messages in a single UPDATE."""
+        messages = Message.objects.filter(chat=OuterRef('pk'))
+        latest = messages.order_by('-created_at', '-id')
+        count = messages.order_by().values('chat').annotate(total=Count('pk')).values('total')
+        preview = latest.annotate(preview=Substr('content', 1, cls.PREVIEW_LENGTH)).values('preview')[:1]
+
+        chats = cls.objects.all() if chat_ids is None else cls.objects.filter(pk__in=chat_ids)
+        if chat_ids is not None:
+            for user_id in set(chats.values_list('user_id', flat=True)):
+                bump_chat_list_version(user_id)
+        return chats.update(
+            message_count=Coalesce(Subquery(count), 0),
+            last_message_preview=Coalesce(Subquery(preview), Value('')),
+            last_message_role=Coalesce(Subquery(latest.values('role')[:1]), Value('')),
+            last_message_at=Subquery(latest.values('created_at')[:1]),
+        )
+
+
+class MessageQuerySet(models.QuerySet):
+    def delete(self):
+        chat_ids = set(self.values_list('chat_id', flat=True))
+        result = super().delete()
+        if chat_ids:
+            Chat.refresh_summaries(chat_ids)
+        return result
+
 
 class Message(models.Model):
     ROLE_USER = 'user'
@@ -43,12 +89,106 @@ class Message(models.Model):
     tokens_used = models.PositiveIntegerField(null=True, blank=True)
     response_time = models.FloatField(null=True, blank=True)
 
+    objects = MessageQuerySet.as_manager()
+
     class Meta:
         indexes = [
-            Index(fields=['chat', '-created_at']),
+            Index(fields=['chat', 'created_at', 'id']),
+            Index(fields=['-created_at', '-id']),
             Index(fields=['role', '-created_at'])
         ]
         ordering = ['created_at']
 
     def __str__(self):
         return f"{self.role} message in chat {self.chat_id}"
+
+    def delete(self, *args, **kwargs):
+        # Deletes are rare, so the summary is simply recomputed. A post_delete
+        # receiver is avoided on purpose: it would disable fast cascade deletes.
+        result = super().delete(*args, **kwargs)
+        Chat.refresh_summaries([self.chat_id])
+        return result
+
+
+class ChatArchive(models.Model):
+    """
+    Cold copy of an archived chat's messages: one compressed, column-packed
+    record per chat, so the hot Message table only holds live conversations.
+    """
+    CODEC_ZSTD = 'zstd'
+
+    chat = models.OneToOneField(Chat, on_delete=models.CASCADE, related_name='archive')
+    codec = models.CharField(max_length=10, default=CODEC_ZSTD)
+    data = models.BinaryField()
+    message_count = models.PositiveIntegerField(default=0)
+    raw_size = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archive of chat {self.chat_id} ({self.message_count} messages)"
+
+
+class DeletionJob(models.Model):
+    """
+    Background removal of a chat or a user and everything under it.
+    Created when deletion is requested (the target is soft-marked at once)
+    and processed in primary-key batches by `process_deletion_jobs`.
+    """
+    TARGET_CHAT = 'chat'
+    TARGET_USER = 'user'
+
+    TARGET_CHOICES = [
+        (TARGET_CHAT, 'Chat'),
+        (TARGET_USER, 'User'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    target_type = models.CharField(max_length=10, choices=TARGET_CHOICES)
+    target_id = models.PositiveBigIntegerField()
+    target_label = models.CharField(max_length=255, blank=True, default='')
+    requested_by = models.ForeignKey(
+        User,
+        related_name='requested_deletions',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    total_items = models.PositiveIntegerField(default=0)
+    deleted_items = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            Index(fields=['status', 'created_at']),
+            Index(fields=['target_type', 'target_id']),
+        ]
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Delete {self.target_type} {self.target_id} ({self.status})"
+
+    @property
+    def progress(self):
+        if self.status == self.STATUS_DONE:
+            return 100
+        if not self.total_items:
+            return 0
+        return min(99, int(100 * self.deleted_items / self.total_items))
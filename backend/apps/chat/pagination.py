@@ -0,0 +1,126 @@
+import base64
+import json
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a composite (timestamp, id) key.
+
+    Pages are fetched with `WHERE (ts, id) > (cursor_ts, cursor_id)` instead of
+    OFFSET, so deep pages cost the same as the first one. `?since=<cursor>`
+    returns only rows newer than the cursor, letting a reconnecting client
+    fetch a delta. The response always carries `cursor` (the key of the last
+    row returned) for that purpose.
+    """
+    ordering = ('created_at', 'id')
+    page_size = 100
+    max_page_size = 500
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    since_query_param = 'since'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ts_field, id_field = (field.lstrip('-') for field in self.ordering)
+        self.fields = (ts_field, id_field)
+        descending = self.ordering[0].startswith('-')
+
+        since = request.query_params.get(self.since_query_param)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if since:
+            # Delta sync: always "newer than", oldest first
+            key = self.decode_cursor(since)
+            queryset = queryset.filter(self._after(key)).order_by(ts_field, id_field)
+        else:
+            queryset = queryset.order_by(*self.ordering)
+            if cursor:
+                key = self.decode_cursor(cursor)
+                queryset = queryset.filter(self._before(key) if descending else self._after(key))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if self.page:
+            self.cursor = self.encode_cursor(self.page[-1])
+        else:
+            self.cursor = since or cursor
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'cursor': self.cursor,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.since_query_param in self.request.query_params:
+            url = replace_query_param(url, self.since_query_param, self.cursor)
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.cursor)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, obj):
+        ts_field, id_field = self.fields
+        key = [getattr(obj, ts_field).isoformat(), getattr(obj, id_field)]
+        return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+    def decode_cursor(self, value):
+        try:
+            ts, pk = json.loads(base64.urlsafe_b64decode(value.encode()))
+            parsed = parse_datetime(ts)
+            if parsed is None:
+                raise ValueError(ts)
+            return parsed, int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _after(self, key):
+        ts_field, id_field = self.fields
+        ts, pk = key
+        return Q(**{f'{ts_field}__gt': ts}) | Q(**{ts_field: ts, f'{id_field}__gt': pk})
+
+    def _before(self, key):
+        ts_field, id_field = self.fields
+        ts, pk = key
+        return Q(**{f'{ts_field}__lt': ts}) | Q(**{ts_field: ts, f'{id_field}__lt': pk})
+
+
+class MessageKeysetPagination(KeysetPagination):
+    ordering = ('created_at', 'id')
+
+
+class ChatKeysetPagination(KeysetPagination):
+    ordering = ('-last_activity', '-id')
+
+
+class RecentMessageKeysetPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
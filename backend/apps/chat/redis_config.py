@@ -1,8 +1,10 @@
 from redis.asyncio import Redis
+from redis import Redis as SyncRedis, ConnectionPool
 from django.conf import settings
 from datetime import datetime
 import json
 import asyncio
+import time
 import uuid
 
 class DateTimeEncoder(json.JSONEncoder):
@@ -20,10 +22,38 @@ async def get_redis_connection():
     )
     return redis
 
+_sync_pool = None
+
+def get_sync_redis_connection():
+    """Shared synchronous client for regular (non-async) Django code paths."""
+    global _sync_pool
+    if _sync_pool is None:
+        _sync_pool = ConnectionPool(
+            host=settings.REDIS_HOST or "localhost",
+            port=int(settings.REDIS_PORT or 6379),
+            password=settings.REDIS_PASSWORD,
+            decode_responses=True,
+            socket_timeout=2,
+            socket_connect_timeout=2,
+        )
+    return SyncRedis(connection_pool=_sync_pool)
+
 # Redis Stream keys
 CHAT_STREAM_KEY = "chat_stream"
 RESPONSE_STREAM_KEY = "response_stream"
+DEAD_LETTER_STREAM_KEY = "dead_letter_stream"  # questions the AI worker gave up on
 MSG_MAP_PREFIX = "msg_map:"  # mapping key prefix for message_id -> request_entry_id
+RESULT_KEY_PREFIX = "result:"  # full query results the AI worker keeps for paging, by message_id
+# Progress and results of questions the AI worker moved to its heavy-job lane,
+# relayed to the chat groups by the relay_ai_job_events command
+JOB_EVENTS_STREAM_KEY = "ai_job_events"
+JOB_EVENTS_GROUP = "chat_relay"
+# Executions and EXPLAIN ANALYZE samples of AI-generated SQL, read by ingest_query_log
+QUERY_LOG_STREAM_KEY = "query_log_stream"
+QUERY_LOG_GROUP = "querylog"
+# How long ChatConsumer waits for an answer (3 attempts x 60 s). Stamped into each
+# request as an absolute deadline; the AI worker drops questions still queued past it
+AI_RESPONSE_DEADLINE_SECONDS = 3 * 60
 
 async def create_message_data(user_id, website_user_role, message_role, chat_id, content, is_first_message=False, chat_history="[]", message_id=None):
     current_time = datetime.utcnow().isoformat()
@@ -36,6 +66,7 @@ async def create_message_data(user_id, website_user_role, message_role, chat_id,
         "content": str(content),
         "is_first_message": "1" if is_first_message else "0",
         "timestamp": current_time,
+        "deadline": f"{time.time() + AI_RESPONSE_DEADLINE_SECONDS:.3f}",
         "last_twenty_messages": chat_history
     }
 
@@ -0,0 +1,77 @@
+import base64
+import json
+import zlib
+from .redis_config import RESULT_KEY_PREFIX
+
+# Rows per "show more" page unless the client asks otherwise
+RESULT_PAGE_SIZE = 50
+RESULT_MAX_PAGE_SIZE = 500
+
+
+def _chunks_key(message_id):
+    return f"{RESULT_KEY_PREFIX}{message_id}:chunks"
+
+
+def _decode_chunk(raw):
+    return json.loads(zlib.decompress(base64.b64decode(raw)))
+
+
+def _clamp(offset, limit):
+    return max(0, offset), max(1, min(limit, RESULT_MAX_PAGE_SIZE))
+
+
+def _owned_meta(raw, user_id, chat_id):
+    if not raw:
+        return None
+    meta = json.loads(raw)
+    if meta.get('user_id') != str(user_id) or (chat_id is not None and meta.get('chat_id') != str(chat_id)):
+        return None
+    return meta
+
+
+def _chunk_range(meta, offset, limit):
+    size = meta['chunk_rows']
+    return offset // size, (offset + limit - 1) // size
+
+
+def _page(message_id, meta, chunks, offset, limit):
+    first, _ = _chunk_range(meta, offset, limit)
+    rows = [row for chunk in chunks for row in _decode_chunk(chunk)]
+    start = offset - first * meta['chunk_rows']
+    rows = rows[start:start + limit]
+    end = offset + len(rows)
+    return {
+        'message_id': message_id,
+        'columns': meta['columns'],
+        'rows': rows,
+        'offset': offset,
+        'total': meta['total'],
+        'truncated': meta.get('truncated', False),
+        'next_offset': end if end < meta['total'] else None,
+    }
+
+
+def get_result_page(conn, message_id, user_id, chat_id=None, offset=0, limit=RESULT_PAGE_SIZE):
+    """
+    Rows offset..offset+limit of the result behind an AI answer, straight from
+    the worker's cache. None when the result expired, never existed or belongs
+    to another user or chat. Only the chunks covering the page are read.
+    """
+    offset, limit = _clamp(offset, limit)
+    meta = _owned_meta(conn.get(f"{RESULT_KEY_PREFIX}{message_id}"), user_id, chat_id)
+    if meta is None:
+        return None
+    first, last = _chunk_range(meta, offset, limit)
+    chunks = conn.lrange(_chunks_key(message_id), first, last) if offset < meta['total'] else []
+    return _page(message_id, meta, chunks, offset, limit)
+
+
+async def aget_result_page(redis_conn, message_id, user_id, chat_id=None, offset=0, limit=RESULT_PAGE_SIZE):
+    """Async variant of get_result_page for consumers."""
+    offset, limit = _clamp(offset, limit)
+    meta = _owned_meta(await redis_conn.get(f"{RESULT_KEY_PREFIX}{message_id}"), user_id, chat_id)
+    if meta is None:
+        return None
+    first, last = _chunk_range(meta, offset, limit)
+    chunks = await redis_conn.lrange(_chunks_key(message_id), first, last) if offset < meta['total'] else []
+    return _page(message_id, meta, chunks, offset, limit)
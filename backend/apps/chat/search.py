@@ -0,0 +1,189 @@
+import re
+from django.db import connection as default_connection
+from django.utils.html import escape
+
+# SQLite (dev): FTS5 virtual table keyed by rowid = message id.
+# PostgreSQL: side table with a tsvector column and a GIN index; rows cascade
+# with the message. Both store the normalized text so snippets match queries.
+SQLITE_TABLE = 'chat_message_fts'
+POSTGRES_TABLE = 'chat_message_search'
+
+MAX_QUERY_TERMS = 8
+SNIPPET_WORDS = 16
+# Private-use markers survive escaping and are swapped for <mark> afterwards
+_START, _STOP = '\ue000', '\ue001'
+
+_CHAR_MAP = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ك': 'ک', 'ة': 'ه', 'ۀ': 'ه', 'أ': 'ا', 'إ': 'ا',
+    '\u200c': ' ',   # ZWNJ: "می‌خواهم" and "می خواهم" index the same
+    '\u200d': None, '\u200e': None, '\u200f': None, '\u0640': None,  # ZWJ, bidi marks, tatweel
+    **{persian: str(i) for i, persian in enumerate('۰۱۲۳۴۵۶۷۸۹')},
+    **{arabic: str(i) for i, arabic in enumerate('٠١٢٣٤٥٦٧٨٩')},
+})
+_DIACRITICS_RE = re.compile('[\u064b-\u0652\u0670]')
+_SPACE_RE = re.compile(r'\s+')
+_TERM_RE = re.compile(r'[^\W_]+')
+
+
+def normalize_persian(text):
+    """Unify Arabic/Persian letter forms, digits and ZWNJ; used for both documents and queries."""
+    if not text:
+        return ''
+    text = _DIACRITICS_RE.sub('', text.translate(_CHAR_MAP))
+    return _SPACE_RE.sub(' ', text).strip().lower()
+
+
+def query_terms(query):
+    return _TERM_RE.findall(normalize_persian(query))[:MAX_QUERY_TERMS]
+
+
+def index_messages(rows, connection=None):
+    """Add or replace index entries for (message_id, content) pairs."""
+    connection = connection or default_connection
+    params = [(pk, normalize_persian(content)) for pk, content in rows]
+    if not params:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.executemany(f'DELETE FROM {SQLITE_TABLE} WHERE rowid = %s', [(pk,) for pk, _ in params])
+            cursor.executemany(f'INSERT INTO {SQLITE_TABLE} (rowid, body) VALUES (%s, %s)', params)
+        elif connection.vendor == 'postgresql':
+            cursor.executemany(
+                f"INSERT INTO {POSTGRES_TABLE} (message_id, body, document) "
+                f"VALUES (%s, %s, to_tsvector('simple', %s)) "
+                f"ON CONFLICT (message_id) DO UPDATE SET body = EXCLUDED.body, document = EXCLUDED.document",
+                [(pk, body, body) for pk, body in params],
+            )
+
+
+def remove_from_index(message_ids, connection=None):
+    """Drop index entries for deleted messages. PostgreSQL cascades on its own."""
+    connection = connection or default_connection
+    if connection.vendor != 'sqlite' or not message_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {SQLITE_TABLE} WHERE rowid = %s', [(pk,) for pk in message_ids])
+
+
+def rebuild_index(batch_size=1000, connection=None, stdout=None):
+    """
+    Re-index every message in primary-key batches. Also drops entries whose
+    message no longer exists (SQLite has no cascade from chat_message).
+    """
+    connection = connection or default_connection
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return 0
+    table = SQLITE_TABLE if connection.vendor == 'sqlite' else POSTGRES_TABLE
+    key = 'rowid' if connection.vendor == 'sqlite' else 'message_id'
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {key} NOT IN (SELECT id FROM chat_message)')
+
+    last_id, total = 0, 0
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT id, content FROM chat_message WHERE id > %s ORDER BY id LIMIT %s',
+                [last_id, batch_size],
+            )
+            rows = cursor.fetchall()
+        if not rows:
+            break
+        index_messages(rows, connection)
+        total += len(rows)
+        last_id = rows[-1][0]
+        if stdout:
+            stdout.write(f"Indexed {total} messages (up to id {last_id})")
+    return total
+
+
+def _search_sqlite(cursor, terms, user_id, limit):
+    match = ' '.join(f'"{term}"*' for term in terms)
+    user_filter = 'AND c.user_id = %s' if user_id is not None else ''
+    cursor.execute(
+        f"""
+        SELECT f.rowid,
+               snippet({SQLITE_TABLE}, 0, %s, %s, '…', {SNIPPET_WORDS}),
+               -bm25({SQLITE_TABLE}) AS score
+        FROM {SQLITE_TABLE} f
+        JOIN chat_message m ON m.id = f.rowid
+        JOIN chat_chat c ON c.id = m.chat_id
+        WHERE {SQLITE_TABLE} MATCH %s AND NOT c.is_deleted {user_filter}
+        ORDER BY score DESC
+        LIMIT %s
+        """,
+        [_START, _STOP, match] + ([user_id] if user_id is not None else []) + [limit],
+    )
+    return cursor.fetchall()
+
+
+def _search_postgres(cursor, terms, user_id, limit):
+    tsquery = ' & '.join(f'{term}:*' for term in terms)
+    user_filter = 'AND c.user_id = %s' if user_id is not None else ''
+    # Rank and limit first; ts_headline is costly and only runs on the final page
+    cursor.execute(
+        f"""
+        SELECT r.message_id,
+               ts_headline('simple', s.body, r.query, %s),
+               r.rank
+        FROM (
+            SELECT s.message_id, q.query, ts_rank(s.document, q.query) AS rank
+            FROM {POSTGRES_TABLE} s
+            JOIN chat_message m ON m.id = s.message_id
+            JOIN chat_chat c ON c.id = m.chat_id
+            CROSS JOIN to_tsquery('simple', %s) AS q(query)
+            WHERE s.document @@ q.query AND NOT c.is_deleted {user_filter}
+            ORDER BY rank DESC
+            LIMIT %s
+        ) r
+        JOIN {POSTGRES_TABLE} s ON s.message_id = r.message_id
+        ORDER BY r.rank DESC
+        """,
+        [f'StartSel={_START}, StopSel={_STOP}, MaxWords={SNIPPET_WORDS}, MinWords=5', tsquery]
+        + ([user_id] if user_id is not None else []) + [limit],
+    )
+    return cursor.fetchall()
+
+
+def _highlight(snippet):
+    return escape(snippet).replace(_START, '<mark>').replace(_STOP, '</mark>')
+
+
+def search_messages(query, user_id=None, limit=20):
+    """
+    Ranked full-text search over message content, best match first.
+    Limit to one user's chats with user_id. Each returned Message carries
+    `snippet` (HTML-escaped, matches wrapped in <mark>) and `rank`.
+    """
+    from .models import Message
+
+    terms = query_terms(query)
+    if not terms:
+        return []
+
+    vendor = default_connection.vendor
+    if vendor in ('sqlite', 'postgresql'):
+        with default_connection.cursor() as cursor:
+            if vendor == 'sqlite':
+                hits = _search_sqlite(cursor, terms, user_id, limit)
+            else:
+                hits = _search_postgres(cursor, terms, user_id, limit)
+    else:
+        # No full-text index on this backend; plain containment as a fallback
+        qs = Message.objects.filter(chat__is_deleted=False)
+        for term in terms:
+            qs = qs.filter(content__icontains=term)
+        if user_id is not None:
+            qs = qs.filter(chat__user_id=user_id)
+        hits = [(pk, content[:200], 0.0) for pk, content in
+                qs.order_by('-created_at').values_list('pk', 'content')[:limit]]
+
+    messages = Message.objects.select_related('chat__user').in_bulk([pk for pk, _, _ in hits])
+    results = []
+    for pk, snippet, rank in hits:
+        message = messages.get(pk)
+        if message is None:
+            continue
+        message.snippet = _highlight(snippet)
+        message.rank = rank
+        results.append(message)
+    return results
@@ -2,7 +2,6 @@ from rest_framework import serializers
 from .models import Chat, Message
 
 class ChatListSerializer(serializers.ModelSerializer):
-    message_count = serializers.SerializerMethodField()
     last_message = serializers.SerializerMethodField()
 
     class Meta:
@@ -16,23 +15,16 @@ class ChatListSerializer(serializers.ModelSerializer):
             'message_count',
             'last_message'
         ]
-        read_only_fields = ['created_at', 'last_activity']
-
-    def get_message_count(self, obj):
-        try:
-            return obj.message_count
-        except AttributeError:
-            return obj.messages.count()
+        read_only_fields = ['created_at', 'last_activity', 'message_count']
 
     def get_last_message(self, obj):
-        last_msg = obj.messages.order_by('-created_at').first()
-        if last_msg:
-            return {
-                'content': last_msg.content[:100],
-                'role': last_msg.role,
-                'created_at': last_msg.created_at
-            }
-        return None
+        if obj.last_message_at is None:
+            return None
+        return {
+            'content': obj.last_message_preview,
+            'role': obj.last_message_role,
+            'created_at': obj.last_message_at
+        }
 
 class ChatCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -58,4 +50,23 @@ class MessageSerializer(serializers.ModelSerializer):
             'tokens_used',
             'response_time'
         ]
-        read_only_fields = fields
\ No newline at end of file
+        read_only_fields = fields
+
+class MessageSearchResultSerializer(serializers.ModelSerializer):
+    chat_id = serializers.IntegerField(read_only=True)
+    chat_title = serializers.CharField(source='chat.title', read_only=True)
+    snippet = serializers.CharField(read_only=True)
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Message
+        fields = [
+            'id',
+            'chat_id',
+            'chat_title',
+            'role',
+            'created_at',
+            'snippet',
+            'rank'
+        ]
+        read_only_fields = fields
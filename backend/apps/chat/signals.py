@@ -0,0 +1,53 @@
+from django.db.models import F, Q, Case, When, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Chat, Message
+from .conditional import bump_chat_list_version
+from .search import index_messages
+
+
+@receiver(post_save, sender=Message)
+def update_chat_summary(sender, instance, created, **kwargs):
+    """Bump the chat's denormalized summary in one atomic UPDATE."""
+    if not created:
+        return
+
+    is_latest = Q(last_message_at__isnull=True) | Q(last_message_at__lte=instance.created_at)
+    Chat.objects.filter(pk=instance.chat_id).update(
+        message_count=F('message_count') + 1,
+        last_activity=Greatest('last_activity', Value(instance.created_at)),
+        last_message_preview=Case(
+            When(is_latest, then=Value(instance.content[:Chat.PREVIEW_LENGTH])),
+            default=F('last_message_preview'),
+        ),
+        last_message_role=Case(
+            When(is_latest, then=Value(instance.role)),
+            default=F('last_message_role'),
+        ),
+        last_message_at=Case(
+            When(is_latest, then=Value(instance.created_at)),
+            default=F('last_message_at'),
+        ),
+    )
+
+    # Keep an already loaded chat (e.g. Message.objects.create(chat=chat)) in sync
+    if Message.chat.is_cached(instance):
+        instance.chat.refresh_from_db(fields=Chat.SUMMARY_FIELDS)
+        user_id = instance.chat.user_id
+    else:
+        user_id = Chat.objects.filter(pk=instance.chat_id).values_list('user_id', flat=True).first()
+    if user_id:
+        bump_chat_list_version(user_id)
+
+
+@receiver(post_save, sender=Message)
+def index_message_content(sender, instance, **kwargs):
+    """Keep the full-text index current; indexed on every save in case content changes."""
+    index_messages([(instance.pk, instance.content)])
+
+
+@receiver(post_save, sender=Chat)
+@receiver(post_delete, sender=Chat)
+def invalidate_chat_list(sender, instance, **kwargs):
+    bump_chat_list_version(instance.user_id)
@@ -2,7 +2,8 @@ import pytest
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
-from apps.chat.models import Chat, Message
+from apps.chat.models import Chat, Message, DeletionJob
+from apps.chat.search import normalize_persian
 
 User = get_user_model()
 
@@ -69,6 +70,17 @@ class TestChatViews:
         for chat in data:
             assert 'message_count' in chat
 
+    def test_active_chats_view_is_single_query(self, auth_client, user, django_assert_num_queries):
+        for _ in range(5):
+            chat = Chat.objects.create(user=user)
+            Message.objects.create(chat=chat, role=Message.ROLE_USER, content="Hi")
+        url = reverse('chat:active-chats')
+        # keyset pagination needs no COUNT: one page query regardless of chat count
+        with django_assert_num_queries(1):
+            response = auth_client.get(url, format='json')
+        assert response.status_code == 200
+        assert all(chat['message_count'] == 1 for chat in response.data['results'])
+
     def test_archived_chats_view(self, auth_client, active_chat, archived_chat):
         url = reverse('chat:archived-chats')
         response = auth_client.get(url, format='json')
@@ -96,8 +108,14 @@ class TestChatViews:
         chat = Chat.objects.create(user=user)
         url = reverse('chat:delete-chat', args=[chat.id])
         response = auth_client.delete(url, format='json')
-        assert response.status_code == 204
-        assert not Chat.objects.filter(id=chat.id).exists()
+        assert response.status_code == 202
+        chat.refresh_from_db()
+        assert chat.is_deleted is True
+        assert DeletionJob.objects.filter(id=response.data['job_id'], target_id=chat.id).exists()
+
+        # Hidden from lists and detail at once
+        assert auth_client.get(reverse('chat:active-chats')).data['results'] == []
+        assert auth_client.delete(url, format='json').status_code == 404
 
     def test_unauthorized_modify_chat(self, api_client, user):
         # Chat created by user
@@ -162,6 +180,129 @@ class TestMessageViews:
         response = auth_client.get(url)
         assert len(response.data['results']) == 0  # Check results from pagination
 
+@pytest.mark.django_db
+class TestKeysetPagination:
+    def test_message_pages_follow_cursor(self, auth_client, active_chat):
+        created = [
+            Message.objects.create(chat=active_chat, role=Message.ROLE_USER, content=f"m{i}")
+            for i in range(5)
+        ]
+        url = reverse('chat:chat-messages', args=[active_chat.id])
+
+        first = auth_client.get(url, {'limit': 2})
+        assert [m['id'] for m in first.data['results']] == [created[0].id, created[1].id]
+        assert first.data['next'] is not None
+
+        second = auth_client.get(first.data['next'])
+        assert [m['id'] for m in second.data['results']] == [created[2].id, created[3].id]
+
+        third = auth_client.get(second.data['next'])
+        assert [m['id'] for m in third.data['results']] == [created[4].id]
+        assert third.data['next'] is None
+
+    def test_since_returns_only_new_messages(self, auth_client, active_chat):
+        Message.objects.create(chat=active_chat, role=Message.ROLE_USER, content="old")
+        url = reverse('chat:chat-messages', args=[active_chat.id])
+        cursor = auth_client.get(url).data['cursor']
+
+        fresh = Message.objects.create(chat=active_chat, role=Message.ROLE_ASSISTANT, content="new")
+        delta = auth_client.get(url, {'since': cursor})
+        assert [m['id'] for m in delta.data['results']] == [fresh.id]
+        assert delta.data['cursor'] != cursor
+
+        empty = auth_client.get(url, {'since': delta.data['cursor']})
+        assert empty.data['results'] == []
+        assert empty.data['cursor'] == delta.data['cursor']
+
+    def test_chat_list_pages_by_last_activity(self, auth_client, user):
+        chats = [Chat.objects.create(user=user) for _ in range(3)]
+        url = reverse('chat:active-chats')
+
+        first = auth_client.get(url, {'limit': 2})
+        assert [c['id'] for c in first.data['results']] == [chats[2].id, chats[1].id]
+        second = auth_client.get(first.data['next'])
+        assert [c['id'] for c in second.data['results']] == [chats[0].id]
+
+    def test_invalid_cursor(self, auth_client, active_chat):
+        url = reverse('chat:chat-messages', args=[active_chat.id])
+        response = auth_client.get(url, {'cursor': 'not-a-cursor'})
+        assert response.status_code == 404
+
+@pytest.mark.django_db
+class TestConditionalGet:
+    def test_messages_not_modified(self, auth_client, active_chat, message, django_assert_num_queries):
+        url = reverse('chat:chat-messages', args=[active_chat.id])
+        first = auth_client.get(url)
+        assert first.status_code == 200
+        etag = first['ETag']
+        assert first['Last-Modified']
+
+        # only the chat validator lookup runs, no message query or serialization
+        with django_assert_num_queries(1):
+            cached = auth_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert cached.status_code == 304
+        assert cached['ETag'] == etag
+
+        Message.objects.create(chat=active_chat, role=Message.ROLE_ASSISTANT, content="New answer")
+        changed = auth_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert changed.status_code == 200
+        assert changed['ETag'] != etag
+
+    def test_chat_list_uses_redis_version(self, auth_client, active_chat, monkeypatch, django_assert_num_queries):
+        version = {"value": "7"}
+        monkeypatch.setattr('apps.chat.views.get_chat_list_version', lambda user_id: version["value"])
+        url = reverse('chat:active-chats')
+        etag = auth_client.get(url)['ETag']
+
+        with django_assert_num_queries(0):
+            cached = auth_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert cached.status_code == 304
+
+        version["value"] = "8"
+        assert auth_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    def test_no_etag_without_redis(self, auth_client, active_chat, monkeypatch):
+        monkeypatch.setattr('apps.chat.views.get_chat_list_version', lambda user_id: None)
+        response = auth_client.get(reverse('chat:active-chats'))
+        assert response.status_code == 200
+        assert not response.has_header('ETag')
+
+@pytest.mark.django_db
+class TestMessageSearch:
+    def test_normalize_persian(self):
+        assert normalize_persian("كد تعرفه ۸۵۱۷ مي\u200cخواهم") == "کد تعرفه 8517 می خواهم"
+
+    def test_search_matches_normalized_text(self, auth_client, active_chat):
+        hit = Message.objects.create(
+            chat=active_chat, role=Message.ROLE_ASSISTANT, content="كد تعرفه 85171210 مربوط به گوشی است"
+        )
+        Message.objects.create(chat=active_chat, role=Message.ROLE_USER, content="آمار صادرات زعفران")
+
+        response = auth_client.get(reverse('chat:search-messages'), {'q': 'کد ۸۵۱۷'})
+        assert response.status_code == 200
+        results = response.data['results']
+        assert [r['id'] for r in results] == [hit.id]
+        assert results[0]['chat_id'] == active_chat.id
+        assert '<mark>' in results[0]['snippet']
+
+    def test_search_only_own_chats(self, auth_client, active_chat):
+        other_user = User.objects.create_user(email="other3@example.com", password="pass1234")
+        other_chat = Chat.objects.create(user=other_user)
+        Message.objects.create(chat=other_chat, role=Message.ROLE_USER, content="secret tariff question")
+
+        response = auth_client.get(reverse('chat:search-messages'), {'q': 'tariff'})
+        assert response.data['results'] == []
+
+    def test_search_escapes_content(self, auth_client, active_chat):
+        Message.objects.create(chat=active_chat, role=Message.ROLE_USER, content="<script>tariff</script>")
+        snippet = auth_client.get(reverse('chat:search-messages'), {'q': 'tariff'}).data['results'][0]['snippet']
+        assert '<script>' not in snippet
+        assert '<mark>tariff</mark>' in snippet
+
+    def test_search_requires_query(self, auth_client):
+        response = auth_client.get(reverse('chat:search-messages'), {'q': '  '})
+        assert response.status_code == 400
+
 @pytest.mark.django_db
 class TestChatListSerializer:
     def test_chat_list_serializer_with_messages(self, active_chat, message, assistant_message):
@@ -0,0 +1,92 @@
+import pytest
+from datetime import timedelta
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from apps.chat.models import Chat, Message, ChatArchive
+from apps.chat.archival import (
+    ARCHIVED_FIELDS, archive_chat, restore_chat, cold_chat_ids, pack_messages, unpack_messages
+)
+from apps.chat.search import search_messages
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="archive@example.com", password="testpass123")
+
+
+@pytest.fixture
+def auth_client(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+@pytest.fixture
+def old_archived_chat(user):
+    chat = Chat.objects.create(user=user)
+    Message.objects.create(chat=chat, role=Message.ROLE_USER, content="tariff for 8517?")
+    Message.objects.create(
+        chat=chat,
+        role=Message.ROLE_ASSISTANT,
+        content="The tariff is 10%",
+        ai_response_metadata={"model": "gpt-4"},
+        tokens_used=12,
+        response_time=0.8
+    )
+    Chat.objects.filter(pk=chat.pk).update(is_archived=True, archived_at=timezone.now() - timedelta(days=90))
+    chat.refresh_from_db()
+    return chat
+
+
+@pytest.mark.django_db
+class TestColdStorage:
+    def test_pack_roundtrip(self, old_archived_chat):
+        rows = list(Message.objects.filter(chat=old_archived_chat).values(*ARCHIVED_FIELDS))
+        data, raw_size = pack_messages(rows)
+        assert raw_size > 0
+        restored = unpack_messages(data)
+        assert [r['content'] for r in restored] == [r['content'] for r in rows]
+        assert restored[1]['ai_response_metadata'] == {"model": "gpt-4"}
+
+    def test_archive_and_restore(self, old_archived_chat):
+        originals = list(Message.objects.filter(chat=old_archived_chat).values())
+        assert list(cold_chat_ids(days=30)) == [old_archived_chat.pk]
+
+        assert archive_chat(old_archived_chat.pk) == 2
+        old_archived_chat.refresh_from_db()
+        assert old_archived_chat.in_cold_storage is True
+        assert old_archived_chat.message_count == 2  # summary is kept for the chat list
+        assert not Message.objects.filter(chat=old_archived_chat).exists()
+        assert ChatArchive.objects.get(chat=old_archived_chat).message_count == 2
+        assert list(cold_chat_ids(days=30)) == []
+
+        assert restore_chat(old_archived_chat) == 2
+        assert list(Message.objects.filter(chat=old_archived_chat).values()) == originals
+        assert not ChatArchive.objects.filter(chat=old_archived_chat).exists()
+        assert len(search_messages("tariff")) == 2
+
+    def test_recently_archived_chat_stays_hot(self, old_archived_chat):
+        Chat.objects.filter(pk=old_archived_chat.pk).update(archived_at=timezone.now())
+        assert list(cold_chat_ids(days=30)) == []
+
+    def test_opening_cold_chat_restores_messages(self, auth_client, old_archived_chat):
+        archive_chat(old_archived_chat.pk)
+        response = auth_client.get(reverse('chat:chat-messages', args=[old_archived_chat.pk]))
+        assert response.status_code == 200
+        assert [m['content'] for m in response.data['results']] == ["tariff for 8517?", "The tariff is 10%"]
+        old_archived_chat.refresh_from_db()
+        assert old_archived_chat.in_cold_storage is False
+
+    def test_unarchive_restores_messages(self, auth_client, old_archived_chat):
+        archive_chat(old_archived_chat.pk)
+        response = auth_client.patch(reverse('chat:toggle-archive', args=[old_archived_chat.pk]), {}, format='json')
+        assert response.status_code == 200
+        old_archived_chat.refresh_from_db()
+        assert old_archived_chat.is_archived is False
+        assert old_archived_chat.in_cold_storage is False
+        assert old_archived_chat.archived_at is None
+        assert Message.objects.filter(chat=old_archived_chat).count() == 2
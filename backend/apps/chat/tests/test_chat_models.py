@@ -6,21 +6,24 @@ from apps.chat.models import Chat, Message
 
 User = get_user_model()
 
-@pytest.mark.django_db
-class TestChatModel:
-    @pytest.fixture
-    def user(self):
-        return User.objects.create_user(
-            email="test@example.com",
-            password="testpass123",
-            first_name="Test",
-            last_name="User"
-        )
 
-    @pytest.fixture
-    def chat(self, user):
-        return Chat.objects.create(user=user)
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(
+        email="test@example.com",
+        password="testpass123",
+        first_name="Test",
+        last_name="User"
+    )
+
+
+@pytest.fixture
+def chat(user):
+    return Chat.objects.create(user=user)
 
+
+@pytest.mark.django_db
+class TestChatModel:
     def test_chat_creation(self, user):
         chat = Chat.objects.create(user=user)
         assert chat.title == 'New Chat'
@@ -50,19 +53,6 @@ class TestChatModel:
 
 @pytest.mark.django_db
 class TestMessageModel:
-    @pytest.fixture
-    def user(self):
-        return User.objects.create_user(
-            email="test@example.com",
-            password="testpass123",
-            first_name="Test",
-            last_name="User"
-        )
-
-    @pytest.fixture
-    def chat(self, user):
-        return Chat.objects.create(user=user)
-
     def test_message_creation(self, chat):
         message = Message.objects.create(
             chat=chat,
@@ -119,4 +109,47 @@ class TestMessageModel:
         assert message.ai_response_metadata == metadata
         assert message.ai_references == references
         assert message.tokens_used == 150
-        assert message.response_time == 1.5
\ No newline at end of file
+        assert message.response_time == 1.5
+
+
+@pytest.mark.django_db
+class TestChatSummary:
+    def test_summary_updated_on_insert(self, chat):
+        Message.objects.create(chat_id=chat.id, role=Message.ROLE_USER, content="Question")
+        answer = Message.objects.create(chat_id=chat.id, role=Message.ROLE_ASSISTANT, content="x" * 300)
+
+        chat.refresh_from_db()
+        assert chat.message_count == 2
+        assert chat.last_message_role == Message.ROLE_ASSISTANT
+        assert chat.last_message_preview == "x" * 100
+        assert chat.last_message_at == answer.created_at
+        assert chat.last_activity >= answer.created_at
+
+    def test_summary_updated_on_delete(self, chat):
+        question = Message.objects.create(chat=chat, role=Message.ROLE_USER, content="Question")
+        answer = Message.objects.create(chat=chat, role=Message.ROLE_ASSISTANT, content="Answer")
+
+        answer.delete()
+        chat.refresh_from_db()
+        assert chat.message_count == 1
+        assert chat.last_message_preview == "Question"
+        assert chat.last_message_at == question.created_at
+
+        Message.objects.filter(chat=chat).delete()
+        chat.refresh_from_db()
+        assert chat.message_count == 0
+        assert chat.last_message_preview == ""
+        assert chat.last_message_at is None
+
+    def test_backfill_command(self, chat):
+        from io import StringIO
+        from django.core.management import call_command
+        Message.objects.create(chat=chat, role=Message.ROLE_USER, content="Question")
+        Message.objects.create(chat=chat, role=Message.ROLE_ASSISTANT, content="Answer")
+        Chat.objects.filter(pk=chat.pk).update(message_count=0, last_message_preview='', last_message_at=None)
+
+        call_command("backfill_chat_summaries", stdout=StringIO())
+        chat.refresh_from_db()
+        assert chat.message_count == 2
+        assert chat.last_message_preview == "Answer"
+        assert chat.last_message_role == Message.ROLE_ASSISTANT
@@ -0,0 +1,100 @@
+import pytest
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from apps.chat.models import Chat, Message, DeletionJob
+from apps.chat.deletion import request_chat_deletion, request_user_deletion, claim_next_job, run_job
+from apps.chat.search import search_messages
+from apps.errorlog.models import ErrorLog
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="deleteme@example.com", password="testpass123")
+
+
+@pytest.fixture
+def admin_client(db):
+    admin = User.objects.create_superuser(email="admin-del@example.com", password="adminpass123")
+    client = APIClient()
+    client.force_authenticate(user=admin)
+    return client
+
+
+def make_chat(user, messages=5):
+    chat = Chat.objects.create(user=user)
+    for i in range(messages):
+        Message.objects.create(chat=chat, role=Message.ROLE_USER, content=f"tariff question {i}")
+    chat.refresh_from_db()
+    return chat
+
+
+@pytest.mark.django_db
+class TestChatDeletion:
+    def test_chat_deleted_in_batches(self, user):
+        chat = make_chat(user)
+        job = request_chat_deletion(chat)
+        assert job.total_items == 6
+
+        claimed = claim_next_job()
+        assert claimed.pk == job.pk
+        assert claimed.status == DeletionJob.STATUS_RUNNING
+        assert claim_next_job() is None
+
+        assert run_job(claimed, batch_size=2)
+        job.refresh_from_db()
+        assert job.status == DeletionJob.STATUS_DONE
+        assert job.deleted_items == 6
+        assert job.progress == 100
+        assert not Chat.objects.filter(pk=chat.pk).exists()
+        assert not Message.objects.filter(chat_id=chat.pk).exists()
+        assert search_messages("tariff") == []
+
+    def test_repeated_request_reuses_job(self, user):
+        chat = make_chat(user, messages=1)
+        assert request_chat_deletion(chat).pk == request_chat_deletion(chat).pk
+
+    def test_soft_deleted_chat_hidden_from_search(self, user):
+        chat = make_chat(user, messages=1)
+        request_chat_deletion(chat)
+        assert search_messages("tariff", user_id=user.id) == []
+
+
+@pytest.mark.django_db
+class TestUserDeletion:
+    def test_user_deleted_with_chats(self, user):
+        chats = [make_chat(user, messages=3) for _ in range(2)]
+        log = ErrorLog.objects.create(message="boom", user=user)
+
+        job = request_user_deletion(user)
+        user.refresh_from_db()
+        assert user.is_active is False
+        assert job.total_items == 6 + 2 + 1
+
+        assert run_job(claim_next_job(), batch_size=2)
+        job.refresh_from_db()
+        assert job.status == DeletionJob.STATUS_DONE
+        assert job.deleted_items == job.total_items
+        assert not User.objects.filter(pk=user.pk).exists()
+        assert not Chat.objects.filter(pk__in=[c.pk for c in chats]).exists()
+        log.refresh_from_db()
+        assert log.user is None
+
+    def test_admin_delete_returns_accepted(self, admin_client, user):
+        response = admin_client.delete(reverse('adminpanel:user-detail', args=[user.pk]))
+        assert response.status_code == 202
+        user.refresh_from_db()
+        assert user.is_active is False
+
+        jobs = admin_client.get(reverse('adminpanel:deletionjob-list'), {'status': 'pending'})
+        assert jobs.status_code == 200
+        assert [j['id'] for j in jobs.data['results']] == [response.data['job_id']]
+        assert jobs.data['results'][0]['progress'] == 0
+
+    def test_superuser_cannot_be_deleted(self, admin_client):
+        other_admin = User.objects.create_superuser(email="admin2-del@example.com", password="adminpass123")
+        response = admin_client.delete(reverse('adminpanel:user-detail', args=[other_admin.pk]))
+        assert response.status_code == 400
+        assert not DeletionJob.objects.exists()
@@ -0,0 +1,179 @@
+import io
+import json
+import time
+import pytest
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from apps.chat.models import Chat, Message
+from apps.chat.exports import ExportUnavailable, EXPORT_SLOTS_KEY, EXPORT_SLOT_TTL_SECONDS
+
+User = get_user_model()
+
+ROWS = [("عراق", 10), ("ترکیه", 20), ("چین", 30), ("امارات", 40), ("هند", None)]
+
+
+class FakeCursor:
+    def __init__(self, conn, name=None):
+        self.conn = conn
+        self.name = name
+        self.itersize = None
+        self.description = None
+        self.position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append((self.name, sql, params))
+        self.description = [("country",), ("dollar",)]
+
+    def fetchmany(self, size):
+        rows = ROWS[self.position:self.position + size]
+        self.position += len(rows)
+        self.conn.fetches.append(len(rows))
+        return rows
+
+
+class FakeConnection:
+    def __init__(self):
+        self.executed = []
+        self.fetches = []
+        self.readonly = None
+        self.closed = False
+
+    def set_session(self, readonly=None):
+        self.readonly = readonly
+
+    def cursor(self, name=None):
+        return FakeCursor(self, name)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def analytics_db(monkeypatch, settings):
+    settings.EXPORT_FETCH_SIZE = 2
+    conn = FakeConnection()
+    monkeypatch.setattr('apps.chat.exports._connect', lambda: conn)
+    return conn
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="analyst@example.com", password="testpass123")
+
+
+def create_answer(user, sql="SELECT country, SUM(dollar) AS dollar FROM final_true GROUP BY country;"):
+    chat = Chat.objects.create(user=user, title="exports")
+    # Stored the way ChatConsumer saves it: the worker's metadata JSON string
+    return Message.objects.create(
+        chat=chat, role=Message.ROLE_ASSISTANT, content="...",
+        ai_response_metadata=json.dumps({"model": "gpt-5-mini", "sql": sql}),
+    )
+
+
+def export_url(message, **params):
+    url = reverse("chat:export-message", args=[message.chat_id, message.id])
+    return url + ("?" + "&".join(f"{k}={v}" for k, v in params.items()) if params else "")
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+def test_csv_export_streams_batches_with_role_cap(user, fake_redis, analytics_db):
+    message = create_answer(user)
+    response = client_for(user).get(export_url(message))
+    assert response.status_code == 200
+    assert response["Content-Type"] == "text/csv; charset=utf-8"
+    assert f"message-{message.id}.csv" in response["Content-Disposition"]
+
+    body = b"".join(response).decode("utf-8")
+    assert body.splitlines() == [
+        "\ufeffcountry,dollar", "عراق,10", "ترکیه,20", "چین,30", "امارات,40", "هند,",
+    ]
+    # Public users are capped; rows came from a named cursor in batches of EXPORT_FETCH_SIZE
+    (name, sql, params), = [e for e in analytics_db.executed if e[0]]
+    assert name.startswith("export_")
+    assert sql == "SELECT * FROM (SELECT country, SUM(dollar) AS dollar FROM final_true GROUP BY country) AS export LIMIT 100000"
+    assert params is None
+    assert analytics_db.fetches == [2, 2, 1, 0]
+    assert analytics_db.readonly is True
+    assert analytics_db.closed is True
+    assert fake_redis.zcard(EXPORT_SLOTS_KEY.format(user_id=user.id)) == 0
+
+
+def test_admin_export_is_not_capped(db, fake_redis, analytics_db):
+    admin = User.objects.create_superuser(email="boss@example.com", password="testpass123")
+    message = create_answer(admin)
+    response = client_for(admin).get(export_url(message))
+    b"".join(response)
+    (_, sql, params), = [e for e in analytics_db.executed if e[0]]
+    assert sql.startswith("SELECT country") and params is None
+
+
+def test_like_patterns_are_not_read_as_placeholders(user, fake_redis, analytics_db):
+    sql = "SELECT country, dollar FROM final_true WHERE hs_code LIKE '%8471%' AND country ILIKE 'ع%'"
+    response = client_for(user).get(export_url(create_answer(user, sql=sql)))
+    assert response.status_code == 200
+    b"".join(response)
+    (_, executed, params), = [e for e in analytics_db.executed if e[0]]
+    # Run without parameters, so psycopg2 leaves the % signs alone
+    assert executed == f"SELECT * FROM ({sql}) AS export LIMIT 100000"
+    assert params is None
+
+
+def test_only_own_answers_with_read_only_sql_export(user, fake_redis, analytics_db):
+    other = User.objects.create_user(email="other@example.com", password="testpass123")
+    assert client_for(other).get(export_url(create_answer(user))).status_code == 404
+    assert client_for(user).get(export_url(create_answer(user, sql=None))).status_code == 404
+    assert client_for(user).get(export_url(create_answer(user, sql="DELETE FROM final_true"))).status_code == 404
+    assert client_for(user).get(export_url(create_answer(user, sql="SELECT 1; DROP TABLE final_true"))).status_code == 404
+    assert client_for(user).get(export_url(create_answer(user), file_format="xlsx")).status_code == 400
+    assert analytics_db.executed == []
+
+
+def test_concurrent_exports_are_limited(user, fake_redis, analytics_db, settings):
+    key = EXPORT_SLOTS_KEY.format(user_id=user.id)
+    running = {f"slot{i}": time.time() for i in range(settings.EXPORT_MAX_CONCURRENT)}
+    fake_redis.zadd(key, running)
+    response = client_for(user).get(export_url(create_answer(user)))
+    assert response.status_code == 429
+    assert fake_redis.data[key] == running
+    assert analytics_db.executed == []
+
+
+def test_lost_slots_expire_while_the_user_retries(user, fake_redis, analytics_db, settings):
+    key = EXPORT_SLOTS_KEY.format(user_id=user.id)
+    # Never released (a restart mid-export), and as old as the safety net allows
+    lost = time.time() - EXPORT_SLOT_TTL_SECONDS - 1
+    fake_redis.zadd(key, {f"slot{i}": lost for i in range(settings.EXPORT_MAX_CONCURRENT)})
+    response = client_for(user).get(export_url(create_answer(user)))
+    assert response.status_code == 200
+    b"".join(response)
+    assert fake_redis.zcard(key) == 0
+
+
+def test_analytics_database_down(user, fake_redis, monkeypatch):
+    def down():
+        raise ExportUnavailable("connection refused")
+    monkeypatch.setattr('apps.chat.exports._connect', down)
+    response = client_for(user).get(export_url(create_answer(user)))
+    assert response.status_code == 503
+    assert fake_redis.zcard(EXPORT_SLOTS_KEY.format(user_id=user.id)) == 0
+
+
+def test_parquet_export(user, fake_redis, analytics_db):
+    pq = pytest.importorskip("pyarrow.parquet")
+    response = client_for(user).get(export_url(create_answer(user), file_format="parquet"))
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(b"".join(response)))
+    assert table.column_names == ["country", "dollar"]
+    assert table.column("dollar").to_pylist() == [10, 20, 30, 40, None]
@@ -0,0 +1,113 @@
+import json
+import pytest
+from django.contrib.auth import get_user_model
+from apps.chat.models import Chat, Message
+from apps.chat.jobs import ensure_group, relay_events
+from apps.chat.redis_config import JOB_EVENTS_STREAM_KEY, JOB_EVENTS_GROUP
+
+User = get_user_model()
+
+
+class FakeChannelLayer:
+    def __init__(self):
+        self.sent = []
+
+    async def group_send(self, group, message):
+        self.sent.append((group, message['type'], message['frame']))
+
+
+@pytest.fixture
+def layer(monkeypatch):
+    layer = FakeChannelLayer()
+    monkeypatch.setattr('apps.chat.jobs.get_channel_layer', lambda: layer)
+    return layer
+
+
+@pytest.fixture
+def chat(db):
+    user = User.objects.create_user(email="heavy@example.com", password="testpass123")
+    return Chat.objects.create(user=user, title="New chat")
+
+
+@pytest.fixture
+def events(fake_redis):
+    """The job event stream with the relay's consumer group."""
+    ensure_group(fake_redis)
+    return fake_redis
+
+
+def publish(conn, *events):
+    """What the AI worker does (ai_worker.emit_event)."""
+    for event in events:
+        conn.xadd(JOB_EVENTS_STREAM_KEY, event)
+
+
+def unacknowledged(conn):
+    return conn.pending(JOB_EVENTS_STREAM_KEY, JOB_EVENTS_GROUP)
+
+
+def job_event(chat, event, **fields):
+    return {"event": event, "message_id": "m1", "chat_id": str(chat.id), "user_id": str(chat.user_id), **fields}
+
+
+def done_event(chat):
+    return job_event(
+        chat, "done", content="صادرات به عراق ...",
+        ai_response_metadata=json.dumps({"suggested_title": "صادرات", "sql": "SELECT 1"}),
+        ai_references="[]", tokens_used="0", response_time="95.2",
+    )
+
+
+def test_progress_and_result_reach_the_chat_group(chat, layer, events):
+    publish(events, job_event(chat, "running"), job_event(chat, "progress", stage="answer"), done_event(chat))
+    assert relay_events(events, "relay-1") == 3
+    assert unacknowledged(events) == []
+
+    group = f"chat_{chat.user_id}_{chat.id}"
+    assert [(g, t, f['type']) for g, t, f in layer.sent] == [
+        (group, 'ai_job_event', 'job_progress'),
+        (group, 'ai_job_event', 'job_progress'),
+        (group, 'ai_job_event', 'ai_response'),
+    ]
+    assert layer.sent[1][2]['stage'] == "answer"
+    assert layer.sent[2][2]['data']['content'] == "صادرات به عراق ..."
+
+    message = Message.objects.get(chat=chat)
+    assert message.role == Message.ROLE_ASSISTANT
+    assert message.response_time == 95.2
+    assert json.loads(message.ai_response_metadata)['sql'] == "SELECT 1"
+    chat.refresh_from_db()
+    assert chat.title == "صادرات"
+
+
+def test_redelivered_result_is_saved_once(chat, layer, events):
+    publish(events, done_event(chat), done_event(chat))
+    assert relay_events(events, "relay-1") == 2
+    assert Message.objects.filter(chat=chat).count() == 1
+
+
+def test_failed_job_is_reported_and_failing_event_stays_pending(chat, layer, events, monkeypatch):
+    publish(events, job_event(chat, "failed", stage="query", code="ai_unavailable"))
+    assert relay_events(events, "relay-1") == 1
+    (_, _, frame), = layer.sent
+    assert frame['type'] == 'error' and frame['code'] == 'ai_unavailable'
+    assert not Message.objects.filter(chat=chat).exists()
+
+    def channel_layer_down():
+        raise ConnectionError("channel layer unavailable")
+    monkeypatch.setattr('apps.chat.jobs.get_channel_layer', channel_layer_down)
+    publish(events, job_event(chat, "progress", stage="query"))
+    assert relay_events(events, "relay-1") == 0
+    assert len(unacknowledged(events)) == 1
+    # Picked up again by the next pending pass
+    monkeypatch.setattr('apps.chat.jobs.get_channel_layer', lambda: layer)
+    assert relay_events(events, "relay-1", pending=True) == 1
+    assert unacknowledged(events) == []
+
+
+def test_every_pending_event_is_handled(chat, layer, events):
+    publish(events, *[job_event(chat, "progress", stage="query") for _ in range(250)])
+    # Read, but the relay stopped before acknowledging any of them
+    events.xreadgroup(JOB_EVENTS_GROUP, "relay-1", {JOB_EVENTS_STREAM_KEY: ">"}, count=1000)
+    assert relay_events(events, "relay-1", pending=True, count=100) == 250
+    assert unacknowledged(events) == []
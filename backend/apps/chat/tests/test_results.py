@@ -0,0 +1,74 @@
+import base64
+import json
+import zlib
+import pytest
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from apps.chat.redis_config import RESULT_KEY_PREFIX
+
+User = get_user_model()
+
+
+def store_result(conn, message_id, user_id, chat_id, rows, chunk_rows=3):
+    """What the AI worker writes (ai/result_cache.py)."""
+    chunks = [
+        base64.b64encode(zlib.compress(json.dumps(rows[i:i + chunk_rows]).encode())).decode()
+        for i in range(0, len(rows), chunk_rows)
+    ]
+    conn.data[f"{RESULT_KEY_PREFIX}{message_id}"] = json.dumps({
+        "user_id": str(user_id), "chat_id": str(chat_id), "columns": ["country", "dollar"],
+        "total": len(rows), "truncated": False, "chunk_rows": chunk_rows,
+    })
+    conn.data[f"{RESULT_KEY_PREFIX}{message_id}:chunks"] = chunks
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="pager@example.com", password="testpass123")
+
+
+@pytest.fixture
+def client(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+@pytest.fixture
+def fake_redis(fake_redis, user):
+    store_result(fake_redis, "m1", user.id, 7, [[f"c{n}", str(n)] for n in range(8)])
+    return fake_redis
+
+
+def test_page_reads_only_the_chunks_it_needs(client, fake_redis):
+    url = reverse("chat:result-page", args=[7, "m1"])
+    response = client.get(url, {"offset": 2, "limit": 4})
+    assert response.status_code == 200
+    assert response.data["rows"] == [["c2", "2"], ["c3", "3"], ["c4", "4"], ["c5", "5"]]
+    assert response.data["columns"] == ["country", "dollar"]
+    assert response.data["total"] == 8
+    assert response.data["next_offset"] == 6
+    assert fake_redis.lrange_calls == [(0, 1)]
+
+    response = client.get(url, {"offset": 6, "limit": 4})
+    assert response.data["rows"] == [["c6", "6"], ["c7", "7"]]
+    assert response.data["next_offset"] is None
+
+
+def test_result_of_another_user_or_chat_is_not_found(client, fake_redis, db):
+    other = User.objects.create_user(email="other@example.com", password="testpass123")
+    store_result(fake_redis, "m2", other.id, 7, [["x", "1"]])
+    assert client.get(reverse("chat:result-page", args=[7, "m2"])).status_code == 404
+    assert client.get(reverse("chat:result-page", args=[8, "m1"])).status_code == 404
+    assert client.get(reverse("chat:result-page", args=[7, "expired"])).status_code == 404
+
+
+def test_bad_paging_parameters(client, fake_redis):
+    response = client.get(reverse("chat:result-page", args=[7, "m1"]), {"offset": "x"})
+    assert response.status_code == 400
+
+
+def test_result_cache_down(client, redis_down):
+    response = client.get(reverse("chat:result-page", args=[7, "m1"]))
+    assert response.status_code == 503
@@ -0,0 +1,57 @@
+import pytest
+from django.contrib.auth import get_user_model
+from apps.accounts.models import UserRole
+from apps.chat.user_cache import (
+    USER_SNAPSHOT_KEY, get_user_snapshot, resolve_role, snapshot_user
+)
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="ws@example.com", password="testpass123")
+
+
+@pytest.mark.django_db
+class TestUserSnapshot:
+    def test_resolve_role(self, user):
+        assert resolve_role(user) == 'public'
+        UserRole.objects.create(user=user, role='admin')
+        assert resolve_role(User.objects.get(pk=user.pk)) == 'admin'
+
+        superuser = User.objects.create_superuser(email="root@example.com", password="pass1234")
+        assert resolve_role(superuser) == 'admin'
+
+    def test_snapshot_cached_after_first_lookup(self, fake_redis, user, django_assert_num_queries):
+        snapshot = get_user_snapshot(user.pk)
+        assert snapshot['role'] == 'public'
+        assert snapshot['is_active'] is True
+        assert USER_SNAPSHOT_KEY.format(user_id=user.pk) in fake_redis.data
+
+        with django_assert_num_queries(0):
+            assert get_user_snapshot(user.pk) == snapshot
+
+    def test_role_change_invalidates(self, fake_redis, user, django_capture_on_commit_callbacks):
+        get_user_snapshot(user.pk)
+        with django_capture_on_commit_callbacks(execute=True):
+            UserRole.objects.create(user=user, role='admin')
+        assert USER_SNAPSHOT_KEY.format(user_id=user.pk) not in fake_redis.data
+        assert get_user_snapshot(user.pk)['role'] == 'admin'
+
+    def test_deactivation_invalidates(self, fake_redis, user, django_capture_on_commit_callbacks):
+        get_user_snapshot(user.pk)
+        with django_capture_on_commit_callbacks(execute=True):
+            user.is_active = False
+            user.save()
+        assert get_user_snapshot(user.pk)['is_active'] is False
+
+    def test_falls_back_to_database(self, redis_down, user):
+        assert get_user_snapshot(user.pk)['email'] == user.email
+        assert get_user_snapshot(999999) is None
+
+    def test_snapshot_user(self, fake_redis, user):
+        scope_user = snapshot_user(get_user_snapshot(user.pk))
+        assert scope_user.id == user.pk
+        assert scope_user.role == 'public'
+        assert not scope_user.is_anonymous
@@ -1,9 +1,11 @@
 import asyncio
 import json
 import pytest
+import time
 import uuid
 from channels.testing import WebsocketCommunicator
 from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
 from core.asgi import application
 from apps.chat.models import Chat, Message
 from rest_framework_simplejwt.tokens import AccessToken
@@ -11,6 +13,8 @@ from apps.chat.redis_config import (
     CHAT_STREAM_KEY, 
     RESPONSE_STREAM_KEY,
     get_redis_connection,
+    create_message_data,
+    AI_RESPONSE_DEADLINE_SECONDS,
     MSG_MAP_PREFIX
 )
 from apps.chat.consumers import ChatConsumer
@@ -312,6 +316,142 @@ class TestChatWebSocket:
         finally:
             await communicator.disconnect()
 
+    async def test_ai_failure_reported_immediately(self, monkeypatch):
+        """A dead-lettered question comes back as a structured error, not as an answer"""
+        async def fake_wait_for_ai_response(self, last_id="$", timeout=60, max_retries=3):
+            await asyncio.sleep(0)
+            return "1-0", {
+                "type": "error",
+                "code": "ai_failed",
+                "stage": "query",
+                "chat_id": str(self.chat_id),
+                "message_id": self.pending_message_id,
+            }
+        monkeypatch.setattr(ChatConsumer, "wait_for_ai_response", fake_wait_for_ai_response)
+
+        await self.setup_test_data()
+        communicator = WebsocketCommunicator(
+            application,
+            f"ws/chat/{self.chat.id}/?token={self.token}",
+            headers=[(b"origin", b"http://localhost")]
+        )
+        try:
+            connected, _ = await communicator.connect()
+            assert connected is True
+            await communicator.send_json_to({"content": "Test failure", "is_first_message": False})
+            await communicator.receive_json_from()  # message_received
+            await communicator.receive_json_from()  # status
+            error_msg = await communicator.receive_json_from()
+            assert error_msg["type"] == "error"
+            assert error_msg["code"] == "ai_failed"
+            assert await database_sync_to_async(
+                Message.objects.filter(chat=self.chat, role='assistant').exists
+            )() is False
+        finally:
+            await communicator.disconnect()
+
+    async def test_heavy_question_deferred(self, monkeypatch):
+        """A question the worker moves to its heavy lane is acknowledged, and its result arrives through the chat group"""
+        async def fake_wait_for_ai_response(self, last_id="$", timeout=60, max_retries=3):
+            await asyncio.sleep(0)
+            return "1-0", {
+                "type": "deferred",
+                "chat_id": str(self.chat_id),
+                "user_id": str(self.user.id),
+                "message_id": self.pending_message_id,
+            }
+        monkeypatch.setattr(ChatConsumer, "wait_for_ai_response", fake_wait_for_ai_response)
+
+        await self.setup_test_data()
+        communicator = WebsocketCommunicator(
+            application,
+            f"ws/chat/{self.chat.id}/?token={self.token}",
+            headers=[(b"origin", b"http://localhost")]
+        )
+        try:
+            connected, _ = await communicator.connect()
+            assert connected is True
+            await communicator.send_json_to({"content": "Exports by HS code since 2015", "is_first_message": False})
+            received = await communicator.receive_json_from()  # message_received
+            await communicator.receive_json_from()  # status
+            queued = await communicator.receive_json_from()
+            assert queued["type"] == "job_queued"
+            assert queued["message_id"] == received["message_id"]
+
+            # What relay_ai_job_events sends once the worker has finished
+            frame = {"type": "ai_response", "message_id": queued["message_id"], "data": {"content": "..."}}
+            await get_channel_layer().group_send(
+                f"chat_{self.user.id}_{self.chat.id}", {"type": "ai_job_event", "frame": frame}
+            )
+            assert await communicator.receive_json_from() == frame
+        finally:
+            await communicator.disconnect()
+
+    async def test_result_page_frame(self, monkeypatch):
+        """'show more' pages come from the result cache without sending anything to the AI"""
+        calls = []
+
+        async def fake_aget_result_page(redis_conn, message_id, user_id, chat_id=None, offset=0, limit=50):
+            calls.append((message_id, user_id, chat_id, offset, limit))
+            if message_id != "m1":
+                return None
+            return {"message_id": message_id, "columns": ["country"], "rows": [["Iraq"]],
+                    "offset": offset, "total": 51, "truncated": False, "next_offset": None}
+        monkeypatch.setattr("apps.chat.consumers.aget_result_page", fake_aget_result_page)
+
+        await self.setup_test_data()
+        communicator = WebsocketCommunicator(
+            application,
+            f"ws/chat/{self.chat.id}/?token={self.token}",
+            headers=[(b"origin", b"http://localhost")]
+        )
+        try:
+            connected, _ = await communicator.connect()
+            assert connected is True
+            await communicator.send_json_to({"type": "result_page", "message_id": "m1", "offset": 50})
+            page = await communicator.receive_json_from()
+            assert page["type"] == "result_page"
+            assert page["data"]["rows"] == [["Iraq"]]
+            assert calls == [("m1", self.user.id, str(self.chat.id), 50, 50)]
+
+            await communicator.send_json_to({"type": "result_page", "message_id": "gone"})
+            error = await communicator.receive_json_from()
+            assert error["code"] == "result_expired"
+            assert await database_sync_to_async(Message.objects.filter(chat=self.chat).exists)() is False
+        finally:
+            await communicator.disconnect()
+
+    async def test_result_page_frames_are_rate_limited(self, monkeypatch):
+        """Paging skips the message limits but has its own per-user bucket"""
+        checked, calls = [], []
+
+        async def fake_ahit(redis_conn, limits):
+            checked.append(limits)
+            return False, 5.0
+
+        async def fake_aget_result_page(*args, **kwargs):
+            calls.append(args)
+        monkeypatch.setattr("apps.chat.consumers.ahit", fake_ahit)
+        monkeypatch.setattr("apps.chat.consumers.aget_result_page", fake_aget_result_page)
+
+        await self.setup_test_data()
+        communicator = WebsocketCommunicator(
+            application,
+            f"ws/chat/{self.chat.id}/?token={self.token}",
+            headers=[(b"origin", b"http://localhost")]
+        )
+        try:
+            connected, _ = await communicator.connect()
+            assert connected is True
+            await communicator.send_json_to({"type": "result_page", "message_id": "m1"})
+            error = await communicator.receive_json_from()
+            assert error["code"] == "rate_limited"
+            assert error["retry_after"] == 5.0
+            assert checked == [[(f"ws_page:{self.user.id}", 60, 60)]]
+            assert calls == []
+        finally:
+            await communicator.disconnect()
+
     async def test_chat_cleanup_on_disconnect(self):
         """Test that websocket disconnects properly"""
         await self.setup_test_data()
@@ -439,4 +579,13 @@ class TestChatWebSocket:
                 try:
                     await comm_data["communicator"].disconnect()
                 except Exception:
-                    pass
\ No newline at end of file
+                    pass
+
+
+@pytest.mark.asyncio
+async def test_message_data_carries_deadline():
+    before = time.time()
+    data = await create_message_data(1, 'public', 'user', 1, 'Hello AI')
+    deadline = float(data['deadline'])
+    # Stamped with millisecond precision
+    assert before + AI_RESPONSE_DEADLINE_SECONDS - 0.001 <= deadline <= time.time() + AI_RESPONSE_DEADLINE_SECONDS + 0.001
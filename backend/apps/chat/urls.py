@@ -1,7 +1,8 @@
 from django.urls import path
 from .views import (
     ActiveChatsView, ArchivedChatsView, ToggleArchiveView, 
-    DeleteChatView, ChatMessagesView, CreateChatView
+    DeleteChatView, ChatMessagesView, CreateChatView, SearchMessagesView,
+    ChatResultPageView, MessageExportView
 )
 
 app_name = 'chat'
@@ -16,4 +17,7 @@ urlpatterns = [
 
     # Message retrieval
     path('<int:chat_id>/messages/', ChatMessagesView.as_view(), name='chat-messages'),
+    path('search/', SearchMessagesView.as_view(), name='search-messages'),
+    path('<int:chat_id>/results/<str:message_id>/', ChatResultPageView.as_view(), name='result-page'),
+    path('<int:chat_id>/messages/<int:message_id>/export/', MessageExportView.as_view(), name='export-message'),
 ]
\ No newline at end of file
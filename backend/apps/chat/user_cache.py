@@ -0,0 +1,97 @@
+import json
+import logging
+from channels.db import database_sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from redis.exceptions import RedisError
+from .redis_config import get_sync_redis_connection
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+USER_SNAPSHOT_KEY = "ws_user:{user_id}"
+# Short TTL bounds staleness if an invalidation is ever missed
+USER_SNAPSHOT_TTL_SECONDS = 300
+
+
+def resolve_role(user):
+    """Role sent to the AI worker: superusers and admin role holders are 'admin'."""
+    if user.is_superuser:
+        return 'admin'
+    roles = {role.role for role in user.roles.all()}
+    if 'admin' in roles:
+        return 'admin'
+    return next(iter(sorted(roles)), 'public')
+
+
+def _load_snapshot(user_id):
+    user = User.objects.filter(pk=user_id).prefetch_related('roles').first()
+    if user is None:
+        return None
+    return {
+        'id': user.pk,
+        'email': user.email,
+        'is_active': user.is_active,
+        'is_staff': user.is_staff,
+        'is_superuser': user.is_superuser,
+        'role': resolve_role(user),
+    }
+
+
+def get_user_snapshot(user_id):
+    """
+    The fields a WebSocket connection needs about its user, cached in Redis.
+    Falls back to the database when Redis is unavailable; None for unknown users.
+    """
+    key = USER_SNAPSHOT_KEY.format(user_id=user_id)
+    try:
+        conn = get_sync_redis_connection()
+        raw = conn.get(key)
+    except RedisError as e:
+        logger.warning(f"User snapshot lookup failed for {user_id}: {e}")
+        return _load_snapshot(user_id)
+    if raw:
+        return json.loads(raw)
+
+    snapshot = _load_snapshot(user_id)
+    if snapshot is not None:
+        try:
+            conn.set(key, json.dumps(snapshot), ex=USER_SNAPSHOT_TTL_SECONDS)
+        except RedisError as e:
+            logger.warning(f"User snapshot store failed for {user_id}: {e}")
+    return snapshot
+
+
+async def aget_user_snapshot(redis_conn, user_id):
+    """Async variant for consumers: one GET on the connection's own client, database only on a miss."""
+    try:
+        raw = await redis_conn.get(USER_SNAPSHOT_KEY.format(user_id=user_id))
+    except RedisError as e:
+        logger.warning(f"User snapshot lookup failed for {user_id}: {e}")
+        raw = None
+    if raw:
+        return json.loads(raw)
+    return await database_sync_to_async(get_user_snapshot)(user_id)
+
+
+def snapshot_user(snapshot):
+    """An unsaved User built from a snapshot, for scope['user']; carries `role`."""
+    user = User(
+        id=snapshot['id'],
+        email=snapshot['email'],
+        is_active=snapshot['is_active'],
+        is_staff=snapshot['is_staff'],
+        is_superuser=snapshot['is_superuser'],
+    )
+    user.role = snapshot['role']
+    return user
+
+
+def invalidate_user_snapshot(user_id):
+    def invalidate():
+        try:
+            get_sync_redis_connection().delete(USER_SNAPSHOT_KEY.format(user_id=user_id))
+        except RedisError as e:
+            logger.warning(f"User snapshot invalidation failed for {user_id}: {e}")
+
+    transaction.on_commit(invalidate)
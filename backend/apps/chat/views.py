@@ -1,52 +1,70 @@
 from django.shortcuts import render
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from rest_framework.throttling import UserRateThrottle
-from django.db.models import Count
+from apps.accounts.throttling import RedisUserRateThrottle
 from .models import Chat, Message
-from .serializers import ChatListSerializer, MessageSerializer, ChatCreateSerializer
+from .serializers import ChatListSerializer, MessageSerializer, ChatCreateSerializer, MessageSearchResultSerializer
+from .pagination import ChatKeysetPagination, MessageKeysetPagination
+from .conditional import ConditionalGetMixin, get_chat_list_version
+from .search import search_messages
+from .deletion import request_chat_deletion
+from .archival import restore_chat
+from .results import get_result_page, RESULT_PAGE_SIZE
+from .exports import (
+    EXPORT_CONTENT_TYPES, ExportUnavailable, QueryExport, acquire_slot, check_format,
+    message_sql, release_slot, row_limit, stream_export
+)
+from .user_cache import get_user_snapshot
+from .redis_config import get_sync_redis_connection
+from redis.exceptions import RedisError
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 
-class ActiveChatsView(generics.ListAPIView):
+class ChatListConditionalMixin(ConditionalGetMixin):
+    """Chat lists are validated by the per-user chat-list version kept in Redis."""
+
+    def get_etag(self, request):
+        version = get_chat_list_version(request.user.id)
+        if version is None:
+            return None
+        return f"chats-{request.user.id}-{version}"
+
+class ActiveChatsView(ChatListConditionalMixin, generics.ListAPIView):
     serializer_class = ChatListSerializer
     permission_classes = [permissions.IsAuthenticated]
-    throttle_classes = [UserRateThrottle]
+    throttle_classes = [RedisUserRateThrottle]
+    pagination_class = ChatKeysetPagination
     
     def get_queryset(self):
         return Chat.objects.filter(
             user=self.request.user,
-            is_archived=False
-        ).annotate(
-            message_count=Count('messages')
+            is_archived=False,
+            is_deleted=False
         ).order_by('-last_activity')
 
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        context['message_count'] = True
-        return context
-
-class ArchivedChatsView(generics.ListAPIView):
+class ArchivedChatsView(ChatListConditionalMixin, generics.ListAPIView):
     serializer_class = ChatListSerializer
     permission_classes = [permissions.IsAuthenticated]
-    throttle_classes = [UserRateThrottle]
+    throttle_classes = [RedisUserRateThrottle]
+    pagination_class = ChatKeysetPagination
     
     def get_queryset(self):
         return Chat.objects.filter(
             user=self.request.user,
-            is_archived=True
-        ).annotate(
-            message_count=Count('messages')
+            is_archived=True,
+            is_deleted=False
         ).order_by('-last_activity')
 
 class CreateChatView(generics.CreateAPIView):
     serializer_class = ChatCreateSerializer
     permission_classes = [permissions.IsAuthenticated]
-    throttle_classes = [UserRateThrottle]
+    throttle_classes = [RedisUserRateThrottle]
 
 
 class ToggleArchiveView(generics.UpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
-    throttle_classes = [UserRateThrottle]
-    queryset = Chat.objects.all()
+    throttle_classes = [RedisUserRateThrottle]
+    queryset = Chat.objects.filter(is_deleted=False)
     
     def update(self, request, *args, **kwargs):
         chat = self.get_object()
@@ -58,6 +76,11 @@ class ToggleArchiveView(generics.UpdateAPIView):
             )
             
         chat.is_archived = not chat.is_archived
+        if chat.is_archived:
+            chat.archived_at = timezone.now()
+        else:
+            restore_chat(chat)
+            chat.archived_at = None
         chat.save()
         
         return Response({
@@ -68,8 +91,8 @@ class ToggleArchiveView(generics.UpdateAPIView):
 
 class DeleteChatView(generics.DestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
-    throttle_classes = [UserRateThrottle]
-    queryset = Chat.objects.all()
+    throttle_classes = [RedisUserRateThrottle]
+    queryset = Chat.objects.filter(is_deleted=False)
 
     def destroy(self, request, *args, **kwargs):
         chat = self.get_object()
@@ -80,22 +103,169 @@ class DeleteChatView(generics.DestroyAPIView):
                 status=status.HTTP_403_FORBIDDEN
             )
             
-        chat.delete()
+        # Messages are removed in the background (process_deletion_jobs)
+        job = request_chat_deletion(chat, requested_by=request.user)
         return Response(
-            {"message": "Chat deleted successfully"},
-            status=status.HTTP_204_NO_CONTENT
+            {"message": "Chat deletion scheduled", "job_id": job.id},
+            status=status.HTTP_202_ACCEPTED
         )
 
-class ChatMessagesView(generics.ListAPIView):
+class ChatMessagesView(ConditionalGetMixin, generics.ListAPIView):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
-    throttle_classes = [UserRateThrottle]
+    throttle_classes = [RedisUserRateThrottle]
+    pagination_class = MessageKeysetPagination
+
+    def get_chat(self):
+        if not hasattr(self, '_chat'):
+            self._chat = Chat.objects.filter(
+                id=self.kwargs.get('chat_id'),
+                user=self.request.user,
+                is_deleted=False
+            ).only('id', 'message_count', 'last_message_at', 'in_cold_storage').first()
+        return self._chat
+
+    def get_etag(self, request):
+        chat = self.get_chat()
+        if chat is None:
+            return None
+        last_at = chat.last_message_at.timestamp() if chat.last_message_at else 0
+        return f"messages-{chat.id}-{chat.message_count}-{last_at}"
+
+    def get_last_modified(self, request):
+        chat = self.get_chat()
+        return chat.last_message_at if chat else None
     
     def get_queryset(self):
-        chat_id = self.kwargs.get('chat_id')
-        try:
-            chat = Chat.objects.get(id=chat_id, user=self.request.user)
-        except Chat.DoesNotExist:
+        chat = self.get_chat()
+        if chat is None:
             return Message.objects.none()
-            
-        return Message.objects.filter(chat=chat)
\ No newline at end of file
+        if chat.in_cold_storage:
+            restore_chat(chat)
+
+        return Message.objects.filter(chat=chat)
+
+
+class SearchMessagesView(generics.GenericAPIView):
+    """Full-text search over the user's own messages: ?q=<text>&limit=<n>"""
+    serializer_class = MessageSearchResultSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [RedisUserRateThrottle]
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {"error": "Query parameter 'q' is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            limit = self.default_limit
+        limit = max(1, min(limit, self.max_limit))
+
+        results = search_messages(query, user_id=request.user.id, limit=limit)
+        serializer = self.get_serializer(results, many=True)
+        return Response({'results': serializer.data})
+
+
+class ChatResultPageView(generics.GenericAPIView):
+    """
+    "Show more" for an AI answer: ?offset=<n>&limit=<n> over the full query
+    result the AI worker kept for the message. Served from Redis only; the
+    result expires a while after the answer.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [RedisUserRateThrottle]
+
+    def get(self, request, chat_id, message_id, *args, **kwargs):
+        try:
+            offset = int(request.query_params.get('offset', 0))
+            limit = int(request.query_params.get('limit', RESULT_PAGE_SIZE))
+        except ValueError:
+            return Response(
+                {"error": "offset and limit must be integers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            page = get_result_page(
+                get_sync_redis_connection(), message_id,
+                user_id=request.user.id, chat_id=chat_id, offset=offset, limit=limit
+            )
+        except RedisError:
+            return Response(
+                {"error": "Result cache unavailable"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        if page is None:
+            return Response(
+                {"error": "Result not found or expired"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(page)
+
+
+class MessageExportView(generics.GenericAPIView):
+    """
+    Full data behind an AI answer: ?file_format=csv (default) or parquet. The
+    answer's SQL is run again on the analytics database and streamed in
+    batches, capped by EXPORT_ROW_LIMITS for the user's role.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [RedisUserRateThrottle]
+
+    def get(self, request, chat_id, message_id, *args, **kwargs):
+        fmt = request.query_params.get('file_format', 'csv')
+        try:
+            check_format(fmt)
+        except ValueError:
+            return Response(
+                {"error": f"file_format must be one of: {', '.join(EXPORT_CONTENT_TYPES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except ExportUnavailable as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        message = Message.objects.filter(
+            pk=message_id,
+            chat_id=chat_id,
+            chat__user=request.user,
+            chat__is_deleted=False,
+            role=Message.ROLE_ASSISTANT
+        ).only('id', 'ai_response_metadata').first()
+        sql = message_sql(message) if message else None
+        if sql is None:
+            return Response(
+                {"error": "This message has no exportable data"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        slot = acquire_slot(request.user.id)
+        if slot is None:
+            return Response(
+                {"error": "Too many exports running. Please wait for one to finish."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+        snapshot = get_user_snapshot(request.user.id) or {}
+        try:
+            export = QueryExport(sql, limit=row_limit(snapshot.get('role', 'public')))
+        except ExportUnavailable:
+            release_slot(request.user.id, slot)
+            return Response(
+                {"error": "Export is temporarily unavailable"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        except Exception:
+            release_slot(request.user.id, slot)
+            raise
+
+        response = StreamingHttpResponse(
+            stream_export(export, fmt, on_close=lambda: release_slot(request.user.id, slot)),
+            content_type=EXPORT_CONTENT_TYPES[fmt]
+        )
+        response['Content-Disposition'] = f'attachment; filename="chat-{chat_id}-message-{message_id}.{fmt}"'
+        return response
@@ -0,0 +1,448 @@
+"""
+Index and rollup recommendations from the logged workload (QueryTemplate /
+QueryExecution). Each template's sample SQL is parsed for the predicates and
+groupings it uses on the analytics table; candidate btree, partial and BRIN
+indexes and materialized aggregates are derived from them and ranked by the
+query time they are expected to save.
+
+Savings are estimated, best method first:
+  hypothetical  hypopg on the analytics database: each template is planned
+                with and without the index, saving = time x cost reduction
+  statistics    pg_stats / EXPLAIN row estimates on the analytics database
+  workload      no database: the logged time of the templates a candidate
+                serves, an upper bound
+"""
+import hashlib
+import logging
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+import sqlparse
+from sqlparse import tokens as T
+from django.conf import settings
+from .models import QueryTemplate
+
+logger = logging.getLogger(__name__)
+
+ANALYZED_TABLE = "final_true"
+# A partial index is proposed when one value of an equality predicate is in this share of a template's runs
+PARTIAL_INDEX_SHARE = 0.8
+PARTIAL_INDEX_MIN_RUNS = 3
+# BRIN only pays off when the column follows the physical row order
+BRIN_MIN_CORRELATION = 0.8
+# Selectivity assumed for predicates without statistics (PostgreSQL's own defaults are similar)
+RANGE_SELECTIVITY = 0.3
+PREFIX_SELECTIVITY = 0.05
+RUNS_PER_TEMPLATE = 200
+
+_NOT_COLUMNS = {"and", "or", "not", "where", "on", "when", "then", "else", "case", "select", "from", "by", "is"}
+_RANGE_OPERATORS = {"<", ">", "<=", ">="}
+_COLUMN = re.compile(r'^"?([a-z_][a-z0-9_]*)"?$')
+_AGGREGATE = re.compile(r"\b(sum|count|min|max|avg)\s*\(\s*(distinct\s+)?([^()]*?)\s*\)", re.IGNORECASE)
+_ADDITIVE = {"sum", "count", "min", "max", "avg"}
+
+
+@dataclass
+class QueryShape:
+    """What a query asks of the analytics table, in order of appearance."""
+    equals: dict = field(default_factory=dict)  # column -> literal values compared to
+    ranges: list = field(default_factory=list)
+    prefixes: list = field(default_factory=list)  # LIKE 'abc%'
+    group_by: list = field(default_factory=list)
+    aggregates: list = field(default_factory=list)  # (function, column or '*'); None if not additive
+
+    @property
+    def filters(self):
+        return list(self.equals) + [c for c in self.ranges + self.prefixes if c not in self.equals]
+
+
+def _column(token):
+    if token.ttype in T.Name or token.ttype in T.Keyword or token.ttype in T.Literal.String.Symbol:
+        match = _COLUMN.match(token.value.lower())
+        if match and match.group(1) not in _NOT_COLUMNS:
+            return match.group(1)
+    return None
+
+
+def _is_literal(token):
+    return token.ttype in T.Literal or token.ttype in T.Name.Placeholder
+
+
+def parse_query(sql, table=ANALYZED_TABLE):
+    """The QueryShape of a SELECT on `table`, or None if the query does not read it."""
+    tokens = [t for t in sqlparse.parse(sql)[0].flatten() if not t.is_whitespace and t.ttype not in T.Comment]
+    if not any(t.value.lower().strip('"') == table for t in tokens if t.ttype in T.Name or t.ttype in T.Literal.String.Symbol):
+        return None
+
+    shape = QueryShape()
+    clause, clause_depth, depth = None, 0, 0
+    for i, token in enumerate(tokens):
+        value = token.value.lower()
+        if value == "(":
+            depth += 1
+            continue
+        if value == ")":
+            depth -= 1
+            if clause and depth < clause_depth:
+                clause = None
+            continue
+        if token.ttype in T.Keyword and value in ("where", "group by"):
+            clause, clause_depth = value, depth
+            continue
+        if token.ttype in T.Keyword and value in ("having", "order by", "limit", "union", "window") and depth <= clause_depth:
+            clause = None
+            continue
+
+        column = _column(token)
+        if column is None or depth != clause_depth:
+            continue
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        after = tokens[i + 2] if i + 2 < len(tokens) else None
+        if clause == "group by" and (following is None or following.value != "("):
+            shape.group_by.append(column)
+        elif clause == "where" and following is not None:
+            operator = following.value.lower()
+            if operator == "=" and after is not None and _is_literal(after):
+                shape.equals.setdefault(column, []).append(after.value)
+            elif operator == "in" and after is not None and after.value == "(":
+                values = []
+                for value_token in tokens[i + 3:]:
+                    if value_token.value == ")":
+                        break
+                    if _is_literal(value_token):
+                        values.append(value_token.value)
+                shape.equals.setdefault(column, []).extend(values)
+            elif operator in _RANGE_OPERATORS or operator == "between":
+                if column not in shape.ranges:
+                    shape.ranges.append(column)
+            elif operator in ("like", "ilike") and after is not None:
+                if operator == "like" and not after.value.startswith(("'%", "'_")) and column not in shape.prefixes:
+                    shape.prefixes.append(column)
+
+    for function, distinct, argument in _AGGREGATE.findall(sql):
+        function, argument = function.lower(), argument.strip().strip('"').lower()
+        if distinct or function not in _ADDITIVE or not (argument == "*" or _COLUMN.match(argument)):
+            shape.aggregates = None
+            break
+        shape.aggregates.append((function, argument))
+    return shape
+
+
+def _quote(column):
+    return f'"{column}"'
+
+
+def _name(*parts):
+    name = "_".join(parts)
+    if len(name) <= 63:
+        return name
+    return f"{name[:54]}_{hashlib.sha1(name.encode()).hexdigest()[:8]}"
+
+
+@dataclass
+class Candidate:
+    kind: str  # btree, partial, brin or rollup
+    table: str
+    columns: tuple
+    where: str = ""
+    pattern_ops: tuple = ()  # columns indexed with text_pattern_ops (LIKE 'x%')
+    measures: set = field(default_factory=set)  # rollup: (function, column)
+    templates: list = field(default_factory=list)
+    saving_ms: float = 0.0
+    method: str = "workload"
+
+    @property
+    def key(self):
+        return (self.kind, self.columns, self.where, self.pattern_ops)
+
+    def _index_columns(self):
+        return ", ".join(
+            f"{_quote(c)} text_pattern_ops" if c in self.pattern_ops else _quote(c) for c in self.columns
+        )
+
+    def index_ddl(self, concurrently=True):
+        """CREATE INDEX; without CONCURRENTLY / IF NOT EXISTS it is what hypopg_create_index() takes."""
+        using = "brin" if self.kind == "brin" else "btree"
+        where = f" WHERE {self.where}" if self.where else ""
+        if not concurrently:
+            return f"CREATE INDEX ON {self.table} USING {using} ({self._index_columns()}){where}"
+        kind = () if self.kind == "btree" else (self.kind,)
+        name = _name(self.table, *self.columns, *kind, "idx")
+        return f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {self.table} USING {using} ({self._index_columns()}){where};"
+
+    def rollup_select(self):
+        dims = ", ".join(_quote(c) for c in self.columns)
+        measures = ["COUNT(*) AS row_count"]
+        for function, column in sorted(self.measures):
+            if column == "*":
+                continue
+            if function == "avg":
+                # Stored as sum and count so it can be re-aggregated
+                measures += [f"SUM({_quote(column)}) AS sum_{column}", f"COUNT({_quote(column)}) AS count_{column}"]
+            else:
+                measures.append(f"{function.upper()}({_quote(column)}) AS {function}_{column}")
+        return f"SELECT {dims}, {', '.join(dict.fromkeys(measures))} FROM {self.table} GROUP BY {dims}"
+
+    @property
+    def ddl(self):
+        if self.kind == "rollup":
+            return f"CREATE MATERIALIZED VIEW IF NOT EXISTS {_name(self.table, 'by', *self.columns)} AS {self.rollup_select()};"
+        return self.index_ddl()
+
+
+def _template_candidates(template, shape, run_shapes, table):
+    candidates = []
+    equals = list(shape.equals)
+    trailing = [c for c in shape.ranges if c not in shape.equals][:1]
+    pattern_ops = ()
+    if not trailing:
+        trailing = [c for c in shape.prefixes if c not in shape.equals][:1]
+        pattern_ops = tuple(trailing)
+    if equals or trailing:
+        candidates.append(Candidate("btree", table, tuple(equals + trailing), pattern_ops=pattern_ops))
+
+    # One value nearly always asked for: index the rest of the predicate for that value only
+    for column in equals:
+        values = Counter(v for s in run_shapes for v in s.equals.get(column, [])[:1])
+        if len(run_shapes) < PARTIAL_INDEX_MIN_RUNS or not values:
+            continue
+        value, count = values.most_common(1)[0]
+        rest = [c for c in equals if c != column] + trailing
+        if rest and count / len(run_shapes) >= PARTIAL_INDEX_SHARE:
+            candidates.append(Candidate(
+                "partial", table, tuple(rest), where=f"{_quote(column)} = {value}", pattern_ops=pattern_ops
+            ))
+
+    if shape.ranges:
+        candidates.append(Candidate("brin", table, tuple(shape.ranges)))
+
+    if shape.group_by and shape.aggregates:
+        dims = tuple(dict.fromkeys(shape.group_by + shape.filters))
+        candidates.append(Candidate("rollup", table, dims, measures=set(shape.aggregates)))
+    return candidates
+
+
+def workload(table=ANALYZED_TABLE, min_executions=1):
+    """(template, shape) for every logged template that reads `table`, with candidates derived from it."""
+    entries = []
+    for template in QueryTemplate.objects.filter(executions__gte=min_executions).order_by("-total_ms"):
+        shape = parse_query(template.sample_sql, table)
+        if shape is None:
+            continue
+        runs = template.runs.values_list("sql", flat=True)[:RUNS_PER_TEMPLATE]
+        run_shapes = [s for s in (parse_query(sql, table) for sql in runs) if s is not None]
+        entries.append((template, shape, _template_candidates(template, shape, run_shapes, table)))
+    return entries
+
+
+def build_candidates(entries):
+    """Candidates merged across templates: each knows every template it came from."""
+    merged = {}
+    for template, shape, candidates in entries:
+        for candidate in candidates:
+            existing = merged.setdefault(candidate.key, candidate)
+            if existing is not candidate:
+                existing.measures |= candidate.measures
+            existing.templates.append((template, shape))
+    return list(merged.values())
+
+
+class WorkloadEstimator:
+    """No database: the logged time of the templates a candidate serves (an upper bound)."""
+    method = "workload"
+
+    def estimate(self, candidate):
+        return sum(template.total_ms for template, _ in candidate.templates)
+
+
+class StatisticsEstimator:
+    """Planner statistics: pg_stats selectivity for indexes, EXPLAIN row estimates for rollups."""
+    method = "statistics"
+
+    def __init__(self, cur, table=ANALYZED_TABLE):
+        self.cur = cur
+        self.table = table
+        cur.execute("SELECT reltuples FROM pg_class WHERE relname = %s", (table,))
+        row = cur.fetchone()
+        self.rows = max(float(row[0]) if row else 0.0, 1.0)
+        cur.execute(
+            "SELECT attname, n_distinct, correlation FROM pg_stats WHERE tablename = %s",
+            (table,)
+        )
+        self.stats = {name: (n_distinct, correlation) for name, n_distinct, correlation in cur.fetchall()}
+
+    def _distinct(self, column):
+        n_distinct = (self.stats.get(column) or (None, None))[0]
+        if not n_distinct:
+            return None
+        # Negative: a fraction of the row count
+        return -n_distinct * self.rows if n_distinct < 0 else n_distinct
+
+    def _plan(self, sql):
+        """
+        The top plan node of `sql`, or None when it cannot be planned (a logged
+        query on a dropped column, several statements). Run in a savepoint, so
+        the failure does not abort the transaction the other EXPLAINs share.
+        """
+        self.cur.execute("SAVEPOINT advisor_plan")
+        try:
+            self.cur.execute("EXPLAIN (FORMAT JSON) " + sql.strip().rstrip(";"))
+            plan = self.cur.fetchone()[0][0]["Plan"]
+        except Exception as e:
+            self.cur.execute("ROLLBACK TO SAVEPOINT advisor_plan")
+            logger.warning(f"Cannot plan {sql[:200]!r}, skipped: {e}")
+            return None
+        self.cur.execute("RELEASE SAVEPOINT advisor_plan")
+        return plan
+
+    def _selectivity(self, candidate, shape):
+        selectivity = 1.0
+        for column in candidate.columns:
+            if column in shape.equals:
+                distinct = self._distinct(column)
+                if distinct:
+                    selectivity *= min(1.0, len(set(shape.equals[column])) / distinct)
+            elif column in shape.ranges:
+                selectivity *= RANGE_SELECTIVITY
+            elif column in shape.prefixes:
+                selectivity *= PREFIX_SELECTIVITY
+        return selectivity
+
+    def _index_saving(self, candidate):
+        if candidate.kind == "brin":
+            correlation = (self.stats.get(candidate.columns[0]) or (None, None))[1]
+            if correlation is None or abs(correlation) < BRIN_MIN_CORRELATION:
+                return 0.0
+        return sum(
+            template.total_ms * (1 - self._selectivity(candidate, shape))
+            for template, shape in candidate.templates
+        )
+
+    def _rollup_saving(self, candidate):
+        plan = self._plan(candidate.rollup_select())
+        if plan is None:
+            return None
+        rows = float(plan["Plan Rows"])
+        return sum(template.total_ms for template, _ in candidate.templates) * max(0.0, 1 - rows / self.rows)
+
+    def estimate(self, candidate):
+        """Estimated saving in ms, or None when no query involved could be planned."""
+        if candidate.kind == "rollup":
+            return self._rollup_saving(candidate)
+        return self._index_saving(candidate)
+
+
+class HypotheticalEstimator(StatisticsEstimator):
+    """hypopg: each template is planned with and without the hypothetical index."""
+    method = "hypothetical"
+
+    def __init__(self, cur, table=ANALYZED_TABLE):
+        super().__init__(cur, table)
+        self.baseline = {}
+
+    def _cost(self, template):
+        plan = self._plan(template.sample_sql)
+        return None if plan is None else float(plan["Total Cost"])
+
+    def _index_saving(self, candidate):
+        for template, _ in candidate.templates:
+            if template.pk not in self.baseline:
+                self.baseline[template.pk] = self._cost(template)
+        # Templates that cannot be planned are left out
+        templates = [t for t, _ in candidate.templates if self.baseline[t.pk]]
+        if not templates:
+            return None
+
+        saving = 0.0
+        self.cur.execute("SAVEPOINT advisor_index")
+        try:
+            self.cur.execute("SELECT * FROM hypopg_create_index(%s)", (candidate.index_ddl(concurrently=False),))
+        except Exception as e:
+            self.cur.execute("ROLLBACK TO SAVEPOINT advisor_index")
+            logger.warning(f"hypopg cannot create {candidate.index_ddl(concurrently=False)!r}: {e}")
+            return None
+        try:
+            for template in templates:
+                after = self._cost(template)
+                if after is not None:
+                    saving += template.total_ms * max(0.0, 1 - after / self.baseline[template.pk])
+        finally:
+            # Hypothetical indexes live in the session, not the transaction
+            self.cur.execute("SELECT hypopg_reset()")
+            self.cur.execute("RELEASE SAVEPOINT advisor_index")
+        return saving
+
+
+def _connect():
+    # Only the advisor and exports talk to the analytics database
+    import psycopg2
+
+    if not settings.ANALYTICS_DATABASE_URL:
+        raise ConnectionError("ANALYTICS_DATABASE_URL is not set")
+    conn = psycopg2.connect(settings.ANALYTICS_DATABASE_URL)
+    conn.set_session(readonly=True)
+    return conn
+
+
+def estimator_for(cur, table=ANALYZED_TABLE, hypothetical=True):
+    if hypothetical:
+        cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'hypopg'")
+        if cur.fetchone():
+            return HypotheticalEstimator(cur, table)
+    return StatisticsEstimator(cur, table)
+
+
+def recommend(table=ANALYZED_TABLE, min_executions=1, use_database=True, hypothetical=True, limit=None):
+    """
+    Ranked recommendations for `table` and the logged time they were derived
+    from: (candidates, total_ms). Falls back to the workload estimate when
+    the analytics database cannot be used, and for candidates whose queries
+    cannot be planned there.
+    """
+    entries = workload(table, min_executions)
+    candidates = build_candidates(entries)
+    total_ms = sum(template.total_ms for template, _, _ in entries)
+
+    conn = None
+    fallback = estimator = WorkloadEstimator()
+    if use_database and candidates:
+        try:
+            conn = _connect()
+            estimator = estimator_for(conn.cursor(), table, hypothetical)
+        except Exception as e:
+            logger.warning(f"Analytics database unavailable, ranking by logged time only: {e}")
+            if conn is not None:
+                conn.close()
+            conn = None
+    try:
+        for candidate in candidates:
+            saving, method = estimator.estimate(candidate), estimator.method
+            if saving is None:
+                saving, method = fallback.estimate(candidate), fallback.method
+            candidate.saving_ms, candidate.method = saving, method
+    finally:
+        if conn is not None:
+            conn.rollback()
+            conn.close()
+
+    ranked = sorted(
+        (c for c in candidates if c.saving_ms > 0),
+        key=lambda c: (-c.saving_ms, c.kind, c.columns)
+    )
+    return ranked[:limit] if limit else ranked, total_ms
+
+
+def report_rows(candidates, total_ms):
+    """JSON-friendly form of the recommendations."""
+    return [
+        {
+            "rank": rank,
+            "kind": candidate.kind,
+            "ddl": candidate.ddl,
+            "estimated_saving_ms": round(candidate.saving_ms, 1),
+            "workload_share": round(candidate.saving_ms / total_ms, 4) if total_ms else 0.0,
+            "method": candidate.method,
+            "templates": [template.template for template, _ in candidate.templates],
+        }
+        for rank, candidate in enumerate(candidates, start=1)
+    ]
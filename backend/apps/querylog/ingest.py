@@ -0,0 +1,133 @@
+import json
+import logging
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from redis.exceptions import ResponseError
+from apps.chat.redis_config import QUERY_LOG_STREAM_KEY, QUERY_LOG_GROUP
+from .models import QueryTemplate, QueryExecution
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_group(conn):
+    try:
+        conn.xgroup_create(QUERY_LOG_STREAM_KEY, QUERY_LOG_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def _timestamp(fields):
+    try:
+        return datetime.fromisoformat(fields['ts'])
+    except (KeyError, ValueError):
+        return timezone.now()
+
+
+def _template(fields):
+    template, _ = QueryTemplate.objects.get_or_create(
+        template_hash=fields['template_hash'],
+        defaults={'template': fields.get('template', ''), 'sample_sql': fields.get('sql', '')}
+    )
+    return template
+
+
+@transaction.atomic
+def save_execution(entry_id, fields):
+    """Store one execution and add it to its template's totals. False if this entry was stored before."""
+    template = _template(fields)
+    duration_ms = float(fields.get('duration_ms') or 0)
+    row_count = int(fields.get('row_count') or 0)
+    executed_at = _timestamp(fields)
+    try:
+        with transaction.atomic():
+            QueryExecution.objects.create(
+                entry_id=entry_id,
+                template=template,
+                question_hash=fields.get('question_hash', ''),
+                sql=fields.get('sql', ''),
+                duration_ms=duration_ms,
+                row_count=row_count,
+                role=fields.get('role', ''),
+                executed_at=executed_at,
+            )
+    except IntegrityError:
+        return False
+
+    QueryTemplate.objects.filter(pk=template.pk).update(
+        executions=F('executions') + 1,
+        total_ms=F('total_ms') + duration_ms,
+        max_ms=Greatest('max_ms', duration_ms),
+        total_rows=F('total_rows') + row_count,
+        last_seen=executed_at,
+        sample_sql=fields.get('sql', ''),
+    )
+    return True
+
+
+def save_plan(fields):
+    template = _template(fields)
+    try:
+        plan = json.loads(fields.get('plan') or 'null')
+    except ValueError:
+        plan = None
+    QueryTemplate.objects.filter(pk=template.pk).update(
+        plan=plan,
+        plan_sql=fields.get('sql', ''),
+        plan_captured_at=_timestamp(fields),
+    )
+
+
+def handle_entry(entry_id, fields):
+    kind = fields.get('kind')
+    if not fields.get('template_hash'):
+        return
+    if kind == 'execution':
+        save_execution(entry_id, fields)
+    elif kind == 'plan':
+        save_plan(fields)
+
+
+def ingest(conn, consumer, pending=False, count=500, block_ms=1000):
+    """
+    Store one batch of query log entries as `consumer` of QUERY_LOG_GROUP and
+    acknowledge them; pending=True re-reads all entries this consumer read but
+    never acknowledged, `count` at a time. Returns how many were stored; a
+    failing entry stays pending for the next pending pass.
+    """
+    start = "0" if pending else ">"
+    handled = 0
+    while True:
+        response = conn.xreadgroup(
+            QUERY_LOG_GROUP,
+            consumer,
+            {QUERY_LOG_STREAM_KEY: start},
+            count=count,
+            block=None if pending else block_ms
+        )
+        last_id = None
+        for _, entries in response or []:
+            for entry_id, fields in entries:
+                last_id = entry_id
+                try:
+                    handle_entry(entry_id, fields)
+                except Exception:
+                    logger.exception(f"Query log entry {entry_id} failed")
+                    continue
+                conn.xack(QUERY_LOG_STREAM_KEY, QUERY_LOG_GROUP, entry_id)
+                handled += 1
+        if not pending or last_id is None:
+            return handled
+        # Pending entries after the last one seen, so failing ones are not read again in this pass
+        start = last_id
+
+
+def prune_executions(days=None):
+    """Delete executions older than QUERY_LOG_RETENTION_DAYS; returns how many."""
+    days = settings.QUERY_LOG_RETENTION_DAYS if days is None else days
+    deleted, _ = QueryExecution.objects.filter(executed_at__lt=timezone.now() - timedelta(days=days)).delete()
+    return deleted
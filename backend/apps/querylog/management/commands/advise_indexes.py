@@ -0,0 +1,45 @@
+import json
+from django.core.management.base import BaseCommand
+from apps.querylog.advisor import ANALYZED_TABLE, recommend, report_rows
+
+
+class Command(BaseCommand):
+    help = "Rank index and rollup candidates for the analytics table by the logged query time they would save."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", default=ANALYZED_TABLE, help="Analytics table to advise on")
+        parser.add_argument("--limit", type=int, default=10, help="Number of recommendations to print")
+        parser.add_argument("--min-executions", type=int, default=1, help="Ignore templates run fewer times")
+        parser.add_argument("--no-database", action="store_true",
+                            help="Rank by logged time only, without connecting to the analytics database")
+        parser.add_argument("--no-hypothetical", action="store_true",
+                            help="Use planner statistics even when hypopg is installed")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        candidates, total_ms = recommend(
+            table=options["table"],
+            min_executions=options["min_executions"],
+            use_database=not options["no_database"],
+            hypothetical=not options["no_hypothetical"],
+            limit=options["limit"],
+        )
+        rows = report_rows(candidates, total_ms)
+        if options["json"]:
+            self.stdout.write(json.dumps(rows, ensure_ascii=False, indent=2))
+            return
+        if not rows:
+            self.stdout.write("No recommendations: no logged queries on this table would benefit")
+            return
+
+        for row in rows:
+            self.stdout.write(
+                f"{row['rank']}. {row['kind']}: saves ~{row['estimated_saving_ms']:.0f} ms "
+                f"({row['workload_share']:.1%} of logged time, {row['method']} estimate)"
+            )
+            self.stdout.write(f"   {row['ddl']}")
+            for template in row["templates"][:3]:
+                self.stdout.write(f"   -- {template}")
+        if any(row["kind"] == "rollup" for row in rows):
+            self.stdout.write("Materialized views must be refreshed (REFRESH MATERIALIZED VIEW) after each data load.")
+        self.stdout.write(self.style.SUCCESS(f"Done: {len(rows)} recommendations from {total_ms:.0f} ms of logged queries"))
@@ -0,0 +1,48 @@
+import socket
+import time
+from django.core.management.base import BaseCommand
+from apps.chat.redis_config import get_sync_redis_connection
+from apps.querylog.ingest import ensure_group, ingest, prune_executions
+
+PRUNE_INTERVAL_SECONDS = 3600
+# Entries that failed (e.g. the database was down) are retried this often
+PENDING_RETRY_SECONDS = 60
+
+
+class Command(BaseCommand):
+    help = "Store the AI worker's query executions and EXPLAIN ANALYZE samples for the slow-query report."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--consumer", default=socket.gethostname(), help="Consumer name in the query log group")
+        parser.add_argument("--once", action="store_true", help="Store the entries waiting now and exit")
+
+    def prune(self):
+        pruned = prune_executions()
+        if pruned:
+            self.stdout.write(f"{pruned} old executions deleted")
+        return time.monotonic()
+
+    def ingest_pending(self, conn, consumer):
+        stored = ingest(conn, consumer, pending=True)
+        if stored:
+            self.stdout.write(f"{stored} unacknowledged entries stored")
+        return stored, time.monotonic()
+
+    def handle(self, *args, **options):
+        last_prune = self.prune()
+        conn = get_sync_redis_connection()
+        ensure_group(conn)
+        consumer = options["consumer"]
+
+        stored, last_pending = self.ingest_pending(conn, consumer)
+        while True:
+            if time.monotonic() - last_prune >= PRUNE_INTERVAL_SECONDS:
+                last_prune = self.prune()
+            if time.monotonic() - last_pending >= PENDING_RETRY_SECONDS:
+                retried, last_pending = self.ingest_pending(conn, consumer)
+                stored += retried
+            handled = ingest(conn, consumer)
+            stored += handled
+            if not handled and options["once"]:
+                break
+        self.stdout.write(self.style.SUCCESS(f"Done: {stored} query log entries stored"))
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('template_hash', models.CharField(max_length=40, unique=True)),
+                ('template', models.TextField()),
+                ('sample_sql', models.TextField()),
+                ('executions', models.PositiveIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('total_rows', models.BigIntegerField(default=0)),
+                ('first_seen', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField(blank=True, null=True)),
+                ('plan', models.JSONField(blank=True, null=True)),
+                ('plan_sql', models.TextField(blank=True, default='')),
+                ('plan_captured_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-max_ms'], name='querylog_qu_max_ms_2ceaa0_idx'), models.Index(fields=['-last_seen'], name='querylog_qu_last_se_363f6a_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='QueryExecution',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_id', models.CharField(max_length=40, unique=True)),
+                ('question_hash', models.CharField(db_index=True, max_length=40)),
+                ('sql', models.TextField()),
+                ('duration_ms', models.FloatField()),
+                ('row_count', models.PositiveIntegerField()),
+                ('role', models.CharField(max_length=20)),
+                ('executed_at', models.DateTimeField()),
+                ('template', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='querylog.querytemplate')),
+            ],
+            options={
+                'ordering': ['-executed_at'],
+                'indexes': [models.Index(fields=['template', '-executed_at'], name='querylog_qu_templat_2f0d95_idx'), models.Index(fields=['executed_at'], name='querylog_qu_execute_b3dd48_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.db import models
+
+
+class QueryTemplate(models.Model):
+    """
+    Generated SQL with its literal values replaced by ?, with the timings of
+    every execution of that shape and the latest EXPLAIN (ANALYZE, BUFFERS)
+    sample the AI worker took of a slow one.
+    """
+    template_hash = models.CharField(max_length=40, unique=True)
+    template = models.TextField()
+    sample_sql = models.TextField()  # latest execution, with its values
+
+    executions = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    total_rows = models.BigIntegerField(default=0)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(null=True, blank=True)
+
+    plan = models.JSONField(null=True, blank=True)
+    plan_sql = models.TextField(blank=True, default="")
+    plan_captured_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-max_ms']),
+            models.Index(fields=['-last_seen']),
+        ]
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.executions if self.executions else 0.0
+
+    def __str__(self):
+        return f"{self.template[:100]} ({self.executions} runs)"
+
+
+class QueryExecution(models.Model):
+    # Stream entry the execution was read from; makes ingestion safe to repeat
+    entry_id = models.CharField(max_length=40, unique=True)
+    template = models.ForeignKey(QueryTemplate, on_delete=models.CASCADE, related_name='runs')
+    question_hash = models.CharField(max_length=40, db_index=True)
+    sql = models.TextField()
+    duration_ms = models.FloatField()
+    row_count = models.PositiveIntegerField()
+    role = models.CharField(max_length=20)
+    executed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-executed_at']
+        indexes = [
+            models.Index(fields=['template', '-executed_at']),
+            models.Index(fields=['executed_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.duration_ms:.0f} ms, {self.row_count} rows ({self.role})"
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import pytest
+from io import StringIO
+from django.core.management import call_command
+from django.utils import timezone
+from apps.querylog.advisor import parse_query, recommend
+from apps.querylog.models import QueryTemplate, QueryExecution
+
+BY_COUNTRY = (
+    "select country, sum(dollar) from final_true where type = {type} and year between 1400 and {year} "
+    "group by country order by 2 desc"
+)
+BY_HS_CODE = "select hs_code, count(distinct country) from final_true where hs_code like '84%' group by hs_code"
+
+
+def log_template(runs, total_ms):
+    """A template as ingest() leaves it, with one QueryExecution per SQL in `runs`."""
+    template = QueryTemplate.objects.create(
+        template_hash=hashlib.sha1(runs[0].encode()).hexdigest(), template=runs[0], sample_sql=runs[-1],
+        executions=len(runs), total_ms=total_ms, max_ms=total_ms,
+    )
+    for i, sql in enumerate(runs):
+        QueryExecution.objects.create(
+            entry_id=f"{template.pk}-{i}", template=template, question_hash="q", sql=sql,
+            duration_ms=total_ms / len(runs), row_count=10, role="public", executed_at=timezone.now(),
+        )
+    return template
+
+
+class FakeCursor:
+    """The analytics database as the advisor sees it; costs drop when a hypothetical index covers `year`."""
+
+    def __init__(self, hypopg=True):
+        self.hypopg = hypopg
+        self.hypothetical = []
+        self.executed = []
+        self.result = []
+        self.aborted = False
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        # Like PostgreSQL: after an error only a rollback is accepted
+        if self.aborted and not sql.startswith("ROLLBACK TO SAVEPOINT"):
+            raise RuntimeError("current transaction is aborted")
+        self.aborted = False
+        if "dropped_column" in sql:
+            self.aborted = True
+            raise RuntimeError('column "dropped_column" does not exist')
+        if "pg_extension" in sql:
+            self.result = [(1,)] if self.hypopg else []
+        elif "pg_class" in sql:
+            self.result = [(1_000_000,)]
+        elif "pg_stats" in sql:
+            self.result = [("type", 2, 0.1), ("year", 10, 0.95), ("country", 200, 0.01), ("hs_code", -0.01, 0.0)]
+        elif "hypopg_create_index" in sql:
+            self.hypothetical.append(params[0])
+        elif "hypopg_reset" in sql:
+            self.hypothetical = []
+        elif sql.startswith("EXPLAIN"):
+            indexed = any('"year"' in ddl for ddl in self.hypothetical)
+            # Rollup selects are the only uppercase ones
+            rows = 2000 if sql.startswith('EXPLAIN (FORMAT JSON) SELECT "') else 50
+            self.result = [([{"Plan": {"Total Cost": 250.0 if indexed else 1000.0, "Plan Rows": rows}}],)]
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    def __init__(self, cur):
+        self.cur = cur
+        self.closed = False
+
+    def cursor(self):
+        return self.cur
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def workload(db):
+    exports = [BY_COUNTRY.format(type="'صادرات'", year=1400 + i) for i in range(4)]
+    log_template(exports + [BY_COUNTRY.format(type="'واردات'", year=1402)], total_ms=8000.0)
+    log_template([BY_HS_CODE] * 3, total_ms=3000.0)
+
+
+def test_parse_query():
+    shape = parse_query(BY_COUNTRY.format(type="'صادرات'", year=1402))
+    assert shape.equals == {"type": ["'صادرات'"]}
+    assert shape.ranges == ["year"]
+    assert shape.group_by == ["country"]
+    assert shape.aggregates == [("sum", "dollar")]
+
+    shape = parse_query(BY_HS_CODE)
+    assert shape.prefixes == ["hs_code"]
+    # COUNT(DISTINCT) cannot be re-aggregated from a rollup
+    assert shape.aggregates is None
+
+    shape = parse_query("""select "year", avg(dollar) from final_true where country in ('عراق', 'چین') and lower(hs_code) = 'x' group by "year\"""")
+    assert shape.equals == {"country": ["'عراق'", "'چین'"]}
+    assert shape.group_by == ["year"]
+    assert parse_query("select * from customs where year = 1400") is None
+
+
+def test_workload_ranking_without_database(workload):
+    candidates, total_ms = recommend(use_database=False)
+    assert total_ms == 11000.0
+    ddl = [c.ddl for c in candidates]
+    assert all(c.method == "workload" for c in candidates)
+    # Ranked by the logged time of the templates served
+    assert [(c.kind, c.saving_ms) for c in candidates] == [
+        ("brin", 8000.0), ("btree", 8000.0), ("partial", 8000.0), ("rollup", 8000.0), ("btree", 3000.0),
+    ]
+    assert ddl[0] == 'CREATE INDEX CONCURRENTLY IF NOT EXISTS final_true_year_brin_idx ON final_true USING brin ("year");'
+    assert 'CREATE INDEX CONCURRENTLY IF NOT EXISTS final_true_type_year_idx ON final_true USING btree ("type", "year");' in ddl
+    # 'صادرات' is in 4 of 5 runs: the rest of the predicate is indexed for that value only
+    assert 'CREATE INDEX CONCURRENTLY IF NOT EXISTS final_true_year_partial_idx ON final_true USING btree ("year") WHERE "type" = \'صادرات\';' in ddl
+    assert 'CREATE INDEX CONCURRENTLY IF NOT EXISTS final_true_hs_code_idx ON final_true USING btree ("hs_code" text_pattern_ops);' in ddl
+    rollups = [c for c in candidates if c.kind == "rollup"]
+    assert [r.ddl for r in rollups] == [
+        'CREATE MATERIALIZED VIEW IF NOT EXISTS final_true_by_country_type_year AS SELECT "country", "type", "year", '
+        'COUNT(*) AS row_count, SUM("dollar") AS sum_dollar FROM final_true GROUP BY "country", "type", "year";'
+    ]
+
+
+def test_hypothetical_and_statistics_estimates(workload, monkeypatch):
+    cur = FakeCursor()
+    conn = FakeConnection(cur)
+    monkeypatch.setattr("apps.querylog.advisor._connect", lambda: conn)
+    candidates, _ = recommend()
+    by_kind = {(c.kind, c.columns): c for c in candidates}
+
+    # Planned with hypopg: the year indexes cut the template's cost by 75%
+    btree = by_kind[("btree", ("type", "year"))]
+    assert btree.method == "hypothetical"
+    assert btree.saving_ms == pytest.approx(6000.0)
+    assert cur.hypothetical == []
+    assert ("SELECT * FROM hypopg_create_index(%s)", ('CREATE INDEX ON final_true USING btree ("type", "year")',)) in cur.executed
+    # The hs_code index does not change the (fake) plan
+    assert ("btree", ("hs_code",)) not in by_kind
+    # Rollups: 2000 estimated groups instead of 1M rows
+    assert by_kind[("rollup", ("country", "type", "year"))].saving_ms == pytest.approx(8000.0 * (1 - 2000 / 1_000_000))
+    assert conn.closed
+
+    cur = FakeCursor(hypopg=False)
+    monkeypatch.setattr("apps.querylog.advisor._connect", lambda: FakeConnection(cur))
+    candidates, _ = recommend()
+    by_kind = {(c.kind, c.columns): c for c in candidates}
+    # type = 1 of 2 values, year range 30%
+    assert by_kind[("btree", ("type", "year"))].saving_ms == pytest.approx(8000.0 * (1 - 0.5 * 0.3))
+    assert by_kind[("btree", ("hs_code",))].saving_ms == pytest.approx(3000.0 * (1 - 0.05))
+    # year follows the row order, so BRIN is worth it
+    assert by_kind[("brin", ("year",))].method == "statistics"
+
+
+def test_database_unavailable_falls_back_to_workload(workload, monkeypatch, settings):
+    settings.ANALYTICS_DATABASE_URL = ""
+    candidates, _ = recommend()
+    assert candidates and all(c.method == "workload" for c in candidates)
+
+
+def test_command_json_report(workload):
+    out = StringIO()
+    call_command("advise_indexes", "--no-database", "--json", "--limit", "2", stdout=out)
+    rows = json.loads(out.getvalue())
+    assert [row["rank"] for row in rows] == [1, 2]
+    assert rows[0]["estimated_saving_ms"] == 8000.0
+    assert rows[0]["workload_share"] == pytest.approx(8000.0 / 11000.0, abs=1e-4)
+
+
+def test_unplannable_template_is_skipped(workload, monkeypatch):
+    broken = log_template(["select dropped_column from final_true where year >= 1400"] * 2, total_ms=500.0)
+    cur = FakeCursor()
+    monkeypatch.setattr("apps.querylog.advisor._connect", lambda: FakeConnection(cur))
+    candidates, _ = recommend()
+    by_kind = {(c.kind, c.columns): c for c in candidates}
+
+    # The BRIN candidate on year serves both; only the template that plans counts
+    brin = by_kind[("brin", ("year",))]
+    assert brin.method == "hypothetical"
+    assert brin.saving_ms == pytest.approx(6000.0)
+    assert broken in [template for template, _ in brin.templates]
+    # Its own btree has nothing else to plan: estimated from the logged time instead
+    btree = by_kind[("btree", ("year",))]
+    assert (btree.method, btree.saving_ms) == ("workload", 500.0)
+    assert cur.hypothetical == []
@@ -0,0 +1,87 @@
+import json
+import pytest
+from datetime import timedelta
+from django.utils import timezone
+from apps.chat.redis_config import QUERY_LOG_STREAM_KEY, QUERY_LOG_GROUP
+from apps.querylog.ingest import ensure_group, ingest, prune_executions
+from apps.querylog.models import QueryTemplate, QueryExecution
+
+TEMPLATE_HASH = "d7ca75f6cc5397222c88351ccf4faa2737ca7287"
+
+
+@pytest.fixture
+def log(fake_redis, db):
+    """The query log stream with the ingest group."""
+    ensure_group(fake_redis)
+    return fake_redis
+
+
+def publish(conn, *entries):
+    """What the AI worker does (ai/redis_utils.log_query)."""
+    for fields in entries:
+        conn.xadd(QUERY_LOG_STREAM_KEY, fields)
+
+
+def execution(year, duration_ms, rows=5, role="public"):
+    """What the AI worker logs (ai/talk_to_db/querylog.py)."""
+    return {
+        "kind": "execution", "template_hash": TEMPLATE_HASH,
+        "template": "select country from final_true where year = ?",
+        "sql": f"select country from final_true where year = {year}",
+        "question_hash": "40a6852e9c07fd50b15e8dfb70c052c974abc623",
+        "duration_ms": str(duration_ms), "row_count": str(rows), "role": role,
+        "ts": "2026-10-19T12:00:00+00:00",
+    }
+
+
+def test_executions_and_plan_are_aggregated_per_template(log):
+    plan = [{"Plan": {"Node Type": "Seq Scan", "Actual Total Time": 2480.5}}]
+    publish(
+        log,
+        execution(1401, 120.0),
+        execution(1402, 2500.0, rows=7, role="admin"),
+        {"kind": "plan", "template_hash": TEMPLATE_HASH, "template": "select country from final_true where year = ?",
+         "sql": "select country from final_true where year = 1402", "plan": json.dumps(plan),
+         "ts": "2026-10-19T12:00:05+00:00"},
+    )
+    assert ingest(log, "ingest-1") == 3
+    assert log.pending(QUERY_LOG_STREAM_KEY, QUERY_LOG_GROUP) == []
+
+    template = QueryTemplate.objects.get(template_hash=TEMPLATE_HASH)
+    assert template.executions == 2
+    assert template.max_ms == 2500.0
+    assert template.avg_ms == 1310.0
+    assert template.total_rows == 12
+    assert template.sample_sql.endswith("1402")
+    assert template.plan == plan
+    assert template.plan_sql.endswith("1402")
+    assert list(template.runs.values_list("role", flat=True)) == ["public", "admin"]
+
+
+def test_redelivered_execution_is_counted_once(log, monkeypatch):
+    publish(log, execution(1401, 100.0))
+    with monkeypatch.context() as m:
+        # Stored, but the acknowledgement is lost
+        m.setattr(log, "xack", lambda *args: 0)
+        assert ingest(log, "ingest-1") == 1
+    assert ingest(log, "ingest-1", pending=True) == 1
+    assert QueryTemplate.objects.get().executions == 1
+    assert QueryExecution.objects.count() == 1
+
+
+def test_every_pending_entry_is_stored(log):
+    publish(log, *[execution(1400 + n, 10.0) for n in range(12)])
+    # Read, but ingestion stopped before acknowledging any of them
+    log.xreadgroup(QUERY_LOG_GROUP, "ingest-1", {QUERY_LOG_STREAM_KEY: ">"}, count=100)
+    assert ingest(log, "ingest-1", pending=True, count=5) == 12
+    assert QueryTemplate.objects.get().executions == 12
+
+
+def test_old_executions_are_pruned(log):
+    publish(log, execution(1401, 100.0), execution(1402, 100.0))
+    ingest(log, "ingest-1")
+    first = QueryExecution.objects.earliest("id")
+    QueryExecution.objects.filter(pk=first.pk).update(executed_at=timezone.now() - timedelta(days=31))
+    assert prune_executions(days=30) == 1
+    # Totals stay with the template
+    assert QueryTemplate.objects.get().executions == 2
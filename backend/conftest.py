@@ -0,0 +1,224 @@
+import sys
+from importlib import import_module
+import pytest
+from django.conf import settings
+from redis.exceptions import RedisError, ResponseError
+
+
+def _stream_id(entry_id):
+    return tuple(int(part) for part in entry_id.split("-"))
+
+
+def _in_range(entry_id, low, high):
+    """XRANGE bounds: '-' / '+', an id, or '(' before an id to exclude it."""
+    key = _stream_id(entry_id)
+    if low != '-':
+        bound = _stream_id(low.lstrip('('))
+        if key < bound or (low.startswith('(') and key == bound):
+            return False
+    if high != '+':
+        bound = _stream_id(high.lstrip('('))
+        if key > bound or (high.startswith('(') and key == bound):
+            return False
+    return True
+
+
+class FakePipeline:
+    """Queues commands and runs them on execute(), like a MULTI/EXEC pipeline."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.conn, name)
+        return lambda *args, **kwargs: self.calls.append(lambda: method(*args, **kwargs))
+
+    def execute(self):
+        return [call() for call in self.calls]
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for the sync Redis client: strings, lists, sorted sets,
+    streams with consumer groups, pipelines and the MEMORY/TTL commands of the
+    admin report.
+    Stream ids are '<n>-0'. `sizes` sets MEMORY USAGE per key.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.sizes = {}
+        self.used_memory = 0
+        self.streams = {}
+        self.groups = {}  # (stream, group) -> {'last': index delivered up to, 'pending': {id: consumer}}
+        self.next_id = 1
+        self.lrange_calls = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    # Strings and lists
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        if ex is not None:
+            self.ttls[key] = ex
+        return True
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+    def decr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) - 1
+        return self.data[key]
+
+    def expire(self, key, seconds):
+        self.ttls[key] = seconds
+        return key in self.data
+
+    def exists(self, *keys):
+        return sum(key in self.data or key in self.streams for key in keys)
+
+    def delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            deleted += int(self.data.pop(key, None) is not None or self.streams.pop(key, None) is not None)
+            self.ttls.pop(key, None)
+        return deleted
+
+    def lrange(self, key, start, end):
+        self.lrange_calls.append((start, end))
+        return self.data.get(key, [])[start:end + 1]
+
+    # Sorted sets
+    def zadd(self, key, mapping):
+        zset = self.data.setdefault(key, {})
+        added = sum(member not in zset for member in mapping)
+        zset.update(mapping)
+        return added
+
+    def zrem(self, key, *members):
+        zset = self.data.get(key, {})
+        return sum(zset.pop(member, None) is not None for member in members)
+
+    def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    def zremrangebyscore(self, key, min, max):
+        zset = self.data.get(key, {})
+        removed = [m for m, score in zset.items() if float(min) <= score <= float(max)]
+        for member in removed:
+            del zset[member]
+        return len(removed)
+
+    # Memory report
+    def scan_iter(self, match=None, count=None):
+        return iter(dict.fromkeys([*self.data, *self.streams, *self.sizes]))
+
+    def memory_usage(self, key):
+        return self.sizes.get(key)
+
+    def ttl(self, key):
+        return self.ttls.get(key, -1)
+
+    def info(self, section=None):
+        return {"used_memory": self.used_memory, "maxmemory": 0}
+
+    # Streams
+    def xadd(self, key, fields, id='*', maxlen=None, approximate=True):
+        entry_id = f"{self.next_id}-0"
+        self.next_id += 1
+        self.streams.setdefault(key, []).append((entry_id, dict(fields)))
+        return entry_id
+
+    def xrange(self, key, min='-', max='+', count=None):
+        entries = [e for e in self.streams.get(key, []) if _in_range(e[0], min, max)]
+        return entries[:count] if count else entries
+
+    def xrevrange(self, key, max='+', min='-', count=None):
+        entries = [e for e in reversed(self.streams.get(key, [])) if _in_range(e[0], min, max)]
+        return entries[:count] if count else entries
+
+    def xlen(self, key):
+        return len(self.streams.get(key, []))
+
+    def xdel(self, key, *ids):
+        before = len(self.streams.get(key, []))
+        self.streams[key] = [e for e in self.streams.get(key, []) if e[0] not in ids]
+        return before - len(self.streams[key])
+
+    def xgroup_create(self, key, group, id='$', mkstream=False):
+        if (key, group) in self.groups:
+            raise ResponseError("BUSYGROUP Consumer Group name already exists")
+        stream = self.streams.setdefault(key, [])
+        self.groups[(key, group)] = {'last': len(stream) if id == '$' else 0, 'pending': {}}
+        return True
+
+    def xreadgroup(self, group, consumer, streams, count=None, block=None, noack=False):
+        (key, start), = streams.items()
+        state = self.groups[(key, group)]
+        stream = self.streams.get(key, [])
+        if start == '>':
+            batch = stream[state['last']:][:count]
+            state['last'] += len(batch)
+            for entry_id, _ in batch:
+                state['pending'][entry_id] = consumer
+        else:
+            # This consumer's delivered, unacknowledged entries after `start`
+            batch = [
+                e for e in stream
+                if state['pending'].get(e[0]) == consumer and _stream_id(e[0]) > _stream_id(start)
+            ][:count]
+        return [(key, batch)] if batch else []
+
+    def xack(self, key, group, *ids):
+        pending = self.groups[(key, group)]['pending']
+        return sum(pending.pop(entry_id, None) is not None for entry_id in ids)
+
+    def pending(self, key, group):
+        """Ids delivered to the group and not acknowledged (test helper, not a Redis command)."""
+        return list(self.groups[(key, group)]['pending'])
+
+
+class DownRedis:
+    """Every command fails as if Redis were unreachable."""
+
+    def __getattr__(self, name):
+        def unavailable(*args, **kwargs):
+            raise RedisError("connection refused")
+        return unavailable
+
+
+# The rate limiter caches its Lua script in the module; its tests give it a client of their own
+_OWN_CLIENT_MODULES = {"apps.accounts.throttling"}
+
+
+def _connect_everywhere(monkeypatch, conn):
+    # Modules bind get_sync_redis_connection at import; the URLconf imports the views first
+    import_module(settings.ROOT_URLCONF)
+    for name, module in list(sys.modules.items()):
+        if name in _OWN_CLIENT_MODULES or not name.startswith("apps."):
+            continue
+        if callable(getattr(module, "get_sync_redis_connection", None)):
+            monkeypatch.setattr(module, "get_sync_redis_connection", lambda: conn)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """A FakeRedis returned by get_sync_redis_connection() in every app module."""
+    conn = FakeRedis()
+    _connect_everywhere(monkeypatch, conn)
+    return conn
+
+
+@pytest.fixture
+def redis_down(monkeypatch):
+    """get_sync_redis_connection() returns a client whose every command fails."""
+    _connect_everywhere(monkeypatch, DownRedis())
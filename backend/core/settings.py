@@ -58,7 +58,8 @@ INSTALLED_APPS = [
     'apps.emails.apps.EmailsConfig',
     'apps.chat.apps.ChatConfig',
     'apps.adminpanel.apps.AdminpanelConfig',
-    'apps.errorlog.apps.ErrorlogConfig'
+    'apps.errorlog.apps.ErrorlogConfig',
+    'apps.querylog.apps.QuerylogConfig'
 ]
 
 # Remove admin since we're API-only
@@ -174,8 +175,8 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.IsAuthenticated",
     ),
     "DEFAULT_THROTTLE_CLASSES": [
-        "rest_framework.throttling.UserRateThrottle",
-        "rest_framework.throttling.AnonRateThrottle",
+        "apps.accounts.throttling.RedisUserRateThrottle",
+        "apps.accounts.throttling.RedisAnonRateThrottle",
     ],
     "DEFAULT_THROTTLE_RATES": {
         "user": "120/min",
@@ -254,6 +255,36 @@ REDIS_HOST = os.getenv("REDIS_HOST")
 REDIS_PORT = os.getenv("REDIS_PORT")
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD")
 
+# Chat Cold Storage
+# Messages of chats archived longer than this are moved into compressed blobs
+# by `archive_cold_chats` and restored when the chat is opened again
+CHAT_COLD_STORAGE_AFTER_DAYS = int(os.getenv("CHAT_COLD_STORAGE_AFTER_DAYS", "30"))
+
+# Analytics database the AI answers are computed from (the AI worker's
+# DATABASE_URL). Message exports re-run an answer's SQL there.
+ANALYTICS_DATABASE_URL = os.getenv("ANALYTICS_DATABASE_URL")
+
+# Message exports: row cap by role (None = no cap), exports running at once
+# per user, rows per server-side cursor fetch and the per-export query timeout
+EXPORT_ROW_LIMITS = {"public": 100_000, "admin": None}
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", "2"))
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "5000"))
+EXPORT_STATEMENT_TIMEOUT_MS = int(os.getenv("EXPORT_STATEMENT_TIMEOUT_MS", str(10 * 60 * 1000)))
+
+# Executions of AI-generated SQL read by `ingest_query_log` are kept this long;
+# the per-template totals and plans stay
+QUERY_LOG_RETENTION_DAYS = int(os.getenv("QUERY_LOG_RETENTION_DAYS", "30"))
+
+# WebSocket chat message limits; every message costs LLM calls.
+# "user" is each user's own bucket by role, "role" a budget shared by all
+# users of that role. None disables a limit.
+CHAT_MESSAGE_RATES = {
+    "user": {"public": "10/minute", "admin": "60/minute"},
+    "role": {"public": "300/minute", "admin": None},
+}
+# "show more" result_page frames per user; cheap (no LLM) but each one reads Redis
+RESULT_PAGE_RATE = os.getenv("RESULT_PAGE_RATE", "60/minute") or None
+
 # Channels Configuration
 ASGI_APPLICATION = 'core.asgi.application'
 